@@ -0,0 +1,73 @@
+# agent/answer_index.py
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de página por defecto de /licencias/buscar/
+POR_PAGINA_BUSQUEDA = 10
+
+
+class AnswerIndex:
+    """
+    Respuestas directas ya formateadas (texto y valores para las plantillas)
+    para las consultas más frecuentes (estadísticas, top N y cada
+    departamento/municipio), construidas una vez por versión de los datos y
+    consultadas con una búsqueda en diccionario.
+    """
+
+    def __init__(self, version: str = None):
+        self.version = version
+        self._respuestas: Dict[Tuple, Dict] = {}
+
+    @staticmethod
+    def clave(accion: str, parametros: Dict) -> Optional[Tuple]:
+        """Clave del índice para una acción, o None si la consulta no está precalculada"""
+        if accion == "estadisticas" and not parametros:
+            return ("estadisticas",)
+        if accion == "listar" and set(parametros) <= {"limit"}:
+            return ("listar", int(parametros.get("limit", 5)))
+        if accion == "buscar" and parametros and set(parametros) <= {"departamento", "municipio"}:
+            return ("buscar", parametros.get("departamento"), parametros.get("municipio"))
+        return None
+
+    def obtener(self, accion: str, parametros: Dict) -> Optional[Dict]:
+        clave = self.clave(accion, parametros)
+        return self._respuestas.get(clave) if clave else None
+
+    def __len__(self) -> int:
+        return len(self._respuestas)
+
+    @classmethod
+    def construir(cls, licencias: List[Dict], estadisticas: Optional[Dict],
+                  formatear: Callable[[str, Dict], Dict], version: str = None,
+                  max_listado: int = 10) -> "AnswerIndex":
+        """
+        licencias: todas las filas en el orden de /licencias (total descendente)
+        formatear: formatear(accion, datos) del agente ('estadisticas', 'buscar', 'listar')
+        """
+        indice = cls(version)
+
+        if estadisticas:
+            indice._respuestas[("estadisticas",)] = formatear("estadisticas", estadisticas)
+
+        for n in range(1, max_listado + 1):
+            indice._respuestas[("listar", n)] = formatear(
+                "listar", {"resultados": licencias[:n], "total": len(licencias)}
+            )
+
+        # Agrupar conservando el orden por total de la API
+        grupos: Dict[Tuple, List[Dict]] = {}
+        for licencia in licencias:
+            departamento, municipio = licencia["departamento"], licencia["municipio"]
+            grupos.setdefault(("buscar", departamento, None), []).append(licencia)
+            grupos.setdefault(("buscar", departamento, municipio), []).append(licencia)
+            grupos.setdefault(("buscar", None, municipio), []).append(licencia)
+
+        for clave, filas in grupos.items():
+            indice._respuestas[clave] = formatear(
+                "buscar", {"resultados": filas[:POR_PAGINA_BUSQUEDA], "total": len(filas)}
+            )
+
+        logger.info(f"Índice de respuestas: {len(indice)} respuestas precalculadas")
+        return indice
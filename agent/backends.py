@@ -0,0 +1,192 @@
+# agent/backends.py
+"""
+Backends de datos del agente. Todos exponen get(endpoint, params) con las
+mismas rutas y respuestas que la API REST:
+
+- HttpBackend: llama a la API por HTTP (pool keep-alive)
+- InProcessBackend: llama a la capa de consultas de la API (api/consultas.py)
+  en el mismo proceso, sin HTTP ni JSON; con snapshot=True lee una copia
+  en memoria de solo lectura de la base de datos
+"""
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from http_client import espera_reintento
+
+logger = logging.getLogger(__name__)
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class HttpBackend:
+    """Acceso a los datos a través de la API REST"""
+
+    def __init__(self, base_url: str, session: requests.Session, timeout: float = 10,
+                 api_key: str = None, max_espera_reintento: float = 2):
+        self.base_url = base_url
+        self.session = session
+        self.timeout = timeout
+        self.headers = {"X-API-Key": api_key} if api_key else {}
+        # Un único reintento tras un 429/503 si Retry-After no supera esta espera
+        self.max_espera_reintento = max_espera_reintento
+
+    def get(self, endpoint: str, params: Dict = None, timeout: float = None) -> Dict:
+        url = f"{self.base_url}{endpoint}"
+        response = self.session.get(url, params=params, headers=self.headers, timeout=timeout or self.timeout)
+        espera = espera_reintento(response, self.max_espera_reintento)
+        if espera is not None:
+            logger.warning(f"⚠️ API saturada ({response.status_code}) en {endpoint}: reintento en {espera:.0f}s")
+            time.sleep(espera)
+            response = self.session.get(url, params=params, headers=self.headers, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def _lista(valor: str) -> List[str]:
+    """Parámetro de la API separado por comas ('municipio,total') como lista"""
+    return [elemento.strip() for elemento in valor.split(",") if elemento.strip()]
+
+
+def _campos(params: Dict) -> Optional[List[str]]:
+    """Parámetro `fields` de la API como lista de campos"""
+    fields = params.pop("fields", None)
+    if isinstance(fields, str):
+        fields = _lista(fields)
+    return fields or None
+
+
+class InProcessBackend:
+    """Acceso directo a la capa de consultas de la API, en el mismo proceso"""
+
+    def __init__(self, db_path: str, snapshot: bool = False):
+        if RAIZ_PROYECTO not in sys.path:
+            sys.path.append(RAIZ_PROYECTO)
+        from api import consultas
+
+        self._consultas = consultas
+        self.db_path = db_path
+        self.snapshot = snapshot
+
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._snapshot_conn = None
+        self._snapshot_version = None
+        if snapshot:
+            self._cargar_snapshot()
+
+        self._rutas = {
+            "/": lambda conn, params: {"message": "API de Licencias de Cannabis (en proceso)"},
+            "/version": lambda conn, params: {**self._consultas.fuente_datos(self._db_path_consultas()),
+                                              "version": self.version()},
+            "/estadisticas": lambda conn, params: consultas.obtener_estadisticas(conn),
+            "/licencias": lambda conn, params: consultas.listar_licencias(
+                conn, int(params.get("skip", 0)), int(params.get("limit", 10)), campos=_campos(params)
+            ),
+            "/licencias/buscar/": self._buscar,
+            "/licencias/agregados": self._agregados,
+        }
+
+    def _buscar(self, conn, params: Dict) -> Dict:
+        params["campos"] = _campos(params)
+        if str(params.pop("fuzzy", "")).lower() in ("1", "true") and params.get("q"):
+            from api.indices import buscar_fuzzy, obtener_indices
+            params.pop("tipo", None)
+            return buscar_fuzzy(obtener_indices(self._db_path_consultas()), **params)
+        params.pop("similitud_minima", None)
+        return self._consultas.buscar_licencias(conn, **params)
+
+    def _agregados(self, conn, params: Dict) -> Dict:
+        # Mismos valores por defecto que el endpoint de la API; se calculan sobre los índices
+        from api.indices import obtener_indices
+        indices = obtener_indices(self._db_path_consultas())
+        agrupar_por = params.get("agrupar_por", "departamento") or None
+        grupos = indices.columnas.agregar(
+            agrupar_por,
+            _lista(params.get("campos", "no_psico,psico,semillas,total")),
+            _lista(params.get("agregados", "sum,avg,min,max")),
+            departamento=params.get("departamento"), municipio=params.get("municipio"),
+            min_total=int(params["min_total"]) if params.get("min_total") is not None else None,
+            max_total=int(params["max_total"]) if params.get("max_total") is not None else None,
+        )
+        return {"version": indices.version, "agrupar_por": agrupar_por, "grupos": grupos}
+
+    def _db_path_consultas(self) -> Optional[str]:
+        """
+        Ruta para la capa de consultas: None (el artefacto publicado, como la API) si hay
+        manifest; si no, la base de datos del ETL
+        """
+        return None if self._consultas.artefacto_actual() is not None else self.db_path
+
+    def _abrir(self, db_path: Optional[str]) -> sqlite3.Connection:
+        if db_path is None:
+            return self._consultas.get_db_connection()
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _cargar_snapshot(self):
+        """Copia la base de datos a memoria (solo lectura)"""
+        db_path = self._db_path_consultas()
+        version = self._consultas.obtener_version_datos(db_path)
+        origen = self._abrir(db_path)
+        memoria = sqlite3.connect(":memory:", check_same_thread=False)
+        origen.backup(memoria)
+        origen.close()
+        memoria.row_factory = sqlite3.Row
+        memoria.execute("PRAGMA query_only = ON")
+
+        anterior = self._snapshot_conn
+        self._snapshot_conn, self._snapshot_version = memoria, version
+        if anterior is not None:
+            anterior.close()
+        logger.info(f"📦 Snapshot en memoria cargado (versión {version})")
+
+    def version(self) -> str:
+        """Versión de los datos; si es un snapshot y el archivo cambió, lo recarga"""
+        version = self._consultas.obtener_version_datos(self._db_path_consultas())
+        if self.snapshot and version != self._snapshot_version:
+            with self._lock:
+                if version != self._snapshot_version:
+                    self._cargar_snapshot()
+        return version
+
+    def _conexion_archivo(self):
+        # Una conexión de solo lectura por hilo; se reabre si se publica otro artefacto
+        artefacto = self._consultas.artefacto_actual()
+        db_path, clave = (None, artefacto["ruta"]) if artefacto is not None else (self.db_path, self.db_path)
+        if getattr(self._local, "clave", None) != clave:
+            anterior = getattr(self._local, "conn", None)
+            if anterior is not None:
+                anterior.close()
+            self._local.conn, self._local.clave = self._abrir(db_path), clave
+        return self._local.conn
+
+    def get(self, endpoint: str, params: Dict = None, timeout: float = None) -> Dict:
+        ruta = self._rutas.get(endpoint)
+        if ruta is None:
+            raise ValueError(f"Endpoint no soportado en proceso: {endpoint}")
+
+        params = dict(params or {})
+        if self.snapshot:
+            # La conexión en memoria es compartida: se serializa su uso
+            with self._lock:
+                return ruta(self._snapshot_conn, params)
+        return ruta(self._conexion_archivo(), params)
+
+
+def crear_backend(tipo: str, api_url: str, session: requests.Session, db_path: str, api_key: str = None):
+    """Crea el backend configurado: 'http', 'inprocess' o 'snapshot'"""
+    if tipo == "http":
+        return HttpBackend(api_url, session, api_key=api_key)
+    if tipo == "inprocess":
+        return InProcessBackend(db_path)
+    if tipo == "snapshot":
+        return InProcessBackend(db_path, snapshot=True)
+    raise ValueError(f"DATA_BACKEND desconocido: {tipo}")
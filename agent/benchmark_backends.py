@@ -0,0 +1,63 @@
+# agent/benchmark_backends.py
+"""
+Compara la latencia por consulta de los backends de datos del agente.
+El backend http necesita la API corriendo (python api/main.py).
+
+    python agent/benchmark_backends.py --repeticiones 200
+"""
+import argparse
+import statistics
+import time
+
+from backends import crear_backend
+from config import config
+from http_client import obtener_sesion
+
+# Consultas típicas del agente: (endpoint, parámetros)
+CONSULTAS = [
+    ("/estadisticas", None),
+    ("/licencias", {"limit": 5}),
+    ("/licencias/buscar/", {"departamento": "Antioquia"}),
+    ("/licencias/buscar/", {"municipio": "Medellín", "departamento": "Antioquia"}),
+    ("/licencias/buscar/", {"q": "san"}),
+]
+
+
+def medir(backend, repeticiones: int):
+    """Latencias (ms) de cada consulta típica repetida `repeticiones` veces"""
+    latencias = []
+    for endpoint, params in CONSULTAS:
+        backend.get(endpoint, params)  # calentar conexiones y cachés
+    for _ in range(repeticiones):
+        for endpoint, params in CONSULTAS:
+            inicio = time.perf_counter()
+            backend.get(endpoint, params)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backends de datos del agente")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--backends", default="http,inprocess,snapshot")
+    args = parser.parse_args()
+
+    print(f"⏱️ {len(CONSULTAS)} consultas x {args.repeticiones} repeticiones por backend\n")
+    print(f"{'backend':<10} {'media':>9} {'p50':>9} {'p95':>9}")
+
+    for tipo in args.backends.split(","):
+        try:
+            # Con la clave del servicio, como el agente: se mide el backend y no el límite por IP
+            backend = crear_backend(tipo, config.API_BASE_URL, obtener_sesion(config.API_BASE_URL),
+                                    config.DATABASE_PATH, config.API_KEY)
+            latencias = sorted(medir(backend, args.repeticiones))
+        except Exception as e:
+            print(f"{tipo:<10} no disponible: {e}")
+            continue
+
+        p95 = latencias[int(len(latencias) * 0.95) - 1]
+        print(f"{tipo:<10} {statistics.mean(latencias):>7.3f}ms {statistics.median(latencias):>7.3f}ms {p95:>7.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
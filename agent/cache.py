@@ -0,0 +1,112 @@
+# agent/cache.py
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from texto import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Caché persistente (SQLite) con desalojo LRU para las respuestas reformuladas por el LLM"""
+
+    def __init__(self, path: str, max_entries: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS respuestas (
+                clave TEXT PRIMARY KEY,
+                respuesta TEXT NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ultimo_acceso
+            ON respuestas(ultimo_acceso)
+        ''')
+        self._conn.commit()
+
+    @staticmethod
+    def clave(consulta: str, datos: str, modelo: str, version_prompt: str) -> str:
+        """Clave de caché: (consulta normalizada, hash de los datos, modelo, versión del prompt)"""
+        datos_hash = hashlib.sha256(datos.encode("utf-8")).hexdigest()
+        partes = "\x1f".join([normalizar_texto(consulta), datos_hash, modelo, version_prompt])
+        return hashlib.sha256(partes.encode("utf-8")).hexdigest()
+
+    def obtener(self, clave: str) -> Optional[str]:
+        """Devuelve la respuesta guardada (y la marca como usada) o None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT respuesta FROM respuestas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE respuestas SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def guardar(self, clave: str, respuesta: str):
+        """Guarda una respuesta y desaloja las menos usadas si se supera el tamaño máximo"""
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, respuesta, creado, ultimo_acceso) VALUES (?, ?, ?, ?)",
+                (clave, respuesta, ahora, ahora)
+            )
+            total = self._conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+            if total > self.max_entries:
+                self._conn.execute('''
+                    DELETE FROM respuestas WHERE clave IN (
+                        SELECT clave FROM respuestas ORDER BY ultimo_acceso ASC LIMIT ?
+                    )
+                ''', (total - self.max_entries,))
+            self._conn.commit()
+
+    def limpiar(self):
+        """Elimina todas las entradas"""
+        with self._lock:
+            self._conn.execute("DELETE FROM respuestas")
+            self._conn.commit()
+
+    def metricas(self) -> Dict:
+        """Métricas de uso de la caché"""
+        with self._lock:
+            entradas = self._conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        consultas = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / consultas, 3) if consultas else 0.0,
+            'entradas': entradas,
+            'max_entradas': self.max_entries,
+        }
+
+
+# Una caché por archivo, compartida por todas las instancias del agente
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def obtener_cache(path: str, max_entries: int = 1000) -> ResponseCache:
+    """Devuelve la caché compartida para path, creándola la primera vez"""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path, max_entries)
+            _caches[path] = cache
+        return cache
@@ -0,0 +1,147 @@
+# agent/concurrency.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LimitadorConcurrencia:
+    """Semáforo que limita las llamadas simultáneas (p. ej. a Ollama) y expone la cola"""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._semaforo = threading.BoundedSemaphore(maximo)
+        self._lock = threading.Lock()
+        self.activos = 0
+        self.en_espera = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.en_espera += 1
+        self._semaforo.acquire()
+        with self._lock:
+            self.en_espera -= 1
+            self.activos += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.activos -= 1
+        self._semaforo.release()
+        return False
+
+
+class SingleFlight:
+    """Agrupa peticiones idénticas en vuelo: solo la primera ejecuta, el resto espera su resultado"""
+
+    def __init__(self):
+        self._en_vuelo: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.agrupadas = 0
+
+    def hacer(self, clave: Hashable, funcion: Callable[[], T]) -> T:
+        with self._lock:
+            futuro = self._en_vuelo.get(clave)
+            if futuro is not None:
+                self.agrupadas += 1
+                lider = False
+            else:
+                futuro = Future()
+                self._en_vuelo[clave] = futuro
+                lider = True
+
+        if not lider:
+            return futuro.result()
+
+        try:
+            futuro.set_result(funcion())
+        except BaseException as e:
+            futuro.set_exception(e)
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave]
+        return futuro.result()
+
+
+class LimitadorConcurrenciaAsync:
+    """Variante para asyncio de LimitadorConcurrencia: las esperas no ocupan hilos"""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._semaforo: Optional[asyncio.Semaphore] = None  # Se crea dentro del event loop
+        self.activos = 0
+        self.en_espera = 0
+
+    async def __aenter__(self):
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.maximo)
+        self.en_espera += 1
+        try:
+            await self._semaforo.acquire()
+        finally:
+            self.en_espera -= 1
+        self.activos += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.activos -= 1
+        self._semaforo.release()
+        return False
+
+
+class SingleFlightAsync:
+    """
+    Variante para asyncio de SingleFlight. El trabajo corre en su propia tarea:
+    si un cliente se desconecta, el resto sigue esperando el mismo resultado.
+    """
+
+    def __init__(self):
+        self._en_vuelo: Dict[Hashable, asyncio.Task] = {}
+        self.agrupadas = 0
+
+    async def hacer(self, clave: Hashable, funcion: Callable[[], Awaitable[T]]) -> T:
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(funcion())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+        else:
+            self.agrupadas += 1
+        return await asyncio.shield(tarea)
+
+
+class SessionStore:
+    """Historial de conversación por sesión, con expiración por inactividad y tamaño máximo"""
+
+    def __init__(self, max_sesiones: int = 1000, ttl: float = 3600, max_turnos: int = 20):
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        self.max_turnos = max_turnos
+        self._sesiones: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def historial(self, sid: str) -> Deque[Dict]:
+        """Historial de la sesión (se crea si no existe)"""
+        ahora = time.monotonic()
+        with self._lock:
+            sesion = self._sesiones.pop(sid, None)
+            if sesion is None or ahora - sesion['ultimo_uso'] > self.ttl:
+                sesion = {'historial': deque(maxlen=self.max_turnos)}
+            sesion['ultimo_uso'] = ahora
+            self._sesiones[sid] = sesion
+
+            # Desalojar las sesiones menos recientes
+            while len(self._sesiones) > self.max_sesiones:
+                self._sesiones.popitem(last=False)
+            return sesion['historial']
+
+    def reiniciar(self, sid: str):
+        with self._lock:
+            self._sesiones.pop(sid, None)
+
+    def __len__(self) -> int:
+        return len(self._sesiones)
@@ -14,10 +14,83 @@ class Config:
     
     # Ollama
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama2")
+    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:1b")
+    # Modelos candidatos en orden de preferencia (por defecto solo OLLAMA_MODEL): se usa
+    # el primero cuya latencia en caliente cumple OLLAMA_LATENCY_TARGET_MS (0 = siempre el primero)
+    OLLAMA_MODELS = [m.strip() for m in os.getenv("OLLAMA_MODELS", OLLAMA_MODEL).split(",") if m.strip()]
+    OLLAMA_LATENCY_TARGET_MS = float(os.getenv("OLLAMA_LATENCY_TARGET_MS", 0))
+    # Precarga de los modelos al arrancar y tiempo que Ollama los mantiene en memoria
+    OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "True").lower() == "true"
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    OLLAMA_LOAD_TIMEOUT = float(os.getenv("OLLAMA_LOAD_TIMEOUT", 120))
     
     # API
     API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+    # Clave del servicio: la API le aplica su propio límite de peticiones en lugar del de la IP
+    API_KEY = os.getenv("API_KEY", "cannabis-key-2025")
     MAX_RESULTS = int(os.getenv("MAX_RESULTS", 5))
+    
+    # Backend de datos: http (API REST), inprocess (capa de consultas de la API en el
+    # mismo proceso) o snapshot (copia en memoria de solo lectura de la base de datos)
+    DATA_BACKEND = os.getenv("DATA_BACKEND", "http")
+    DATABASE_PATH = os.getenv(
+        "DATABASE_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cannabis_licencias.db")
+    )
+    
+    # Pool de conexiones HTTP (keep-alive) hacia la API y Ollama
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+    
+    # Monitor de salud del agente (segundos)
+    HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 30))
+    HEALTH_CHECK_BACKOFF_MAX = float(os.getenv("HEALTH_CHECK_BACKOFF_MAX", 60))
+    STATUS_STREAM_KEEPALIVE = float(os.getenv("STATUS_STREAM_KEEPALIVE", 15))
+    
+    # Peticiones simultáneas que acepta Ollama (OLLAMA_NUM_PARALLEL del servidor)
+    OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", 4))
+    
+    # Presupuesto de latencia por consulta (ms): pasado ese tiempo se responde sin el LLM (0 = sin límite)
+    LATENCY_BUDGET_MS = float(os.getenv("LATENCY_BUDGET_MS", 3000))
+    # Si el LLM se está omitiendo, cada cuánto (segundos) se sondea su latencia en segundo plano
+    LATENCY_PROBE_INTERVAL = float(os.getenv("LATENCY_PROBE_INTERVAL", 30))
+    # Generaciones de Ollama pendientes (en cola o en curso) que nadie espera ya; las que superen el cupo se descartan
+    MAX_BACKGROUND_GENERATIONS = int(os.getenv("MAX_BACKGROUND_GENERATIONS", 16))
+    
+    # Lotes de consultas (/api/chat/batch y `ollama.py --lote`); 0 = sin límite de tamaño
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 500))
+    BATCH_PARALLEL = int(os.getenv("BATCH_PARALLEL", 8))
+    
+    # Sesiones de chat (historial por usuario)
+    MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 1000))
+    SESSION_TTL = float(os.getenv("SESSION_TTL", 3600))
+    
+    # Cada cuánto (segundos) se consulta la versión de los datos para reconstruir índices
+    DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", 60))
+    
+    # Redacción de la respuesta: plantilla (plantillas locales para consultas entendidas y LLM
+    # solo para preguntas abiertas), llm (el LLM reformula siempre) o directo (sin redacción)
+    RESPONSE_MODE = os.getenv("RESPONSE_MODE", "plantilla")
+    # Rechazar respuestas del LLM cuyos números no coinciden con los datos
+    VALIDATE_LLM_NUMBERS = os.getenv("VALIDATE_LLM_NUMBERS", "True").lower() == "true"
+    
+    # Respuestas directas precalculadas por versión de los datos
+    ANSWER_INDEX_ENABLED = os.getenv("ANSWER_INDEX_ENABLED", "True").lower() == "true"
+    
+    # Trazas por consulta: resumen en memoria para /api/metrics. La exportación a JSONL es
+    # opcional (TRACE_PATH, p. ej. agent/trazas.jsonl), rota al superar TRACE_MAX_BYTES y no
+    # guarda el texto de las consultas salvo con TRACE_INCLUDE_QUERY
+    TRACE_ENABLED = os.getenv("TRACE_ENABLED", "True").lower() == "true"
+    TRACE_PATH = os.getenv("TRACE_PATH", "")
+    TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 10 * 1024 * 1024))
+    TRACE_INCLUDE_QUERY = os.getenv("TRACE_INCLUDE_QUERY", "False").lower() == "true"
+    
+    # Clave de administración para el perfilado bajo demanda (/api/admin/perfilado y la
+    # cabecera X-Profile); vacía = perfilado desactivado
+    ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+    
+    # Caché persistente de respuestas reformuladas por el LLM
+    CACHE_ENABLED = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+    CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "respuestas_cache.db"))
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1000))
 
 config = Config()
\ No newline at end of file
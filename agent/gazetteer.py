@@ -0,0 +1,240 @@
+# agent/gazetteer.py
+import difflib
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from texto import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+# Palabras clave de intención (ya normalizadas); el orden define la prioridad
+INTENCIONES = {
+    'estadisticas': ['cuantas', 'cuantos', 'total', 'totales', 'numero', 'estadistica', 'estadisticas', 'resumen'],
+    'buscar': ['buscar', 'encontrar', 'municipio', 'municipios', 'departamento', 'departamentos',
+               'ciudad', 'pueblo', 'localidad'],
+    'listar': ['listar', 'lista', 'todos', 'mostrar', 'ver todos', 'cuales'],
+}
+
+# Nombres cortos usados en conversación -> nombre normalizado en los datos
+ALIAS = {
+    'bogota': 'bogota d c',
+    'valle': 'valle del cauca',
+    'guajira': 'la guajira',
+    'norte santander': 'norte de santander',
+}
+
+# Nombres que también son palabras comunes: solo cuentan tras "en", "de", "y", etc.
+AMBIGUOS = {'une', 'toca', 'toro', 'meta', 'cota', 'tena'}
+CONTEXTO_AMBIGUOS = {'en', 'de', 'del', 'y', 'e', 'o', 'vs', 'municipio', 'departamento'}
+
+# Palabras que nunca forman parte de un nombre en la búsqueda aproximada
+STOP_WORDS = {'licencias', 'licencia', 'cannabis', 'de', 'en', 'por', 'para', 'con', 'las', 'los',
+              'que', 'hay', 'como', 'del', 'el', 'la', 'y', 'compara', 'comparar', 'cuantas', 'cuantos'}
+
+SIMILITUD_MINIMA = 0.84
+
+
+class AhoCorasick:
+    """Autómata de Aho-Corasick: encuentra todos los patrones en una sola pasada"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._salida: List[List[Tuple[int, object]]] = [[]]
+
+    def agregar(self, patron: str, valor: object):
+        """Añade un patrón (debe llamarse antes de construir)"""
+        estado = 0
+        for caracter in patron:
+            siguiente = self._goto[estado].get(caracter)
+            if siguiente is None:
+                siguiente = len(self._goto)
+                self._goto[estado][caracter] = siguiente
+                self._goto.append({})
+                self._fail.append(0)
+                self._salida.append([])
+            estado = siguiente
+        self._salida[estado].append((len(patron), valor))
+
+    def construir(self):
+        """Calcula los enlaces de fallo (recorrido en anchura)"""
+        cola = deque(self._goto[0].values())
+        while cola:
+            estado = cola.popleft()
+            for caracter, siguiente in self._goto[estado].items():
+                cola.append(siguiente)
+                fallo = self._fail[estado]
+                while fallo and caracter not in self._goto[fallo]:
+                    fallo = self._fail[fallo]
+                self._fail[siguiente] = self._goto[fallo].get(caracter, 0)
+                self._salida[siguiente] = self._salida[siguiente] + self._salida[self._fail[siguiente]]
+
+    def buscar(self, texto: str) -> List[Tuple[int, int, object]]:
+        """Devuelve (inicio, fin, valor) de cada aparición de un patrón en texto"""
+        resultados = []
+        estado = 0
+        for posicion, caracter in enumerate(texto):
+            while estado and caracter not in self._goto[estado]:
+                estado = self._fail[estado]
+            estado = self._goto[estado].get(caracter, 0)
+            for longitud, valor in self._salida[estado]:
+                resultados.append((posicion + 1 - longitud, posicion + 1, valor))
+        return resultados
+
+
+class Gazetteer:
+    """Extractor de entidades (departamentos, municipios) e intenciones construido desde los datos"""
+
+    def __init__(self, licencias: List[Dict], version: str = None):
+        self.version = version
+        self._automata = AhoCorasick()
+        self._nombres: Dict[str, List[Tuple]] = {}
+
+        for licencia in licencias:
+            departamento = licencia['departamento']
+            self._registrar(normalizar_texto(departamento), ('departamento', departamento))
+            self._registrar(normalizar_texto(licencia['municipio']),
+                            ('municipio', licencia['municipio'], departamento))
+
+        for alias, nombre in ALIAS.items():
+            if nombre in self._nombres:
+                for entidad in self._nombres[nombre]:
+                    self._registrar(alias, entidad)
+
+        for patron, entidades in self._nombres.items():
+            self._automata.agregar(patron, ('entidad', patron, tuple(entidades)))
+
+        for accion, palabras in INTENCIONES.items():
+            for palabra in palabras:
+                self._automata.agregar(palabra, ('intencion', accion))
+
+        self._automata.construir()
+
+        # Índice por longitud y palabras ignoradas para la búsqueda aproximada
+        self._ignoradas = STOP_WORDS | {p for palabras in INTENCIONES.values() for p in palabras}
+        self._por_longitud: Dict[int, List[str]] = {}
+        for patron in self._nombres:
+            self._por_longitud.setdefault(len(patron), []).append(patron)
+
+        logger.info(f"Gazetteer: {len(self._nombres)} nombres indexados")
+
+    def _registrar(self, patron: str, entidad: Tuple):
+        entidades = self._nombres.setdefault(patron, [])
+        if entidad not in entidades:
+            entidades.append(entidad)
+
+    def extraer(self, consulta: str) -> Dict:
+        """
+        Extrae entidades e intenciones de la consulta en una sola pasada.
+        Returns: Dict con 'departamentos', 'municipios' [(municipio, departamento)],
+        'intenciones' y 'aproximado' (True si se usó coincidencia aproximada)
+        """
+        texto = normalizar_texto(consulta)
+        coincidencias = [
+            (inicio, fin, valor) for inicio, fin, valor in self._automata.buscar(texto)
+            if self._es_palabra_completa(texto, inicio, fin)
+        ]
+
+        # Coincidencias más a la izquierda y más largas, sin solapamiento
+        coincidencias.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+        resultado = {'departamentos': [], 'municipios': [], 'intenciones': [], 'aproximado': False}
+        fin_anterior = 0
+        for inicio, fin, valor in coincidencias:
+            if inicio < fin_anterior:
+                continue
+            if valor[0] == 'intencion':
+                if valor[1] not in resultado['intenciones']:
+                    resultado['intenciones'].append(valor[1])
+            else:
+                patron = valor[1]
+                if patron in AMBIGUOS and not self._tiene_contexto(texto, inicio):
+                    continue
+                self._agregar_entidades(resultado, valor[2])
+            fin_anterior = fin
+
+        if not resultado['departamentos'] and not resultado['municipios']:
+            patron = self._buscar_aproximado(texto)
+            if patron:
+                self._agregar_entidades(resultado, self._nombres[patron])
+                resultado['aproximado'] = True
+
+        return resultado
+
+    @staticmethod
+    def _agregar_entidades(resultado: Dict, entidades):
+        # Si el nombre es de un departamento se prefiere el departamento (más general)
+        departamentos = [e[1] for e in entidades if e[0] == 'departamento']
+        if departamentos:
+            for departamento in departamentos:
+                if departamento not in resultado['departamentos']:
+                    resultado['departamentos'].append(departamento)
+            return
+        for entidad in entidades:
+            municipio = (entidad[1], entidad[2])
+            if municipio not in resultado['municipios']:
+                resultado['municipios'].append(municipio)
+
+    @staticmethod
+    def _es_palabra_completa(texto: str, inicio: int, fin: int) -> bool:
+        return (inicio == 0 or texto[inicio - 1] == ' ') and (fin == len(texto) or texto[fin] == ' ')
+
+    @staticmethod
+    def _tiene_contexto(texto: str, inicio: int) -> bool:
+        anteriores = texto[:inicio].split()
+        return bool(anteriores) and anteriores[-1] in CONTEXTO_AMBIGUOS
+
+    def _buscar_aproximado(self, texto: str) -> Optional[str]:
+        """Busca el nombre más parecido a alguna ventana de 1 a 3 palabras de la consulta"""
+        palabras = texto.split()
+        mejor, mejor_ratio = None, SIMILITUD_MINIMA
+        for tamano in (3, 2, 1):
+            for i in range(len(palabras) - tamano + 1):
+                ventana = palabras[i:i + tamano]
+                if ventana[0] in self._ignoradas or ventana[-1] in self._ignoradas:
+                    continue
+                candidato = ' '.join(ventana)
+                if len(candidato) < 4:
+                    continue
+                matcher = difflib.SequenceMatcher(None, b=candidato)
+                for longitud in range(len(candidato) - 2, len(candidato) + 3):
+                    for patron in self._por_longitud.get(longitud, ()):
+                        if patron in AMBIGUOS:
+                            continue
+                        matcher.set_seq1(patron)
+                        if matcher.real_quick_ratio() <= mejor_ratio or matcher.quick_ratio() <= mejor_ratio:
+                            continue
+                        ratio = matcher.ratio()
+                        if ratio > mejor_ratio:
+                            mejor, mejor_ratio = patron, ratio
+        return mejor
+
+    def resolver_parametros(self, entidades: Dict) -> Optional[Dict]:
+        """Convierte las entidades extraídas en filtros exactos para /licencias/buscar/"""
+        filtros = self.resolver_todos(entidades)
+        return filtros[0] if filtros else None
+
+    def resolver_todos(self, entidades: Dict) -> List[Dict]:
+        """Un filtro por cada lugar mencionado (municipios primero, luego departamentos)"""
+        departamentos = entidades['departamentos']
+        filtros, usados = [], set()
+
+        por_nombre: Dict[str, List[str]] = {}
+        for municipio, departamento in entidades['municipios']:
+            por_nombre.setdefault(municipio, []).append(departamento)
+
+        for municipio, candidatos in por_nombre.items():
+            # Un departamento mencionado desambigua municipios homónimos
+            mencionados = [d for d in candidatos if d in departamentos]
+            if mencionados:
+                usados.add(mencionados[0])
+                filtros.append({'municipio': municipio, 'departamento': mencionados[0]})
+            elif len(candidatos) == 1:
+                filtros.append({'municipio': municipio, 'departamento': candidatos[0]})
+            else:
+                filtros.append({'municipio': municipio})
+
+        for departamento in departamentos:
+            if departamento not in usados:
+                filtros.append({'departamento': departamento})
+        return filtros
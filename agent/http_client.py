@@ -0,0 +1,114 @@
+# agent/http_client.py
+import asyncio
+import json
+import logging
+import threading
+from typing import AsyncIterator, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Sesiones compartidas por host: reutilizan conexiones keep-alive entre consultas
+_sesiones: Dict[str, requests.Session] = {}
+_sesiones_lock = threading.Lock()
+
+
+def crear_sesion(pool_size: int = 10) -> requests.Session:
+    """Crea una sesión HTTP con un pool acotado de conexiones keep-alive"""
+    session = requests.Session()
+    # pool_block=True evita abrir más de pool_size conexiones simultáneas al host
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def obtener_sesion(base_url: str, pool_size: int = 10) -> requests.Session:
+    """Devuelve la sesión compartida para base_url, creándola la primera vez"""
+    with _sesiones_lock:
+        session = _sesiones.get(base_url)
+        if session is None:
+            session = crear_sesion(pool_size)
+            _sesiones[base_url] = session
+            logger.debug(f"Pool HTTP creado para {base_url} ({pool_size} conexiones)")
+        return session
+
+
+def cerrar_sesiones():
+    """Cierra todas las sesiones compartidas"""
+    with _sesiones_lock:
+        for session in _sesiones.values():
+            session.close()
+        _sesiones.clear()
+
+
+def espera_reintento(response, maximo: float) -> Optional[float]:
+    """
+    Segundos a esperar antes de reintentar una respuesta 429/503 según Retry-After;
+    None si no se debe reintentar (otro código o una espera mayor que `maximo`)
+    """
+    if response.status_code not in (429, 503):
+        return None
+    try:
+        espera = float(response.headers.get("Retry-After", 1))
+    except ValueError:
+        return None
+    return espera if 0 <= espera <= maximo else None
+
+
+class AsyncAgentClient:
+    """Cliente asíncrono (httpx) con pools keep-alive hacia la API y Ollama"""
+
+    def __init__(self, api_url: str, ollama_url: str, pool_size: int = 10, api_key: str = None,
+                 max_espera_reintento: float = 2):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("El cliente asíncrono requiere httpx (pip install httpx)") from e
+
+        self._httpx = httpx
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.api = httpx.AsyncClient(base_url=api_url, limits=limits, timeout=10,
+                                     headers={"X-API-Key": api_key} if api_key else None)
+        self.max_espera_reintento = max_espera_reintento
+        self.ollama = httpx.AsyncClient(base_url=ollama_url, limits=limits, timeout=15)
+
+    async def call_api(self, endpoint: str, params: Dict = None) -> Optional[Dict]:
+        """Llama a la API REST de forma asíncrona"""
+        try:
+            response = await self.api.get(endpoint, params=params)
+            espera = espera_reintento(response, self.max_espera_reintento)
+            if espera is not None:
+                await asyncio.sleep(espera)
+                response = await self.api.get(endpoint, params=params)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.error(f"Error API async {endpoint}: {e}")
+            return None
+
+    async def generate(self, data: Dict, timeout: float = 15) -> Dict:
+        """Llama a /api/generate de Ollama sin streaming (TimeoutError si vence el timeout)"""
+        try:
+            response = await self.ollama.post("/api/generate", json=data, timeout=timeout)
+        except self._httpx.TimeoutException as e:
+            raise TimeoutError(str(e)) from e
+        response.raise_for_status()
+        return response.json()
+
+    async def generate_stream(self, data: Dict, timeout: float = 15) -> AsyncIterator[Dict]:
+        """Llama a /api/generate en modo streaming y entrega cada fragmento JSON"""
+        # El timeout de lectura aplica entre fragmentos, no al total
+        limites = self._httpx.Timeout(timeout, connect=3)
+        async with self.ollama.stream("POST", "/api/generate", json=data, timeout=limites) as response:
+            response.raise_for_status()
+            async for linea in response.aiter_lines():
+                if linea:
+                    yield json.loads(linea)
+
+    async def aclose(self):
+        """Cierra los pools de conexiones"""
+        await self.api.aclose()
+        await self.ollama.aclose()
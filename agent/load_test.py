@@ -0,0 +1,323 @@
+# agent/load_test.py
+"""
+Prueba de carga de la interfaz web del agente contra servidores simulados
+de Ollama y de la API (no requiere Ollama ni la base de datos). Compara el
+servidor Flask (web_interface.py, un hilo por petición) con el ASGI
+(web_asgi.py, event loop).
+
+    python agent/load_test.py --sesiones 50 --consultas 10
+    python agent/load_test.py --servidor ambos --sesiones 300 --consultas 3
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+LICENCIAS = [
+    {"id": i + 1, "departamento": departamento, "municipio": municipio,
+     "no_psico": total // 2, "psico": total - total // 2, "semillas": 0, "total": total}
+    for i, (departamento, municipio, total) in enumerate([
+        ("Antioquia", "Medellín", 19), ("Antioquia", "Rionegro", 8), ("Antioquia", "Envigado", 5),
+        ("Cundinamarca", "Chía", 12), ("Cundinamarca", "Mosquera", 6), ("Huila", "Palermo", 10),
+        ("Huila", "Neiva", 4), ("Valle Del Cauca", "Santiago De Cali", 15), ("Cauca", "Popayán", 7),
+        ("Bogotá D.C.", "Bogotá D.C.", 30), ("Meta", "Granada", 3), ("Boyacá", "Tunja", 2),
+    ])
+]
+
+CONSULTAS = [
+    "¿Cuántas licencias hay en total?", "licencias en Antioquia", "licencias en Medellín",
+    "listar todos", "licencias en Huila", "buscar municipio Chía", "resumen de estadísticas",
+    "licencias en Cali", "licencias en Bogotá", "Granada en Meta",
+]
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Ollama simulado: latencia fija por generación y registro de concurrencia"""
+    protocol_version = "HTTP/1.1"
+    latencia = 0.2
+    lock = threading.Lock()
+    activos = 0
+    max_activos = 0
+    llamadas = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, datos, status=200):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        self._json({"models": [{"name": "gemma3:1b"}]})
+
+    def do_POST(self):
+        longitud = int(self.headers.get("Content-Length", 0))
+        json.loads(self.rfile.read(longitud) or b"{}")
+        cls = StubOllamaHandler
+        with cls.lock:
+            cls.activos += 1
+            cls.llamadas += 1
+            cls.max_activos = max(cls.max_activos, cls.activos)
+        try:
+            time.sleep(cls.latencia)
+        finally:
+            with cls.lock:
+                cls.activos -= 1
+        self._json({"response": "Respuesta simulada con los mismos datos.", "done": True})
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    """API REST simulada con un conjunto pequeño de licencias"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/":
+            datos = {"message": "API simulada"}
+        elif url.path == "/version":
+            datos = {"version": "load-test"}
+        elif url.path == "/estadisticas":
+            total = sum(l["total"] for l in LICENCIAS)
+            datos = {"totales": {
+                "total_municipios": len(LICENCIAS), "total_licencias": total,
+                "total_no_psico": sum(l["no_psico"] for l in LICENCIAS),
+                "total_psico": sum(l["psico"] for l in LICENCIAS), "total_semillas": 0,
+                "promedio_por_municipio": total / len(LICENCIAS),
+            }, "top_departamentos": [], "distribucion_rangos": []}
+        elif url.path in ("/licencias", "/licencias/buscar/"):
+            filas = [
+                l for l in LICENCIAS
+                if params.get("departamento", l["departamento"]) == l["departamento"]
+                and params.get("municipio", l["municipio"]) == l["municipio"]
+                and params.get("q", "").lower() in (l["departamento"] + " " + l["municipio"]).lower()
+            ]
+            skip, limit = int(params.get("skip", 0)), int(params.get("limit", 10))
+            datos = {"resultados": filas[skip:skip + limit], "total": len(filas),
+                     "pagina": skip // limit + 1, "por_pagina": limit}
+        elif url.path == "/licencias/agregados":
+            # Solo lo que usa el planificador: sumas sin agrupar por lugar
+            filas = [
+                l for l in LICENCIAS
+                if params.get("departamento", l["departamento"]) == l["departamento"]
+                and params.get("municipio", l["municipio"]) == l["municipio"]
+            ]
+            grupos = [{"municipios": len(filas), **{
+                campo: {"sum": sum(l.get(campo, 0) for l in filas)}
+                for campo in ("no_psico", "psico", "semillas", "total")
+            }}] if filas else []
+            datos = {"version": "load-test", "agrupar_por": None, "grupos": grupos}
+        else:
+            self.send_error(404)
+            return
+
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def iniciar_en_hilo(servidor):
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    return servidor
+
+
+def iniciar_servidor_flask(puerto: int):
+    """Levanta la interfaz web Flask (la real) en un hilo"""
+    from werkzeug.serving import make_server
+    import web_interface
+
+    web_interface.inicializar_agente()
+    return iniciar_en_hilo(make_server("127.0.0.1", puerto, web_interface.app, threaded=True))
+
+
+class ServidorAsgi:
+    """uvicorn en un hilo, con la misma interfaz que el servidor de werkzeug"""
+
+    def __init__(self, app, puerto: int):
+        import uvicorn
+
+        self.server_port = puerto
+        self.servidor = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=puerto, log_level="warning", backlog=4096
+        ))
+        self.hilo = threading.Thread(target=self.servidor.run, daemon=True)
+        self.hilo.start()
+        while not self.servidor.started:
+            time.sleep(0.05)
+
+    def shutdown(self):
+        self.servidor.should_exit = True
+        self.hilo.join(timeout=10)
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor_asgi(puerto: int):
+    """Levanta la interfaz web ASGI (la real) con uvicorn en un hilo"""
+    import web_asgi
+
+    return ServidorAsgi(web_asgi.app, puerto or puerto_libre())
+
+
+def hilos_proceso() -> int:
+    return threading.active_count()
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))
+    return ordenados[indice]
+
+
+def ejecutar_ronda(base_url: str, sesiones: int, consultas: int, hilos_base: int = 0):
+    """
+    Cada sesión (con su propia cookie) envía `consultas` mensajes secuenciales.
+    Devuelve también el máximo de hilos que el servidor añadió al proceso
+    (sin contar los clientes ni los `hilos_base` previos al servidor).
+    """
+    latencias, errores = [], []
+    hilos_servidor = [0]
+    terminado = threading.Event()
+
+    def vigilar_hilos():
+        while not terminado.wait(0.05):
+            hilos_servidor[0] = max(hilos_servidor[0], hilos_proceso() - sesiones - hilos_base)
+    lock = threading.Lock()
+    barrera = threading.Barrier(sesiones)
+
+    def usuario(n):
+        rnd = random.Random(n)
+        http = requests.Session()
+        barrera.wait()
+        for _ in range(consultas):
+            inicio = time.perf_counter()
+            try:
+                r = http.post(f"{base_url}/api/chat", json={"message": rnd.choice(CONSULTAS)}, timeout=60)
+                ok = r.status_code == 200 and r.json().get("status") == "success"
+            except Exception as e:
+                ok = False
+                r = e
+            elapsed = time.perf_counter() - inicio
+            with lock:
+                (latencias if ok else errores).append(elapsed if ok else str(r))
+
+    hilos = [threading.Thread(target=usuario, args=(n,)) for n in range(sesiones)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    vigilante = threading.Thread(target=vigilar_hilos, daemon=True)
+    vigilante.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    terminado.set()
+    vigilante.join()
+    return latencias, errores, duracion, hilos_servidor[0]
+
+
+SERVIDORES = {"flask": iniciar_servidor_flask, "asgi": iniciar_servidor_asgi}
+
+
+def probar_servidor(nombre: str, args):
+    """Ejecuta las rondas contra un servidor y devuelve las latencias de todas ellas"""
+    StubOllamaHandler.llamadas = StubOllamaHandler.max_activos = 0
+    hilos_base = hilos_proceso()
+    servidor = SERVIDORES[nombre](0)
+    base_url = f"http://127.0.0.1:{servidor.server_port}"
+    print(f"— {nombre} —")
+
+    todas = []
+    for ronda in range(1, args.rondas + 1):
+        latencias, errores, duracion, hilos = ejecutar_ronda(base_url, args.sesiones, args.consultas, hilos_base)
+        todas.extend(latencias)
+        if not latencias:
+            print(f"Ronda {ronda}: sin respuestas correctas ({len(errores)} errores)")
+            continue
+        print(f"Ronda {ronda}: {len(latencias)} ok, {len(errores)} errores, "
+              f"{len(latencias) / duracion:.1f} req/s | "
+              f"p50 {statistics.median(latencias) * 1000:.0f}ms  "
+              f"p95 {percentil(latencias, 95) * 1000:.0f}ms  "
+              f"p99 {percentil(latencias, 99) * 1000:.0f}ms | "
+              f"hilos del servidor (máx.) {hilos}")
+
+    if nombre == "asgi":
+        import web_asgi as web
+        agrupadas = web.agente.coalescedor_async.agrupadas
+    else:
+        import web_interface as web
+        agrupadas = web.agente.coalescedor.agrupadas
+    print(f"Llamadas a Ollama: {StubOllamaHandler.llamadas} "
+          f"(máx. simultáneas {StubOllamaHandler.max_activos}/{args.paralelo_ollama}), "
+          f"consultas agrupadas: {agrupadas}, sesiones: {len(web.sesiones)}\n")
+
+    servidor.shutdown()
+    return todas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del chat del agente")
+    parser.add_argument("--sesiones", type=int, default=50)
+    parser.add_argument("--consultas", type=int, default=10, help="Consultas por sesión y ronda")
+    parser.add_argument("--rondas", type=int, default=3)
+    parser.add_argument("--latencia-ollama", type=float, default=0.2, help="Segundos por generación simulada")
+    parser.add_argument("--paralelo-ollama", type=int, default=4)
+    parser.add_argument("--servidor", choices=["flask", "asgi", "ambos"], default="flask")
+    args = parser.parse_args()
+
+    StubOllamaHandler.latencia = args.latencia_ollama
+    ollama = iniciar_en_hilo(_Servidor(("127.0.0.1", 0), StubOllamaHandler))
+    api = iniciar_en_hilo(_Servidor(("127.0.0.1", 0), StubApiHandler))
+
+    # La configuración del agente se lee al importar, por eso se fija antes
+    os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{ollama.server_port}"
+    os.environ["API_BASE_URL"] = f"http://127.0.0.1:{api.server_port}"
+    os.environ["OLLAMA_NUM_PARALLEL"] = str(args.paralelo_ollama)
+    os.environ["HTTP_POOL_SIZE"] = str(max(10, args.sesiones))
+    os.environ["CACHE_ENABLED"] = "False"  # medir generación real, no aciertos de caché
+    os.environ["RESPONSE_MODE"] = "llm"  # todas las consultas pasan por Ollama
+    os.environ["VALIDATE_LLM_NUMBERS"] = "False"  # el texto simulado no repite los números
+
+    print(f"🧪 {args.sesiones} sesiones x {args.consultas} consultas, Ollama simulado "
+          f"{args.latencia_ollama * 1000:.0f}ms con paralelismo {args.paralelo_ollama}\n")
+
+    nombres = ["flask", "asgi"] if args.servidor == "ambos" else [args.servidor]
+    resultados = {nombre: probar_servidor(nombre, args) for nombre in nombres}
+
+    if len(resultados) > 1:
+        print(f"{'servidor':>8} {'ok':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for nombre, latencias in resultados.items():
+            if latencias:
+                print(f"{nombre:>8} {len(latencias):>6} "
+                      + " ".join(f"{percentil(latencias, p) * 1000:>6.0f}ms" for p in (50, 95, 99)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# agent/manager.py
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AgentManager:
+    """
+    Mantiene una única instancia del agente y vigila sus conexiones en segundo
+    plano. El último estado (y la lista de modelos de Ollama) queda en caché
+    para que los endpoints respondan sin hacer peticiones, y cada cambio se
+    notifica a quien espere en esperar_cambio().
+    """
+
+    def __init__(self, factory: Callable, intervalo: float = 30, backoff_inicial: float = 1,
+                 backoff_max: float = 60):
+        self._factory = factory
+        self.intervalo = intervalo
+        self.backoff_inicial = backoff_inicial
+        self.backoff_max = backoff_max
+
+        self.agente = None
+        self.estado: Dict = {
+            'ollama_available': False,
+            'api_available': False,
+            'modelos': [],
+            'ultima_verificacion': None,
+        }
+        self.cambios = 0
+        self._cambio = threading.Condition()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self):
+        """Crea el agente (una sola vez) y arranca el monitor de salud"""
+        with self._lock:
+            if self.agente is None:
+                self.agente = self._factory()
+                logger.info("✅ Agente inicializado correctamente")
+
+            if self._hilo is None or not self._hilo.is_alive():
+                self._stop.clear()
+                self._hilo = threading.Thread(target=self._bucle, name="agent-health", daemon=True)
+                self._hilo.start()
+        return self.agente
+
+    def detener(self):
+        """Detiene el monitor de salud"""
+        self._stop.set()
+        if self._hilo:
+            self._hilo.join(timeout=5)
+
+    @property
+    def conectado(self) -> bool:
+        return self.estado['ollama_available'] and self.estado['api_available']
+
+    def esperar_cambio(self, ultimo: int, timeout: float = None) -> Tuple[int, Dict]:
+        """
+        Espera a que el estado cambie respecto al número de cambio `ultimo`
+        (o hasta timeout) y devuelve (número de cambio actual, estado)
+        """
+        with self._cambio:
+            self._cambio.wait_for(lambda: self.cambios != ultimo, timeout)
+            return self.cambios, self.estado
+
+    def verificar(self) -> bool:
+        """Ejecuta una verificación de conexiones y actualiza el estado"""
+        anterior = self.conectado
+        try:
+            resultado = self.agente.verificar_conexiones()
+        except Exception as e:
+            logger.error(f"❌ Error verificando conexiones: {e}")
+            resultado = {'ollama_available': False, 'api_available': False, 'modelos': []}
+
+        previo = self.estado
+        self.estado = {'modelos': [], **resultado, 'ultima_verificacion': time.time()}
+
+        if any(self.estado[k] != previo[k] for k in ('ollama_available', 'api_available', 'modelos')):
+            with self._cambio:
+                self.cambios += 1
+                self._cambio.notify_all()
+
+        if self.conectado and not anterior:
+            logger.info("✅ Conexiones con Ollama y API disponibles")
+        elif not self.conectado and anterior:
+            logger.warning(f"⚠️ Conexión perdida: {resultado}")
+        return self.conectado
+
+    def _bucle(self):
+        """Verifica periódicamente; si algo falla reintenta con backoff exponencial"""
+        backoff = self.backoff_inicial
+        while not self._stop.is_set():
+            if self.verificar():
+                backoff = self.backoff_inicial
+                espera = self.intervalo
+            else:
+                espera = backoff
+                logger.info(f"🔄 Reintentando conexión en {espera:.1f}s")
+                backoff = min(backoff * 2, self.backoff_max)
+            self._stop.wait(espera)
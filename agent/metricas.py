@@ -0,0 +1,63 @@
+# agent/metricas.py
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Optional
+
+
+def percentil(valores, p: float) -> Optional[float]:
+    """Percentil p (0-100) por el método del rango más cercano"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))
+    return ordenados[indice]
+
+
+class VentanaLatencias:
+    """Latencias observadas más recientes (en segundos) para estimar la próxima"""
+
+    def __init__(self, tamano: int = 50):
+        self._valores = deque(maxlen=tamano)
+        self._lock = threading.Lock()
+        self.ultima_observacion: Optional[float] = None
+
+    def registrar(self, segundos: float):
+        with self._lock:
+            self._valores.append(segundos)
+            self.ultima_observacion = time.monotonic()
+
+    def percentil(self, p: float) -> Optional[float]:
+        with self._lock:
+            return percentil(list(self._valores), p)
+
+    def antiguedad(self) -> float:
+        """Segundos desde la última observación (infinito si no hay ninguna)"""
+        if self.ultima_observacion is None:
+            return float('inf')
+        return time.monotonic() - self.ultima_observacion
+
+    def resumen(self) -> Dict:
+        with self._lock:
+            valores = list(self._valores)
+        return {
+            'muestras': len(valores),
+            'p50_ms': round(percentil(valores, 50) * 1000, 1) if valores else None,
+            'p95_ms': round(percentil(valores, 95) * 1000, 1) if valores else None,
+        }
+
+
+class ContadorRutas:
+    """Cuenta qué camino (Ollama, directo, caché...) tomó cada consulta"""
+
+    def __init__(self):
+        self._conteo = Counter()
+        self._lock = threading.Lock()
+
+    def registrar(self, ruta: str):
+        with self._lock:
+            self._conteo[ruta] += 1
+
+    def resumen(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conteo)
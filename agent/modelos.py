@@ -0,0 +1,146 @@
+# agent/modelos.py
+"""
+Gestión de los modelos de Ollama: precarga (warm-up), latencia en frío y en
+caliente a partir de load_duration, y elección del modelo según un objetivo
+de latencia.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+from metricas import VentanaLatencias
+
+logger = logging.getLogger(__name__)
+
+# Una generación cuyo load_duration supera este umbral tuvo que cargar el modelo
+UMBRAL_CARGA_S = 0.5
+
+PROMPT_SONDEO = "Responde en una frase: hay 12 licencias de cannabis en Huila."
+
+
+class EstadisticasModelo:
+    """Latencias de un modelo separadas en frío (con carga) y en caliente"""
+
+    def __init__(self):
+        self.frio = VentanaLatencias()
+        self.caliente = VentanaLatencias()
+        self.cargas = VentanaLatencias()  # Duración de cada carga del modelo
+        self.cargado = False
+
+    def resumen(self) -> Dict:
+        cargas = self.cargas.resumen()
+        return {
+            'cargado': self.cargado,
+            'cargas': cargas['muestras'],
+            'carga_p50_ms': cargas['p50_ms'],
+            'frio': self.frio.resumen(),
+            'caliente': self.caliente.resumen(),
+        }
+
+
+class SelectorModelo:
+    """
+    Mantiene cargados en Ollama los modelos candidatos (en orden de preferencia)
+    y elige el primero cuya latencia en caliente cumple el objetivo.
+    """
+
+    def __init__(self, session: requests.Session, ollama_url: str, candidatos: List[str],
+                 objetivo_ms: float = 0, keep_alive: str = "30m", timeout_carga: float = 120):
+        self.session = session
+        self.ollama_url = ollama_url
+        self.candidatos = candidatos
+        self.objetivo_ms = objetivo_ms
+        self.keep_alive = keep_alive
+        self.timeout_carga = timeout_carga
+
+        self.estadisticas = {modelo: EstadisticasModelo() for modelo in candidatos}
+        self._calentando = threading.Lock()
+
+    @property
+    def actual(self) -> str:
+        """Primer candidato cuya latencia p75 en caliente cumple el objetivo"""
+        if self.objetivo_ms <= 0 or len(self.candidatos) == 1:
+            return self.candidatos[0]
+
+        medidos = []
+        for modelo in self.candidatos:
+            p75 = self.estadisticas[modelo].caliente.percentil(75)
+            if p75 is None:
+                continue
+            if p75 * 1000 <= self.objetivo_ms:
+                return modelo
+            medidos.append((p75, modelo))
+        # Ninguno cumple: el más rápido medido (o el preferido si no hay medidas)
+        return min(medidos)[1] if medidos else self.candidatos[0]
+
+    def registrar(self, modelo: str, resultado: Dict, segundos: float):
+        """Registra una generación a partir de la respuesta final de Ollama"""
+        estadisticas = self.estadisticas.get(modelo)
+        if estadisticas is None:
+            return
+
+        carga = resultado.get("load_duration", 0) / 1e9
+        if carga > UMBRAL_CARGA_S:
+            estadisticas.cargas.registrar(carga)
+            estadisticas.frio.registrar(segundos)
+            logger.info(f"🧊 Modelo {modelo} cargado en {carga:.1f}s (respuesta en frío {segundos:.1f}s)")
+        else:
+            estadisticas.caliente.registrar(segundos)
+        estadisticas.cargado = True
+
+    def marcar_cargados(self, cargados: List[str]):
+        """Actualiza qué candidatos siguen en memoria de Ollama (según /api/ps)"""
+        for modelo, estadisticas in self.estadisticas.items():
+            estadisticas.cargado = modelo in cargados
+
+    def pendientes(self) -> List[str]:
+        return [modelo for modelo, e in self.estadisticas.items() if not e.cargado]
+
+    def calentar(self, payload_sondeo: Dict = None) -> bool:
+        """
+        Carga en Ollama los candidatos que no estén en memoria y mide una
+        generación de sondeo en caliente. Devuelve False si ya había un
+        calentamiento en curso.
+        """
+        if not self._calentando.acquire(blocking=False):
+            return False
+        try:
+            for modelo in self.pendientes():
+                self._calentar_modelo(modelo, payload_sondeo)
+            return True
+        finally:
+            self._calentando.release()
+
+    def _calentar_modelo(self, modelo: str, payload_sondeo: Dict = None):
+        url = f"{self.ollama_url}/api/generate"
+        try:
+            # Sin prompt Ollama solo carga el modelo y lo mantiene keep_alive
+            inicio = time.time()
+            response = self.session.post(
+                url, json={"model": modelo, "keep_alive": self.keep_alive}, timeout=self.timeout_carga
+            )
+            response.raise_for_status()
+            carga = response.json().get("load_duration", 0) / 1e9
+            if carga > UMBRAL_CARGA_S:
+                self.estadisticas[modelo].cargas.registrar(carga)
+            logger.info(f"🔥 Modelo {modelo} precargado en {time.time() - inicio:.1f}s")
+
+            # Una generación real para conocer su latencia en caliente
+            payload = {**(payload_sondeo or {}), "model": modelo, "prompt": PROMPT_SONDEO,
+                       "stream": False, "keep_alive": self.keep_alive}
+            inicio = time.time()
+            response = self.session.post(url, json=payload, timeout=self.timeout_carga)
+            response.raise_for_status()
+            self.registrar(modelo, response.json(), time.time() - inicio)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo precargar el modelo {modelo}: {e}")
+
+    def resumen(self) -> Dict:
+        return {
+            'actual': self.actual,
+            'objetivo_ms': self.objetivo_ms or None,
+            'modelos': {modelo: e.resumen() for modelo, e in self.estadisticas.items()},
+        }
@@ -1,22 +1,110 @@
+import asyncio
 import logging
 import requests
 import json
+import threading
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from answer_index import AnswerIndex
+from backends import HttpBackend, crear_backend
+from cache import ResponseCache, obtener_cache
+from concurrency import LimitadorConcurrencia, LimitadorConcurrenciaAsync, SingleFlight, SingleFlightAsync
+from config import config
+from gazetteer import Gazetteer
+from http_client import AsyncAgentClient, obtener_sesion
+from metricas import ContadorRutas, VentanaLatencias
+from modelos import SelectorModelo
+from planner import planificar
+from plantillas import numeros_coinciden, redactar
+from texto import normalizar_texto
+import trazas
+from versionado import RecursoVersionado
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+SYSTEM_MEJORA = "Eres un asistente que mejora respuestas técnicas haciéndolas más naturales."
+# Incrementar al cambiar el prompt de mejora para invalidar la caché de respuestas
+PROMPT_VERSION = "1"
+MENSAJE_TIMEOUT = "Los datos están disponibles pero el modelo está tardando en responder. Aquí tienes la información directamente:"
+# Entrada de metricas_rutas para las mejoras no enviadas a Ollama por falta de cupo
+MEJORA_DESCARTADA = "Mejora en segundo plano descartada"
+
 class FastOllamaAgent:
-    def __init__(self):
-        self.ollama_url = "http://localhost:11434"
-        self.api_url = "http://localhost:8000"
-        self.model = "gemma3:1b"
+    def __init__(self, ollama_url: str = None, api_url: str = None, check_connections: bool = True):
+        self.ollama_url = ollama_url or config.OLLAMA_BASE_URL
+        self.api_url = api_url or config.API_BASE_URL
         self.conversation_history = []
         
-        # Verificar conexiones rápidamente
-        self._check_connections()
+        # Sesiones con pool keep-alive compartidas entre consultas
+        self.ollama_session = obtener_sesion(self.ollama_url, config.HTTP_POOL_SIZE)
+        self.api_session = obtener_sesion(self.api_url, config.HTTP_POOL_SIZE)
+        self._async_client = None
+        
+        # Modelos candidatos: precarga, latencia en frío/caliente y elección por objetivo de latencia
+        self.modelos = SelectorModelo(
+            self.ollama_session, self.ollama_url, config.OLLAMA_MODELS,
+            objetivo_ms=config.OLLAMA_LATENCY_TARGET_MS,
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+            timeout_carga=config.OLLAMA_LOAD_TIMEOUT
+        )
+        
+        # Origen de los datos: API por HTTP o capa de consultas en el mismo proceso
+        self.backend = crear_backend(
+            config.DATA_BACKEND, self.api_url, self.api_session, config.DATABASE_PATH, config.API_KEY
+        )
+        
+        # Llamadas simultáneas a Ollama acotadas a su paralelismo y consultas idénticas agrupadas
+        self.limitador_ollama = LimitadorConcurrencia(config.OLLAMA_NUM_PARALLEL)
+        self.coalescedor = SingleFlight()
+        # Equivalentes para el servidor asíncrono (web_asgi.py): las esperas no ocupan hilos
+        self.limitador_ollama_async = LimitadorConcurrenciaAsync(config.OLLAMA_NUM_PARALLEL)
+        self.coalescedor_async = SingleFlightAsync()
+        self._tareas_fondo = set()  # Mejoras que siguen tras agotar el presupuesto (como mucho el cupo)
+        
+        # Presupuesto de latencia: latencias recientes de Ollama y caminos tomados por consulta
+        self.latencias_ollama = VentanaLatencias()
+        self.metricas_rutas = ContadorRutas()
+        self._executor = ThreadPoolExecutor(max_workers=config.HTTP_POOL_SIZE, thread_name_prefix="ollama")
+        # Cupo de generaciones pendientes en el pool: sin él, con el presupuesto agotado la cola crece sin fin
+        self._cupo_fondo = threading.BoundedSemaphore(config.MAX_BACKGROUND_GENERATIONS)
+        # Llamadas a la API de un plan con varias consultas
+        self._executor_api = ThreadPoolExecutor(max_workers=config.HTTP_POOL_SIZE, thread_name_prefix="api")
+        
+        # Entidades (departamentos y municipios) reconstruidas al cambiar la versión de los datos
+        self.gazetteer = RecursoVersionado(
+            "Gazetteer", self.obtener_version_datos, self._construir_gazetteer, ttl=config.DATA_VERSION_TTL
+        )
+        
+        # Respuestas directas precalculadas para las consultas frecuentes
+        self.indice_respuestas = RecursoVersionado(
+            "Índice de respuestas", self.obtener_version_datos, self._construir_indice_respuestas,
+            ttl=config.DATA_VERSION_TTL
+        ) if config.ANSWER_INDEX_ENABLED else None
+        self._licencias_version = (None, None)
+        
+        # Trazas por consulta (etapas y métricas de Ollama), exportadas a JSONL
+        self.registro_trazas = trazas.obtener_registro(
+            config.TRACE_PATH, config.TRACE_MAX_BYTES, config.TRACE_INCLUDE_QUERY
+        ) if config.TRACE_ENABLED else None
+        
+        # Caché de respuestas reformuladas, compartida entre instancias
+        self.cache: Optional[ResponseCache] = (
+            obtener_cache(config.CACHE_PATH, config.CACHE_MAX_ENTRIES) if config.CACHE_ENABLED else None
+        )
+        
+        # Verificar conexiones rápidamente (el servidor web lo hace en segundo plano)
+        if check_connections:
+            self._check_connections()
+            self.calentar_modelos()
+    
+    @property
+    def model(self) -> str:
+        """Modelo de Ollama en uso"""
+        return self.modelos.actual
     
     def _check_connections(self):
         """Verificación rápida de conexiones"""
@@ -24,7 +112,7 @@ class FastOllamaAgent:
         
         # Verificar Ollama rápidamente
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=3)
+            response = self.ollama_session.get(f"{self.ollama_url}/api/tags", timeout=3)
             if response.status_code == 200:
                 logger.info("✅ Ollama conectado")
         except Exception as e:
@@ -33,67 +121,267 @@ class FastOllamaAgent:
         
         # Verificar API rápidamente
         try:
-            response = requests.get(f"{self.api_url}/", timeout=3)
-            if response.status_code == 200:
-                logger.info("✅ API conectada")
+            self.backend.get("/", timeout=3)
+            logger.info("✅ API conectada")
         except Exception as e:
             logger.error(f"❌ API no disponible: {e}")
             raise ConnectionError("API no disponible")
     
+    def verificar_conexiones(self) -> Dict:
+        """Verifica Ollama y la API sin lanzar excepciones (incluye los modelos de Ollama)"""
+        estado = {'ollama_available': False, 'api_available': False, 'modelos': []}
+        try:
+            response = self.ollama_session.get(f"{self.ollama_url}/api/tags", timeout=3)
+            estado['ollama_available'] = response.status_code == 200
+            if estado['ollama_available']:
+                estado['modelos'] = [m['name'] for m in response.json().get('models', [])]
+                self._revisar_modelos_cargados()
+        except Exception as e:
+            logger.debug(f"Ollama no disponible: {e}")
+        
+        try:
+            self.backend.get("/", timeout=3)
+            estado['api_available'] = True
+        except Exception as e:
+            logger.debug(f"API no disponible: {e}")
+        return estado
+    
+    def _revisar_modelos_cargados(self):
+        """Consulta qué modelos siguen en memoria (/api/ps) y precarga los que se descargaron"""
+        try:
+            response = self.ollama_session.get(f"{self.ollama_url}/api/ps", timeout=3)
+            response.raise_for_status()
+            self.modelos.marcar_cargados([m['name'] for m in response.json().get('models', [])])
+        except Exception as e:
+            logger.debug(f"No se pudo consultar /api/ps: {e}")
+            return
+        self.calentar_modelos()
+    
+    def calentar_modelos(self) -> Optional[threading.Thread]:
+        """Precarga en segundo plano los modelos candidatos que no estén en memoria"""
+        if not config.OLLAMA_WARMUP or not self.modelos.pendientes():
+            return None
+        opciones = self._payload_generate("")["options"]
+        hilo = threading.Thread(
+            target=self.modelos.calentar,
+            args=({"options": opciones, "system": SYSTEM_MEJORA},),
+            name="ollama-warmup", daemon=True
+        )
+        hilo.start()
+        return hilo
+    
+    def _payload_generate(self, prompt: str, system_message: str = None, stream: bool = False) -> Dict:
+        """Construye el cuerpo de la petición a /api/generate"""
+        data = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": config.OLLAMA_KEEP_ALIVE,  # Mantener el modelo cargado entre consultas
+            "options": {
+                "temperature": 0.1,  # Más determinístico
+                "num_predict": 150,  # Menos tokens para respuesta más rápida
+                "num_thread": 4,     # Usar más threads si está disponible
+            }
+        }
+        
+        if system_message:
+            data["system"] = system_message
+        return data
+    
     def call_ollama_fast(self, prompt: str, system_message: str = None) -> str:
         """Versión rápida de llamada a Ollama con timeout corto"""
+        start_time = time.time()
         try:
-            data = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Más determinístico
-                    "num_predict": 150,  # Menos tokens para respuesta más rápida
-                    "num_thread": 4,     # Usar más threads si está disponible
-                }
-            }
-            
-            if system_message:
-                data["system"] = system_message
+            data = self._payload_generate(prompt, system_message)
             
             logger.debug(f"Prompt: {prompt[:80]}...")
             
-            start_time = time.time()
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json=data,
-                timeout=15  # Timeout más corto
-            )
+            with self.limitador_ollama:
+                inicio_generacion = time.time()
+                trazas.registrar("ollama.cola", start_time, inicio_generacion)
+                response = self.ollama_session.post(
+                    f"{self.ollama_url}/api/generate",
+                    json=data,
+                    timeout=15  # Timeout más corto
+                )
             response.raise_for_status()
             
             result = response.json()
             respuesta = result.get("response", "").strip()
             elapsed = time.time() - start_time
+            self.latencias_ollama.registrar(elapsed)
+            self.modelos.registrar(data["model"], result, elapsed)
+            trazas.registrar("ollama.generacion", inicio_generacion, time.time(),
+                             modelo=data["model"], **trazas.metricas_ollama(result))
             
             logger.debug(f"Ollama respondió en {elapsed:.2f}s: {respuesta[:80]}...")
             return respuesta
             
         except requests.exceptions.Timeout:
             logger.warning("⚠️ Ollama timeout - usando respuesta predefinida")
-            return "Los datos están disponibles pero el modelo está tardando en responder. Aquí tienes la información directamente:"
+            self.latencias_ollama.registrar(time.time() - start_time)
+            return MENSAJE_TIMEOUT
         except Exception as e:
             logger.error(f"Error Ollama: {e}")
             return ""  # Cadena vacía para usar fallback
     
+    def call_ollama_stream(self, prompt: str, system_message: str = None) -> Iterator[str]:
+        """Llama a Ollama en modo streaming y va entregando los fragmentos generados"""
+        data = self._payload_generate(prompt, system_message, stream=True)
+        
+        # (conexión, lectura): el timeout de lectura aplica entre fragmentos, no al total
+        start_time = time.time()
+        with self.limitador_ollama:
+            inicio_generacion = time.time()
+            trazas.registrar("ollama.cola", start_time, inicio_generacion)
+            with self.ollama_session.post(
+                f"{self.ollama_url}/api/generate",
+                json=data,
+                stream=True,
+                timeout=(3, 15)
+            ) as response:
+                response.raise_for_status()
+                for linea in response.iter_lines():
+                    if not linea:
+                        continue
+                    chunk = json.loads(linea)
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        elapsed = time.time() - start_time
+                        self.latencias_ollama.registrar(elapsed)
+                        self.modelos.registrar(data["model"], chunk, elapsed)
+                        trazas.registrar("ollama.generacion", inicio_generacion, time.time(),
+                                         modelo=data["model"], **trazas.metricas_ollama(chunk))
+                        break
+    
     def call_api(self, endpoint: str, params: Dict = None) -> Optional[Dict]:
-        """Llama a la API REST rápidamente"""
+        """Llama a la API REST rápidamente (o a su capa de consultas, según el backend)"""
         try:
-            url = f"{self.api_url}{endpoint}"
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            with trazas.span("api", endpoint=endpoint):
+                return self.backend.get(endpoint, params)
         except Exception as e:
             logger.error(f"Error API {endpoint}: {e}")
             return None
     
+    @property
+    def async_client(self) -> AsyncAgentClient:
+        """Cliente asíncrono (httpx) creado bajo demanda"""
+        if self._async_client is None:
+            self._async_client = AsyncAgentClient(self.api_url, self.ollama_url, config.HTTP_POOL_SIZE,
+                                                  api_key=config.API_KEY)
+        return self._async_client
+    
+    async def call_api_async(self, endpoint: str, params: Dict = None) -> Optional[Dict]:
+        """Variante asíncrona de call_api"""
+        if not isinstance(self.backend, HttpBackend):
+            return await asyncio.to_thread(self.call_api, endpoint, params)
+        return await self.async_client.call_api(endpoint, params)
+    
+    async def call_ollama_async(self, prompt: str, system_message: str = None) -> str:
+        """Variante asíncrona de call_ollama_fast"""
+        data = self._payload_generate(prompt, system_message)
+        start_time = time.time()
+        try:
+            async with self.limitador_ollama_async:
+                inicio_generacion = time.time()
+                trazas.registrar("ollama.cola", start_time, inicio_generacion)
+                result = await self.async_client.generate(data, timeout=15)
+            elapsed = time.time() - start_time
+            self.latencias_ollama.registrar(elapsed)
+            self.modelos.registrar(data["model"], result, elapsed)
+            trazas.registrar("ollama.generacion", inicio_generacion, time.time(),
+                             modelo=data["model"], **trazas.metricas_ollama(result))
+            return result.get("response", "").strip()
+        except TimeoutError:
+            logger.warning("⚠️ Ollama timeout - usando respuesta predefinida")
+            self.latencias_ollama.registrar(time.time() - start_time)
+            return MENSAJE_TIMEOUT
+        except Exception as e:
+            logger.error(f"Error Ollama async: {e}")
+            return ""
+    
+    async def call_ollama_stream_async(self, prompt: str, system_message: str = None) -> AsyncIterator[str]:
+        """Variante asíncrona de call_ollama_stream"""
+        data = self._payload_generate(prompt, system_message, stream=True)
+        start_time = time.time()
+        async with self.limitador_ollama_async:
+            inicio_generacion = time.time()
+            trazas.registrar("ollama.cola", start_time, inicio_generacion)
+            async for chunk in self.async_client.generate_stream(data):
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    elapsed = time.time() - start_time
+                    self.latencias_ollama.registrar(elapsed)
+                    self.modelos.registrar(data["model"], chunk, elapsed)
+                    trazas.registrar("ollama.generacion", inicio_generacion, time.time(),
+                                     modelo=data["model"], **trazas.metricas_ollama(chunk))
+                    break
+    
+    def obtener_version_datos(self) -> Optional[str]:
+        """Versión de los datos publicada por la API (None si no está disponible)"""
+        datos = self.call_api("/version")
+        return datos.get("version") if datos else None
+    
+    def licencias_de_version(self, version: str) -> List[Dict]:
+        """Todas las licencias, descargadas una sola vez por versión de los datos"""
+        version_cargada, licencias = self._licencias_version
+        if version_cargada != version or licencias is None:
+            licencias = self.obtener_todas_licencias()
+            self._licencias_version = (version, licencias)
+        return licencias
+    
+    def obtener_todas_licencias(self) -> List[Dict]:
+        """Descarga todas las licencias paginando /licencias"""
+        licencias, skip, por_pagina = [], 0, 100
+        while True:
+            datos = self.call_api("/licencias", {"skip": skip, "limit": por_pagina})
+            if datos is None:
+                raise ConnectionError("No se pudieron descargar las licencias")
+            licencias.extend(datos.get("resultados", []))
+            skip += por_pagina
+            if skip >= datos.get("total", 0):
+                return licencias
+    
+    def _construir_gazetteer(self, version: str) -> Gazetteer:
+        with trazas.span("reconstruccion", recurso="gazetteer"), trazas.suspender():
+            return Gazetteer(self.licencias_de_version(version), version)
+    
+    def _construir_indice_respuestas(self, version: str) -> AnswerIndex:
+        with trazas.span("reconstruccion", recurso="indice_respuestas"), trazas.suspender():
+            return AnswerIndex.construir(
+                self.licencias_de_version(version), self.call_api("/estadisticas"), self._respuesta, version
+            )
+    
     def interpretar_consulta_rapida(self, consulta: str) -> Dict:
-        """Interpretación ultra rápida sin Ollama"""
+        """Interpretación ultra rápida sin Ollama: entidades e intenciones en una pasada"""
+        gazetteer = self.gazetteer.obtener()
+        if gazetteer is None:
+            return self._interpretar_por_palabras_clave(consulta)
+        
+        entidades = gazetteer.extraer(consulta)
+        
+        # Un departamento o municipio reconocido se convierte en un filtro exacto
+        filtros = gazetteer.resolver_parametros(entidades)
+        if filtros:
+            return {"accion": "buscar", "parametros": filtros}
+        
+        # Verificar por tipo de consulta (en orden de prioridad)
+        intenciones = entidades["intenciones"]
+        if "estadisticas" in intenciones:
+            return {"accion": "estadisticas", "parametros": {}}
+        elif "buscar" in intenciones:
+            terminos = self._extraer_terminos_busqueda(consulta.lower())
+            return {"accion": "buscar", "parametros": {"q": terminos}}
+        elif "listar" in intenciones:
+            return {"accion": "listar", "parametros": {"limit": 5}}
+        else:
+            # Sin lugar ni intención reconocidos: pregunta abierta
+            return {"accion": "buscar", "parametros": {"q": consulta.lower()}, "abierta": True}
+    
+    def _interpretar_por_palabras_clave(self, consulta: str) -> Dict:
+        """Interpretación por palabras clave, usada si el gazetteer no está disponible"""
         consulta_lower = consulta.lower()
         
         # Palabras clave más específicas
@@ -120,7 +408,7 @@ class FastOllamaAgent:
             return {"accion": "listar", "parametros": {"limit": 5}}
         else:
             # Por defecto, buscar
-            return {"accion": "buscar", "parametros": {"q": consulta_lower}}
+            return {"accion": "buscar", "parametros": {"q": consulta_lower}, "abierta": True}
     
     def _extraer_terminos_busqueda(self, consulta: str) -> str:
         """Extrae términos de búsqueda relevantes"""
@@ -132,21 +420,85 @@ class FastOllamaAgent:
         
         return ' '.join(palabras_filtradas) if palabras_filtradas else consulta
     
+    def resolver_consulta(self, consulta: str) -> Dict:
+        """
+        Respuesta directa sin LLM: una llamada a la API, o varias en paralelo si la consulta lo requiere.
+        Devuelve {"texto", "intencion", "valores", "abierta"}; "valores" alimenta las plantillas.
+        """
+        return self._preparar_consulta(consulta)[1]()
+    
+    def _preparar_consulta(self, consulta: str, gazetteer: Optional[Gazetteer] = None) -> Tuple[Tuple, Callable[[], Dict]]:
+        """
+        Interpreta la consulta y devuelve (clave de la intención, función que obtiene su
+        respuesta directa). Consultas con la misma clave comparten los mismos datos.
+        """
+        with trazas.span("interpretacion") as atributos:
+            plan = planificar(consulta, gazetteer or self.gazetteer.obtener())
+            interpretacion = None if plan else self.interpretar_consulta_rapida(consulta)
+            atributos["accion"] = "plan" if plan else interpretacion["accion"]
+        
+        if plan:
+            logger.info(f"🧭 Plan: {len(plan)} llamadas en paralelo")
+            clave = ("plan",) + tuple(json.dumps(paso["parametros"], sort_keys=True) for paso in plan)
+            return clave, lambda: {**self.resolver_plan(plan), "abierta": False}
+        
+        logger.info(f"🔍 Acción: {interpretacion['accion']}")
+        abierta = interpretacion.get("abierta", False)
+        clave = (interpretacion["accion"], json.dumps(interpretacion["parametros"], sort_keys=True), abierta)
+        return clave, lambda: {
+            **self.resolver_datos(interpretacion["accion"], interpretacion["parametros"]), "abierta": abierta
+        }
+    
+    def obtener_respuesta_directa(self, consulta: str) -> str:
+        """Texto de la respuesta directa (sin LLM)"""
+        return self.resolver_consulta(consulta)["texto"]
+    
+    def resolver_plan(self, plan: List[Dict]) -> Dict:
+        """Ejecuta los pasos del plan concurrentemente y combina los resultados"""
+        resultados = list(self._executor_api.map(
+            trazas.propagar(lambda paso: self.obtener_datos(paso["accion"], paso["parametros"])), plan
+        ))
+        filas = self._resumir_plan(plan, resultados)
+        return self._respuesta("comparacion", {"filas": filas} if any(r for _, r in filas) else None)
+    
+    def resolver_datos(self, accion: str, parametros: Dict) -> Dict:
+        """Obtiene y formatea datos directamente sin Ollama"""
+        with trazas.span("datos", accion=accion) as atributos:
+            # Las consultas frecuentes ya están formateadas en el índice
+            indice = self.indice_respuestas.obtener() if self.indice_respuestas else None
+            if indice:
+                respuesta = indice.obtener(accion, parametros)
+                if respuesta is not None:
+                    atributos["indice"] = True
+                    return respuesta
+            
+            return self._respuesta(accion, self.obtener_datos(accion, parametros))
+    
     def obtener_datos_formateados(self, accion: str, parametros: Dict) -> str:
         """Obtiene y formatea datos directamente sin Ollama"""
-        datos = self.obtener_datos(accion, parametros)
-        
+        return self.resolver_datos(accion, parametros)["texto"]
+    
+    def _respuesta(self, accion: str, datos: Optional[Dict]) -> Dict:
+        """Texto formateado de los datos y valores para redactarlos con plantillas"""
+        with trazas.span("formato", intencion=accion):
+            return self._formatear_respuesta(accion, datos)
+    
+    def _formatear_respuesta(self, accion: str, datos: Optional[Dict]) -> Dict:
         if not datos:
-            return "No se pudieron obtener datos de la API."
+            return {"texto": "No se pudieron obtener datos de la API.", "intencion": None, "valores": None}
         
         if accion == "estadisticas":
-            return self._formatear_estadisticas_directo(datos)
+            return {"texto": self._formatear_estadisticas_directo(datos), "intencion": accion,
+                    "valores": datos.get('totales', {})}
         elif accion == "buscar":
-            return self._formatear_busqueda_directo(datos)
+            return {"texto": self._formatear_busqueda_directo(datos), "intencion": accion, "valores": datos}
         elif accion == "listar":
-            return self._formatear_listado_directo(datos)
+            return {"texto": self._formatear_listado_directo(datos), "intencion": accion, "valores": datos}
+        elif accion == "comparacion":
+            return {"texto": self._formatear_comparacion_directo(datos["filas"]), "intencion": accion,
+                    "valores": datos}
         else:
-            return str(datos)
+            return {"texto": str(datos), "intencion": None, "valores": None}
     
     def _formatear_estadisticas_directo(self, datos: Dict) -> str:
         """Formatea estadísticas directamente"""
@@ -181,6 +533,42 @@ class FastOllamaAgent:
             response += f"{i}. {item.get('municipio', 'N/A')}, {item.get('departamento', 'N/A')} - {item.get('total', 0)} licencias\n"
         return response
     
+    def _resumir_plan(self, plan: List[Dict], resultados: List[Optional[Dict]]) -> List[Tuple[str, Optional[Dict]]]:
+        """Totales por lugar del plan: [(etiqueta, resumen o None si no hubo datos)]"""
+        filas = []
+        for paso, datos in zip(plan, resultados):
+            if not datos:
+                filas.append((paso["etiqueta"], None))
+                continue
+            # Sin agrupar, la API devuelve un único grupo (o ninguno si el lugar no tiene licencias)
+            grupo = (datos.get('grupos') or [{}])[0]
+            resumen = {campo: grupo.get(campo, {}).get('sum', 0)
+                       for campo in ('total', 'no_psico', 'psico', 'semillas')}
+            resumen['municipios'] = grupo.get('municipios', 0)
+            filas.append((paso["etiqueta"], resumen))
+        return filas
+    
+    def _formatear_comparacion_directo(self, filas: List[Tuple[str, Optional[Dict]]]) -> str:
+        """Formatea la comparación de varios lugares"""
+        con_datos = [(etiqueta, resumen) for etiqueta, resumen in filas if resumen]
+        if not con_datos:
+            return "No se pudieron obtener datos de la API."
+        
+        response = "⚖️ **COMPARACIÓN DE LICENCIAS**\n\n"
+        for etiqueta, resumen in filas:
+            if resumen is None:
+                response += f"• **{etiqueta}**: sin datos disponibles\n\n"
+                continue
+            response += f"• **{etiqueta}**: {resumen['total']:,} licencias en {resumen['municipios']} municipio(s)\n"
+            response += f"   No psico: {resumen['no_psico']:,} | "
+            response += f"Psico: {resumen['psico']:,} | "
+            response += f"Semillas: {resumen['semillas']:,}\n\n"
+        
+        if len(con_datos) > 1:
+            etiqueta, resumen = max(con_datos, key=lambda fila: fila[1]['total'])
+            response += f"🏆 Mayor número de licencias: {etiqueta} ({resumen['total']:,})\n"
+        return response
+    
     def obtener_datos(self, accion: str, parametros: Dict) -> Optional[Dict]:
         """Obtiene datos de la API"""
         try:
@@ -188,28 +576,20 @@ class FastOllamaAgent:
                 return self.call_api("/estadisticas")
             elif accion == "buscar":
                 return self.call_api("/licencias/buscar/", parametros)
+            elif accion == "agregados":
+                return self.call_api("/licencias/agregados", parametros)
             elif accion == "listar":
-                return self.call_api("/licencias", {"limit": parametros.get("limit", 5)})
+                # _formatear_listado_directo y la plantilla 'listar' solo usan estos campos
+                return self.call_api("/licencias", {"limit": parametros.get("limit", 5),
+                                                    "fields": "municipio,departamento,total"})
             return None
         except Exception as e:
             logger.error(f"Error obteniendo datos: {e}")
             return None
     
-    def procesar_consulta_hibrida(self, consulta: str) -> str:
-        """Procesamiento híbrido: rápido con opción de mejora con Ollama"""
-        start_time = time.time()
-        
-        try:
-            # Paso 1: Interpretación rápida
-            interpretacion = self.interpretar_consulta_rapida(consulta)
-            logger.info(f"🔍 Acción: {interpretacion['accion']}")
-            
-            # Paso 2: Obtener datos rápidamente
-            datos_brutos = self.obtener_datos_formateados(interpretacion["accion"], interpretacion["parametros"])
-            
-            # Paso 3: Intentar mejora con Ollama (pero con timeout corto)
-            try:
-                prompt_mejora = f"""
+    def _prompt_mejora(self, consulta: str, datos_brutos: str) -> str:
+        """Prompt para que Ollama reformule la respuesta directa"""
+        return f"""
                 El usuario preguntó: "{consulta}"
                 Ya tengo esta respuesta basada en datos reales: "{datos_brutos}"
                 
@@ -217,31 +597,495 @@ class FastOllamaAgent:
                 pero MANTÉN exactamente la misma información y números.
                 Responde directamente con la versión mejorada, sin explicaciones adicionales.
                 """
-                
-                respuesta_mejorada = self.call_ollama_fast(prompt_mejora, 
-                    "Eres un asistente que mejora respuestas técnicas haciéndolas más naturales.")
-                
-                if respuesta_mejorada and len(respuesta_mejorada) > 10:
-                    respuesta_final = respuesta_mejorada
-                    metodo = "Ollama"
-                else:
+    
+    def _clave_cache(self, consulta: str, datos_brutos: str) -> str:
+        """Clave de la caché de respuestas para esta consulta, datos, modelo y prompt"""
+        return ResponseCache.clave(consulta, datos_brutos, self.model, PROMPT_VERSION)
+    
+    def procesar_consulta_hibrida(self, consulta: str, historial: List[Dict] = None) -> str:
+        """
+        Procesamiento híbrido: rápido con opción de mejora con Ollama.
+        Consultas idénticas simultáneas comparten un único procesamiento; el turno se
+        guarda en `historial` (el de la sesión) o en el historial propio del agente.
+        """
+        return self.procesar_consulta_detallada(consulta, historial)["respuesta"]
+    
+    def procesar_consulta_detallada(self, consulta: str, historial: List[Dict] = None) -> Dict:
+        """
+        Igual que procesar_consulta_hibrida, pero devuelve también el camino tomado:
+        {"respuesta", "metodo", "tiempo_ms", "llm_ms"}
+        """
+        resultado = self.coalescedor.hacer(
+            normalizar_texto(consulta), lambda: self._procesar_consulta_hibrida(consulta)
+        )
+        self.metricas_rutas.registrar(resultado["metodo"])
+        
+        if historial is None:
+            historial = self.conversation_history
+        historial.append({"consulta": consulta, "respuesta": resultado["respuesta"]})
+        return resultado
+    
+    def _debe_omitir_llm(self, restante: float, limitador=None) -> bool:
+        """Predice, con la latencia reciente y la cola de Ollama, si no alcanzará el presupuesto"""
+        estimada = self.latencias_ollama.percentil(75)
+        if estimada is None:
+            return False
+        
+        limitador = limitador or self.limitador_ollama
+        if limitador.activos >= limitador.maximo:
+            # Hay que esperar a que se liberen turnos delante de esta petición
+            estimada *= 1 + (limitador.en_espera + 1) / limitador.maximo
+        return estimada > restante
+    
+    def _numeros_validos(self, respuesta: str, datos_brutos: str) -> bool:
+        """Comprueba (si está activado) que la respuesta del LLM conserva los números de los datos"""
+        if not config.VALIDATE_LLM_NUMBERS or numeros_coinciden(respuesta, datos_brutos):
+            return True
+        logger.warning("⚠️ Respuesta del LLM rechazada: sus números no coinciden con los datos")
+        return False
+    
+    def _respuesta_local(self, consulta: str, directa: Dict) -> Optional[Tuple[str, str]]:
+        """
+        (respuesta, método) cuando el LLM no aporta: en modo 'directo' siempre y en modo
+        'plantilla' si la consulta se entendió; None si hay que pedir la mejora al LLM
+        """
+        modo = config.RESPONSE_MODE
+        if modo == "directo" or directa["intencion"] is None:
+            return directa["texto"], "Directo"
+        if modo == "plantilla" and not directa["abierta"]:
+            with trazas.span("plantilla", intencion=directa["intencion"]):
+                return redactar(directa["intencion"], directa["valores"], consulta), "Plantilla"
+        return None
+    
+    def _redactar_o_directo(self, consulta: str, directa: Dict) -> str:
+        """Respuesta con plantilla si la intención la tiene, si no el texto directo"""
+        if directa["intencion"] is None:
+            return directa["texto"]
+        return redactar(directa["intencion"], directa["valores"], consulta)
+    
+    def _mejorar(self, prompt_mejora: str, clave_cache: str, datos_brutos: str) -> str:
+        """Llama a Ollama y guarda en caché la respuesta si es válida"""
+        respuesta = self.call_ollama_fast(prompt_mejora, SYSTEM_MEJORA)
+        if (self.cache and len(respuesta) > 10 and respuesta != MENSAJE_TIMEOUT
+                and self._numeros_validos(respuesta, datos_brutos)):
+            self.cache.guardar(clave_cache, respuesta)
+        return respuesta
+    
+    def _mejorar_con_presupuesto(self, prompt_mejora: str, clave_cache: str, datos_brutos: str,
+                                 restante: Optional[float]) -> Optional[str]:
+        """
+        Espera la mejora de Ollama como mucho `restante` segundos (None = sin límite).
+        Si se agota el presupuesto devuelve None; la generación sigue en segundo plano
+        y su resultado queda en caché para la próxima consulta igual.
+        """
+        if restante is None:
+            return self._mejorar(prompt_mejora, clave_cache, datos_brutos)
+        
+        futuro = self._encolar_mejora(trazas.propagar(self._mejorar), prompt_mejora, clave_cache, datos_brutos)
+        if futuro is None:
+            return None
+        try:
+            return futuro.result(timeout=max(restante, 0))
+        except FuturesTimeout:
+            return None
+    
+    def _encolar_mejora(self, mejorar: Callable[[str, str, str], str], *args) -> Optional[Future]:
+        """Envía la mejora al pool si queda cupo; si no, la descarta (None) y lo cuenta en las métricas"""
+        if not self._cupo_fondo.acquire(blocking=False):
+            self.metricas_rutas.registrar(MEJORA_DESCARTADA)
+            return None
+        futuro = self._executor.submit(mejorar, *args)
+        futuro.add_done_callback(lambda _: self._cupo_fondo.release())
+        return futuro
+    
+    def procesar_lote(self, consultas: List[str]) -> Iterator[Dict]:
+        """
+        Procesa un lote de consultas independientes: no leen ni escriben ningún historial
+        (ni el del agente ni el de una sesión). Primero obtiene una sola vez los datos de
+        cada intención distinta y después redacta las respuestas con paralelismo acotado
+        (BATCH_PARALLEL; Ollama sigue limitado por su semáforo).
+        Entrega cada resultado en cuanto termina y al final un resumen.
+        """
+        inicio = time.time()
+        gazetteer = self.gazetteer.obtener()
+        
+        claves, tareas = [], {}
+        for consulta in consultas:
+            clave, resolver = self._preparar_consulta(consulta, gazetteer)
+            claves.append(clave)
+            tareas.setdefault(clave, resolver)
+        
+        with ThreadPoolExecutor(max_workers=config.BATCH_PARALLEL, thread_name_prefix="lote") as executor:
+            # Paso 1: datos de cada intención distinta
+            inicio_datos = time.time()
+            directas = dict(zip(tareas, executor.map(lambda resolver: resolver(), tareas.values())))
+            datos_ms = round((time.time() - inicio_datos) * 1000, 1)
+            
+            # Paso 2: redacción (plantilla, caché o LLM) de cada consulta
+            def procesar(indice: int):
+                consulta = consultas[indice]
+                resultado = self.coalescedor.hacer(
+                    normalizar_texto(consulta),
+                    lambda: self._procesar_consulta_hibrida(consulta, directas[claves[indice]])
+                )
+                self.metricas_rutas.registrar(resultado["metodo"])
+                return {"tipo": "resultado", "indice": indice, "consulta": consulta, **resultado,
+                        "total_ms": round((time.time() - inicio) * 1000, 1)}
+            
+            futuros = [executor.submit(procesar, indice) for indice in range(len(consultas))]
+            for futuro in as_completed(futuros):
+                yield futuro.result()
+        
+        yield {
+            "tipo": "resumen",
+            "consultas": len(consultas),
+            "llamadas_datos": len(tareas),
+            "datos_ms": datos_ms,
+            "tiempo_ms": round((time.time() - inicio) * 1000, 1),
+        }
+    
+    def _procesar_consulta_hibrida(self, consulta: str, directa: Dict = None) -> Dict:
+        with trazas.traza("consulta", self.registro_trazas, consulta=consulta) as traza:
+            resultado = self._responder(consulta, directa)
+            if traza:
+                traza.atributos["metodo"] = resultado["metodo"]
+            return resultado
+    
+    def _antes_del_llm(self, consulta: str, directa: Dict, start_time: float, limitador=None,
+                       sondear: Callable[[str, str, str], None] = None
+                       ) -> Tuple[Optional[Tuple[str, str]], str, Optional[float]]:
+        """
+        Respuesta local con plantilla si el LLM no aporta; si no, la de la caché o la directa
+        si Ollama no llegaría a tiempo. Devuelve ((respuesta, método) o None si hay que
+        pedir la mejora al LLM, clave de caché, presupuesto restante en segundos).
+        `sondear(prompt, clave, datos)` lanza el sondeo de latencia (por defecto en el pool de hilos)
+        """
+        datos_brutos = directa["texto"]
+        local = self._respuesta_local(consulta, directa)
+        clave_cache = self._clave_cache(consulta, datos_brutos)
+        with trazas.span("cache"):
+            respuesta_cacheada = self.cache.obtener(clave_cache) if self.cache and not local else None
+        presupuesto = config.LATENCY_BUDGET_MS / 1000
+        restante = presupuesto - (time.time() - start_time) if presupuesto > 0 else None
+        
+        if local:
+            return local, clave_cache, restante
+        if respuesta_cacheada:
+            return (respuesta_cacheada, "Ollama (caché)"), clave_cache, restante
+        if restante is not None and self._debe_omitir_llm(restante, limitador):
+            # Sin observaciones recientes la estimación no se actualizaría nunca: sondear en segundo plano
+            if self.latencias_ollama.antiguedad() > config.LATENCY_PROBE_INTERVAL:
+                sondear = sondear or (lambda *args: self._encolar_mejora(self._mejorar, *args))
+                sondear(self._prompt_mejora(consulta, datos_brutos), clave_cache, datos_brutos)
+            return (datos_brutos, "Directo (omitido por latencia)"), clave_cache, restante
+        return None, clave_cache, restante
+    
+    def _despues_del_llm(self, consulta: str, directa: Dict, respuesta_mejorada: Optional[str]) -> Tuple[str, str]:
+        """(respuesta, método) a partir de la mejora de Ollama (None = presupuesto agotado)"""
+        datos_brutos = directa["texto"]
+        if respuesta_mejorada is None:
+            return datos_brutos, "Directo (presupuesto agotado)"
+        if respuesta_mejorada == MENSAJE_TIMEOUT:
+            return f"{MENSAJE_TIMEOUT}\n\n{datos_brutos}", "Directo (timeout)"
+        if len(respuesta_mejorada) > 10 and not self._numeros_validos(respuesta_mejorada, datos_brutos):
+            return self._redactar_o_directo(consulta, directa), "Plantilla (LLM rechazado)"
+        if len(respuesta_mejorada) > 10:
+            return respuesta_mejorada, "Ollama"
+        return datos_brutos, "Directo"
+    
+    def _resultado(self, respuesta: str, metodo: str, start_time: float, llm_ms: Optional[float]) -> Dict:
+        elapsed = time.time() - start_time
+        if metodo != "Error":
+            logger.info(f"✅ Procesado en {elapsed:.2f}s usando {metodo}")
+        return {
+            "respuesta": respuesta,
+            "metodo": metodo,
+            "tiempo_ms": round(elapsed * 1000, 1),
+            "llm_ms": llm_ms,
+        }
+    
+    def _responder(self, consulta: str, directa: Dict = None) -> Dict:
+        start_time = time.time()
+        llm_ms = None
+        
+        try:
+            # Paso 1 y 2: Interpretación rápida y datos (varias llamadas en paralelo si hace falta)
+            if directa is None:
+                directa = self.resolver_consulta(consulta)
+            datos_brutos = directa["texto"]
+            
+            # Paso 3: Plantilla, caché o respuesta directa; si no, mejora con Ollama dentro del presupuesto
+            decidida, clave_cache, restante = self._antes_del_llm(consulta, directa, start_time)
+            if decidida:
+                respuesta_final, metodo = decidida
+            else:
+                try:
+                    inicio_llm = time.time()
+                    prompt_mejora = self._prompt_mejora(consulta, datos_brutos)
+                    respuesta_mejorada = self._mejorar_con_presupuesto(prompt_mejora, clave_cache, datos_brutos, restante)
+                    llm_ms = round((time.time() - inicio_llm) * 1000, 1)
+                    respuesta_final, metodo = self._despues_del_llm(consulta, directa, respuesta_mejorada)
+                except Exception as e:
                     respuesta_final = datos_brutos
-                    metodo = "Directo"
+                    metodo = "Directo (fallback)"
+                    logger.warning(f"Ollama falló, usando directo: {e}")
+            
+            return self._resultado(respuesta_final, metodo, start_time, llm_ms)
+            
+        except Exception as e:
+            error_msg = f"❌ Error: {str(e)}"
+            logger.error(error_msg)
+            return self._resultado(error_msg, "Error", start_time, llm_ms)
+
+    def procesar_consulta_stream(self, consulta: str, historial: List[Dict] = None) -> Iterator[Dict]:
+        """
+        Procesamiento en streaming: entrega primero la respuesta directa y luego
+        los fragmentos de la versión mejorada por Ollama a medida que se generan
+        """
+        with trazas.traza("consulta_stream", self.registro_trazas, consulta=consulta) as traza:
+            for evento in self._responder_stream(consulta, historial):
+                if traza and evento["tipo"] == "fin":
+                    traza.atributos["metodo"] = evento["metodo"]
+                yield evento
+    
+    def _responder_stream(self, consulta: str, historial: List[Dict] = None) -> Iterator[Dict]:
+        start_time = time.time()
+        
+        try:
+            directa = self.resolver_consulta(consulta)
+            datos_brutos = directa["texto"]
+            local = self._respuesta_local(consulta, directa)
+            yield {"tipo": "directo", "texto": local[0] if local else datos_brutos}
+            
+            metodo = "Directo"
+            respuesta_final = datos_brutos
+            clave_cache = self._clave_cache(consulta, datos_brutos)
+            with trazas.span("cache"):
+                respuesta_cacheada = self.cache.obtener(clave_cache) if self.cache and not local else None
+            fragmentos = []
+            try:
+                presupuesto = config.LATENCY_BUDGET_MS / 1000
+                if local:
+                    respuesta_final, metodo = local
+                elif respuesta_cacheada:
+                    yield {"tipo": "token", "texto": respuesta_cacheada}
+                    metodo = "Ollama (caché)"
+                    respuesta_final = respuesta_cacheada
+                elif presupuesto > 0 and self._debe_omitir_llm(presupuesto - (time.time() - start_time)):
+                    # La respuesta directa ya se envió: no encolar una generación que llegaría tarde
+                    metodo = "Directo (omitido por latencia)"
+                else:
+                    prompt_mejora = self._prompt_mejora(consulta, datos_brutos)
+                    for fragmento in self.call_ollama_stream(prompt_mejora, SYSTEM_MEJORA):
+                        fragmentos.append(fragmento)
+                        yield {"tipo": "token", "texto": fragmento}
                     
+                    respuesta_mejorada = "".join(fragmentos).strip()
+                    if len(respuesta_mejorada) > 10 and not self._numeros_validos(respuesta_mejorada, datos_brutos):
+                        # El cliente vuelve a mostrar la respuesta directa
+                        metodo = "Directo (LLM rechazado)"
+                    elif len(respuesta_mejorada) > 10:
+                        metodo = "Ollama (stream)"
+                        respuesta_final = respuesta_mejorada
+                        if self.cache:
+                            self.cache.guardar(clave_cache, respuesta_mejorada)
             except Exception as e:
-                respuesta_final = datos_brutos
+                # Si ya se enviaron fragmentos el cliente decide si conserva la respuesta directa
                 metodo = "Directo (fallback)"
-                logger.warning(f"Ollama falló, usando directo: {e}")
+                logger.warning(f"Ollama stream falló, usando directo: {e}")
+            
+            if historial is None:
+                historial = self.conversation_history
+            historial.append({"consulta": consulta, "respuesta": respuesta_final})
             
             elapsed = time.time() - start_time
-            logger.info(f"✅ Procesado en {elapsed:.2f}s usando {metodo}")
+            logger.info(f"✅ Stream procesado en {elapsed:.2f}s usando {metodo}")
+            self.metricas_rutas.registrar(metodo)
+            yield {"tipo": "fin", "metodo": metodo, "tiempo": round(elapsed, 3)}
+            
+        except Exception as e:
+            error_msg = f"❌ Error: {str(e)}"
+            logger.error(error_msg)
+            yield {"tipo": "error", "texto": error_msg}
+
+    async def procesar_consulta_async(self, consulta: str, historial: List[Dict] = None) -> Dict:
+        """
+        Variante asíncrona de procesar_consulta_detallada para servidores ASGI: la
+        espera de Ollama no ocupa un hilo. Los datos, la caché y las plantillas
+        (rápidos y bloqueantes) se resuelven en el pool de hilos de asyncio.
+        """
+        resultado = await self.coalescedor_async.hacer(
+            normalizar_texto(consulta), lambda: self._procesar_consulta_hibrida_async(consulta)
+        )
+        self.metricas_rutas.registrar(resultado["metodo"])
+        
+        if historial is None:
+            historial = self.conversation_history
+        historial.append({"consulta": consulta, "respuesta": resultado["respuesta"]})
+        return resultado
+    
+    async def _procesar_consulta_hibrida_async(self, consulta: str) -> Dict:
+        with trazas.traza("consulta", self.registro_trazas, consulta=consulta) as traza:
+            resultado = await self._responder_async(consulta)
+            if traza:
+                traza.atributos["metodo"] = resultado["metodo"]
+            return resultado
+    
+    async def _responder_async(self, consulta: str) -> Dict:
+        start_time = time.time()
+        llm_ms = None
+        
+        try:
+            directa = await asyncio.to_thread(self.resolver_consulta, consulta)
+            datos_brutos = directa["texto"]
+            
+            decidida, clave_cache, restante = await asyncio.to_thread(
+                self._antes_del_llm, consulta, directa, start_time, self.limitador_ollama_async,
+                self._sondeo_async()
+            )
+            if decidida:
+                respuesta_final, metodo = decidida
+            else:
+                try:
+                    inicio_llm = time.time()
+                    prompt_mejora = self._prompt_mejora(consulta, datos_brutos)
+                    respuesta_mejorada = await self._mejorar_con_presupuesto_async(
+                        prompt_mejora, clave_cache, datos_brutos, restante
+                    )
+                    llm_ms = round((time.time() - inicio_llm) * 1000, 1)
+                    respuesta_final, metodo = self._despues_del_llm(consulta, directa, respuesta_mejorada)
+                except Exception as e:
+                    respuesta_final = datos_brutos
+                    metodo = "Directo (fallback)"
+                    logger.warning(f"Ollama falló, usando directo: {e}")
             
-            return respuesta_final
+            return self._resultado(respuesta_final, metodo, start_time, llm_ms)
             
         except Exception as e:
             error_msg = f"❌ Error: {str(e)}"
             logger.error(error_msg)
-            return error_msg
+            return self._resultado(error_msg, "Error", start_time, llm_ms)
+    
+    def _en_segundo_plano(self, corrutina) -> Optional[asyncio.Task]:
+        """
+        Tarea que sigue aunque nadie la espere (se guarda la referencia hasta que termina).
+        Con MAX_BACKGROUND_GENERATIONS tareas pendientes se descarta (None) y se cuenta
+        """
+        if len(self._tareas_fondo) >= config.MAX_BACKGROUND_GENERATIONS:
+            corrutina.close()
+            self.metricas_rutas.registrar(MEJORA_DESCARTADA)
+            return None
+        tarea = asyncio.ensure_future(corrutina)
+        self._tareas_fondo.add(tarea)
+        tarea.add_done_callback(self._tareas_fondo.discard)
+        return tarea
+    
+    def _sondeo_async(self) -> Callable[[str, str, str], None]:
+        """
+        Sondeo de latencia para _antes_del_llm (que corre en un hilo) en el event loop actual:
+        usa el cliente asíncrono y su limitador, no el pool de hilos ni el limitador síncrono
+        """
+        loop = asyncio.get_running_loop()
+        return lambda *args: loop.call_soon_threadsafe(
+            lambda: self._en_segundo_plano(self._mejorar_async(*args))
+        )
+    
+    async def _mejorar_async(self, prompt_mejora: str, clave_cache: str, datos_brutos: str) -> str:
+        """Variante asíncrona de _mejorar"""
+        respuesta = await self.call_ollama_async(prompt_mejora, SYSTEM_MEJORA)
+        if (self.cache and len(respuesta) > 10 and respuesta != MENSAJE_TIMEOUT
+                and self._numeros_validos(respuesta, datos_brutos)):
+            await asyncio.to_thread(self.cache.guardar, clave_cache, respuesta)
+        return respuesta
+    
+    async def _mejorar_con_presupuesto_async(self, prompt_mejora: str, clave_cache: str, datos_brutos: str,
+                                             restante: Optional[float]) -> Optional[str]:
+        """Variante asíncrona de _mejorar_con_presupuesto"""
+        if restante is None:
+            return await self._mejorar_async(prompt_mejora, clave_cache, datos_brutos)
+        
+        tarea = self._en_segundo_plano(self._mejorar_async(prompt_mejora, clave_cache, datos_brutos))
+        if tarea is None:
+            return None
+        try:
+            # shield: al vencer el plazo la generación sigue y su resultado queda en caché
+            return await asyncio.wait_for(asyncio.shield(tarea), max(restante, 0))
+        except asyncio.TimeoutError:
+            return None
+    
+    async def procesar_consulta_stream_async(self, consulta: str, historial: List[Dict] = None) -> AsyncIterator[Dict]:
+        """Variante asíncrona de procesar_consulta_stream (mismos eventos)"""
+        with trazas.traza("consulta_stream", self.registro_trazas, consulta=consulta) as traza:
+            async for evento in self._responder_stream_async(consulta, historial):
+                if traza and evento["tipo"] == "fin":
+                    traza.atributos["metodo"] = evento["metodo"]
+                yield evento
+    
+    async def _responder_stream_async(self, consulta: str, historial: List[Dict] = None) -> AsyncIterator[Dict]:
+        start_time = time.time()
+        
+        try:
+            directa = await asyncio.to_thread(self.resolver_consulta, consulta)
+            datos_brutos = directa["texto"]
+            local = self._respuesta_local(consulta, directa)
+            yield {"tipo": "directo", "texto": local[0] if local else datos_brutos}
+            
+            metodo = "Directo"
+            respuesta_final = datos_brutos
+            fragmentos = []
+            try:
+                decidida, clave_cache, _ = await asyncio.to_thread(
+                    self._antes_del_llm, consulta, directa, start_time, self.limitador_ollama_async,
+                    self._sondeo_async()
+                )
+                if decidida:
+                    respuesta_final, metodo = decidida
+                    if metodo == "Ollama (caché)":
+                        yield {"tipo": "token", "texto": respuesta_final}
+                else:
+                    prompt_mejora = self._prompt_mejora(consulta, datos_brutos)
+                    async for fragmento in self.call_ollama_stream_async(prompt_mejora, SYSTEM_MEJORA):
+                        fragmentos.append(fragmento)
+                        yield {"tipo": "token", "texto": fragmento}
+                    
+                    respuesta_mejorada = "".join(fragmentos).strip()
+                    if len(respuesta_mejorada) > 10 and not self._numeros_validos(respuesta_mejorada, datos_brutos):
+                        # El cliente vuelve a mostrar la respuesta directa
+                        metodo = "Directo (LLM rechazado)"
+                    elif len(respuesta_mejorada) > 10:
+                        metodo = "Ollama (stream)"
+                        respuesta_final = respuesta_mejorada
+                        if self.cache:
+                            await asyncio.to_thread(self.cache.guardar, clave_cache, respuesta_mejorada)
+            except Exception as e:
+                # Si ya se enviaron fragmentos el cliente decide si conserva la respuesta directa
+                metodo = "Directo (fallback)"
+                logger.warning(f"Ollama stream falló, usando directo: {e}")
+            
+            if historial is None:
+                historial = self.conversation_history
+            historial.append({"consulta": consulta, "respuesta": respuesta_final})
+            
+            elapsed = time.time() - start_time
+            logger.info(f"✅ Stream procesado en {elapsed:.2f}s usando {metodo}")
+            self.metricas_rutas.registrar(metodo)
+            yield {"tipo": "fin", "metodo": metodo, "tiempo": round(elapsed, 3)}
+            
+        except Exception as e:
+            error_msg = f"❌ Error: {str(e)}"
+            logger.error(error_msg)
+            yield {"tipo": "error", "texto": error_msg}
+
+def leer_lote(ruta: str) -> List[str]:
+    """Consultas de un archivo de texto: una por línea (se ignoran vacías y las que empiezan por #)"""
+    with open(ruta, encoding="utf-8") as archivo:
+        return [linea.strip() for linea in archivo if linea.strip() and not linea.lstrip().startswith("#")]
+
+def main_lote(ruta: str):
+    """Procesa un archivo de consultas y escribe un resultado NDJSON por línea en la salida estándar"""
+    agente = FastOllamaAgent(check_connections=False)
+    for resultado in agente.procesar_lote(leer_lote(ruta)):
+        print(json.dumps(resultado, ensure_ascii=False), flush=True)
 
 # Interfaz optimizada
 def main():
@@ -250,7 +1094,7 @@ def main():
     
     try:
         agente = FastOllamaAgent()
-        print("✅ Agente listo (usando Gemma 3 1B para mayor velocidad)")
+        print(f"✅ Agente listo (usando {agente.model})")
         print("💡 Escribe tu consulta o 'salir' para terminar\n")
         
         while True:
@@ -282,4 +1126,13 @@ def main():
         print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Asistente de licencias de cannabis")
+    parser.add_argument("--lote", metavar="ARCHIVO", help="Procesar un archivo de consultas (una por línea) y emitir NDJSON")
+    args = parser.parse_args()
+    
+    if args.lote:
+        main_lote(args.lote)
+    else:
+        main()
\ No newline at end of file
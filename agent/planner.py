@@ -0,0 +1,41 @@
+# agent/planner.py
+from typing import Dict, List, Optional
+
+from gazetteer import Gazetteer
+
+# Máximo de llamadas a la API que puede generar una sola consulta
+MAX_PASOS = 6
+
+# Sumas por lugar calculadas por la API (/licencias/agregados), sin paginar
+CAMPOS_POR_LUGAR = "no_psico,psico,semillas,total"
+
+
+def etiqueta_filtro(filtros: Dict) -> str:
+    """Nombre legible del lugar al que corresponde un filtro"""
+    if 'municipio' in filtros and 'departamento' in filtros:
+        return f"{filtros['municipio']}, {filtros['departamento']}"
+    return filtros.get('municipio') or filtros.get('departamento', '')
+
+
+def planificar(consulta: str, gazetteer: Optional[Gazetteer]) -> Optional[List[Dict]]:
+    """
+    Descompone una consulta que menciona varios lugares ("compara Antioquia y Huila")
+    en una llamada a /licencias/agregados por lugar (sumas de todos sus municipios).
+    Devuelve None si basta una sola llamada (la consulta se resuelve con
+    interpretar_consulta_rapida).
+    """
+    if gazetteer is None:
+        return None
+
+    filtros = gazetteer.resolver_todos(gazetteer.extraer(consulta))
+    if len(filtros) < 2:
+        return None
+
+    return [
+        {
+            "accion": "agregados",
+            "parametros": {**f, "agrupar_por": "", "campos": CAMPOS_POR_LUGAR, "agregados": "sum"},
+            "etiqueta": etiqueta_filtro(f),
+        }
+        for f in filtros[:MAX_PASOS]
+    ]
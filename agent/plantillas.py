@@ -0,0 +1,155 @@
+# agent/plantillas.py
+"""
+Redacción local de respuestas: varias plantillas en lenguaje natural por
+intención, rellenadas con los valores de la API, y validación de que una
+respuesta del LLM conserva los números de los datos.
+"""
+import re
+import zlib
+from typing import Dict, List, Set
+
+from texto import normalizar_texto
+
+VARIANTES = {
+    "estadisticas": [
+        "En total hay {total_licencias:,} licencias de cannabis en {total_municipios} municipios: "
+        "{total_no_psico:,} no psicoactivas, {total_psico:,} psicoactivas y {total_semillas:,} de semillas. "
+        "En promedio son {promedio_por_municipio:.1f} licencias por municipio.",
+        "Los datos registran {total_licencias:,} licencias repartidas en {total_municipios} municipios "
+        "({promedio_por_municipio:.1f} por municipio en promedio). De ellas, {total_no_psico:,} son no "
+        "psicoactivas, {total_psico:,} psicoactivas y {total_semillas:,} de semillas.",
+        "Actualmente {total_municipios} municipios tienen licencias y suman {total_licencias:,}. Por tipo: "
+        "{total_no_psico:,} no psicoactivas, {total_psico:,} psicoactivas y {total_semillas:,} de semillas; "
+        "el promedio es de {promedio_por_municipio:.1f} por municipio.",
+    ],
+    "buscar_uno": [
+        "{municipio} ({departamento}) tiene {total:,} licencias: {no_psico:,} no psicoactivas, "
+        "{psico:,} psicoactivas y {semillas:,} de semillas.",
+        "En {municipio}, {departamento}, hay {total:,} licencias en total ({no_psico:,} no psicoactivas, "
+        "{psico:,} psicoactivas y {semillas:,} de semillas).",
+        "Para {municipio} ({departamento}) se registran {total:,} licencias; {no_psico:,} son no "
+        "psicoactivas, {psico:,} psicoactivas y {semillas:,} de semillas.",
+    ],
+    "buscar_varios": [
+        "Encontré {total_resultados} municipios. Los que más licencias tienen son {destacados}.",
+        "Hay {total_resultados} municipios que coinciden con tu búsqueda; destacan {destacados}.",
+        "Tu búsqueda devuelve {total_resultados} municipios, encabezados por {destacados}.",
+    ],
+    "buscar_vacio": [
+        "No encontré licencias que coincidan con tu búsqueda.",
+        "No hay municipios con licencias que coincidan con lo que buscas.",
+    ],
+    "listar": [
+        "De los {total_municipios} municipios con licencias, los que más tienen son {destacados}.",
+        "Hay {total_municipios} municipios con licencias; a la cabeza están {destacados}.",
+        "Los municipios con más licencias (de {total_municipios} en total) son {destacados}.",
+    ],
+    "comparacion": [
+        "{comparados}. El que más licencias tiene es {ganador}.",
+        "Comparando: {comparados}. {ganador} queda por delante.",
+    ],
+}
+
+DESTACADO = "{lugar} con {total:,}"
+COMPARADO = "{etiqueta} suma {total:,} licencias en {municipios} municipio(s)"
+SIN_DATOS = "{etiqueta} no tiene datos disponibles"
+
+
+def _enumerar(partes: List[str]) -> str:
+    """'a', 'a y b', 'a, b y c'"""
+    if len(partes) <= 1:
+        return "".join(partes)
+    return f"{', '.join(partes[:-1])} y {partes[-1]}"
+
+
+def _destacado(item: Dict) -> str:
+    # Bogotá D.C. es a la vez municipio y departamento
+    lugar = item['municipio'] if item['municipio'] == item['departamento'] else f"{item['municipio']} ({item['departamento']})"
+    return DESTACADO.format(lugar=lugar, total=item['total'])
+
+
+def _elegir(intencion: str, semilla: str) -> str:
+    """Variante estable para la misma consulta y distinta entre consultas"""
+    variantes = VARIANTES[intencion]
+    return variantes[zlib.crc32(normalizar_texto(semilla).encode()) % len(variantes)]
+
+
+def redactar(intencion: str, valores: Dict, semilla: str = "") -> str:
+    """Respuesta en lenguaje natural para una intención ('estadisticas', 'buscar', 'listar', 'comparacion')"""
+    if intencion == "estadisticas":
+        return _elegir("estadisticas", semilla).format(**valores)
+
+    if intencion == "buscar":
+        resultados = valores["resultados"]
+        if not resultados:
+            return _elegir("buscar_vacio", semilla)
+        if valores["total"] == 1:
+            return _elegir("buscar_uno", semilla).format(**resultados[0])
+        destacados = _enumerar([_destacado(item) for item in resultados[:3]])
+        return _elegir("buscar_varios", semilla).format(total_resultados=valores["total"], destacados=destacados)
+
+    if intencion == "listar":
+        destacados = _enumerar([_destacado(item) for item in valores["resultados"][:5]])
+        return _elegir("listar", semilla).format(total_municipios=valores["total"], destacados=destacados)
+
+    if intencion == "comparacion":
+        filas = valores["filas"]
+        comparados = _enumerar([
+            COMPARADO.format(etiqueta=etiqueta, **resumen) if resumen else SIN_DATOS.format(etiqueta=etiqueta)
+            for etiqueta, resumen in filas
+        ])
+        con_datos = [(etiqueta, resumen) for etiqueta, resumen in filas if resumen]
+        if not con_datos:
+            # Sin ningún lugar con datos no hay ganador que nombrar
+            texto = f"{comparados}."
+        else:
+            ganador = max(con_datos, key=lambda fila: fila[1]['total'])[0]
+            texto = _elegir("comparacion", semilla).format(comparados=comparados, ganador=ganador)
+        return texto[0].upper() + texto[1:]
+
+    raise ValueError(f"Intención sin plantillas: {intencion}")
+
+
+# Números con separador de miles (1,234 o 1.234) o decimales (12.5 o 12,5)
+_NUMERO = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def _interpretaciones(token: str) -> Set[float]:
+    """Valores posibles de un número escrito con convenciones inglesas o españolas"""
+    valores = set()
+    for miles, decimal in ((",", "."), (".", ",")):
+        partes = token.split(decimal)
+        if len(partes) > 2:
+            continue
+        entero = partes[0]
+        grupos = entero.split(miles)
+        if len(grupos) > 1 and not all(len(g) == 3 for g in grupos[1:]):
+            continue
+        try:
+            valores.add(float("".join(grupos) + ("." + partes[1] if len(partes) == 2 else "")))
+        except ValueError:
+            pass
+    return valores
+
+
+def numeros(texto: str) -> List[Set[float]]:
+    """Números del texto (cada uno con sus interpretaciones posibles)"""
+    return [v for v in (_interpretaciones(t) for t in _NUMERO.findall(texto)) if v]
+
+
+def numeros_coinciden(respuesta: str, datos_brutos: str) -> bool:
+    """
+    True si cada número de la respuesta está en los datos (admitiendo redondeo
+    a entero o a un decimal) y la respuesta conserva al menos uno cuando los
+    datos tienen números
+    """
+    fuente = set()
+    for interpretaciones in numeros(datos_brutos):
+        for valor in interpretaciones:
+            fuente.update({valor, round(valor), round(valor, 1)})
+
+    encontrados = numeros(respuesta)
+    if fuente and not encontrados:
+        return False
+    return all(interpretaciones & fuente for interpretaciones in encontrados)
+
@@ -0,0 +1,105 @@
+# agent/test_answer_index.py
+"""
+Pruebas del índice de respuestas precalculadas (agent/answer_index.py): las
+respuestas del índice son las mismas que las obtenidas de la API y se
+reconstruyen al cambiar la versión de los datos. No requieren Ollama ni la API.
+
+    python -m pytest agent/test_answer_index.py
+"""
+import os
+import sqlite3
+import sys
+
+os.environ.setdefault("CACHE_ENABLED", "False")
+os.environ.setdefault("TRACE_ENABLED", "False")
+os.environ.setdefault("DB_ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sin-artefacto"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from answer_index import POR_PAGINA_BUSQUEDA, AnswerIndex
+from backends import InProcessBackend
+from ollama import FastOllamaAgent
+from versionado import RecursoVersionado
+
+# Más municipios que una página de /licencias/buscar/
+MUNICIPIOS_ANTIOQUIA = POR_PAGINA_BUSQUEDA + 5
+
+
+@pytest.fixture
+def agente(tmp_path):
+    db_path = str(tmp_path / "licencias.db")
+    filas = [("Antioquia", f"Municipio {i}", 1, 1, 0, 2) for i in range(MUNICIPIOS_ANTIOQUIA)]
+    filas += [("Huila", "Neiva", 5, 5, 0, 10), ("Huila", "Pitalito", 2, 1, 1, 4),
+              ("Nariño", "La Unión", 1, 0, 0, 1), ("Antioquia", "La Unión", 3, 0, 0, 3)]
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE licencias (id INTEGER PRIMARY KEY, departamento TEXT, municipio TEXT,
+                    no_psico INTEGER, psico INTEGER, semillas INTEGER, total INTEGER)""")
+    conn.executemany("INSERT INTO licencias (departamento, municipio, no_psico, psico, semillas, total) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", filas)
+    conn.commit()
+    conn.close()
+
+    agente = FastOllamaAgent(check_connections=False)
+    agente.cache = None
+    agente.registro_trazas = None
+    agente.indice_respuestas = None
+    agente.backend = InProcessBackend(db_path)
+    return agente
+
+
+@pytest.mark.parametrize("accion, parametros", [
+    ("estadisticas", {}),
+    ("listar", {}),
+    ("listar", {"limit": 3}),
+    ("buscar", {"departamento": "Huila"}),
+    ("buscar", {"departamento": "Antioquia"}),
+    ("buscar", {"municipio": "La Unión"}),
+    ("buscar", {"municipio": "La Unión", "departamento": "Nariño"}),
+])
+def test_indice_igual_a_la_respuesta_de_la_api(agente, accion, parametros):
+    precalculada = agente._construir_indice_respuestas("v1").obtener(accion, parametros)
+    directa = agente._respuesta(accion, agente.obtener_datos(accion, parametros))
+
+    # Los valores pueden diferir en metadatos de paginación y columnas que las plantillas no usan
+    assert precalculada["texto"] == directa["texto"]
+    assert precalculada["intencion"] == directa["intencion"] == accion
+
+
+def test_consultas_no_precalculadas():
+    indice = AnswerIndex.construir([{"departamento": "Huila", "municipio": "Neiva", "total": 10}], None,
+                                   lambda accion, datos: {"texto": accion, "valores": datos})
+
+    assert AnswerIndex.clave("buscar", {}) is None
+    assert AnswerIndex.clave("buscar", {"departamento": "Huila", "limit": 50}) is None
+    assert AnswerIndex.clave("estadisticas", {"departamento": "Huila"}) is None
+    assert indice.obtener("estadisticas", {}) is None  # Sin estadísticas no se precalcula
+    assert indice.obtener("listar", {"limit": 11}) is None
+    assert indice.obtener("buscar", {"departamento": "Meta"}) is None
+
+
+def test_resolver_datos_usa_el_indice(agente):
+    indice = AnswerIndex.construir([{"departamento": "Huila", "municipio": "Neiva", "total": 10}], None,
+                                   lambda accion, datos: {"texto": "precalculada", "valores": datos})
+    agente.indice_respuestas = RecursoVersionado("Índice", lambda: "v1", lambda version: indice)
+
+    assert agente.resolver_datos("buscar", {"departamento": "Huila"})["texto"] == "precalculada"
+    # Lo que no está en el índice se consulta a la API
+    assert "Pitalito" in agente.resolver_datos("buscar", {"municipio": "Pitalito"})["texto"]
+
+
+def test_se_reconstruye_al_cambiar_la_version():
+    version = ["v1"]
+    construidos = []
+
+    def construir(v):
+        construidos.append(v)
+        return AnswerIndex.construir([], None, lambda accion, datos: datos, version=v)
+
+    recurso = RecursoVersionado("Índice", lambda: version[0], construir, ttl=0)
+
+    assert recurso.obtener().version == "v1"
+    assert recurso.obtener().version == "v1"
+    version[0] = "v2"
+    assert recurso.obtener().version == "v2"
+    assert construidos == ["v1", "v2"]
@@ -0,0 +1,67 @@
+# agent/test_cache.py
+"""
+Pruebas de la caché persistente de respuestas del LLM (agent/cache.py).
+
+    python -m pytest agent/test_cache.py
+"""
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import cache as modulo_cache
+from cache import ResponseCache, obtener_cache
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    # Instantes distintos en cada llamada: el orden LRU no depende de la resolución del reloj
+    instantes = itertools.count(1000)
+    monkeypatch.setattr(modulo_cache.time, "time", lambda: float(next(instantes)))
+
+
+def test_clave_normaliza_la_consulta_y_depende_de_datos_modelo_y_prompt():
+    base = ResponseCache.clave("¿Licencias en Bogotá?", "Bogotá: 10", "llama3.2:1b", "1")
+
+    assert ResponseCache.clave("licencias en bogota", "Bogotá: 10", "llama3.2:1b", "1") == base
+    assert ResponseCache.clave("licencias en bogota", "Bogotá: 11", "llama3.2:1b", "1") != base
+    assert ResponseCache.clave("licencias en bogota", "Bogotá: 10", "otro", "1") != base
+    assert ResponseCache.clave("licencias en bogota", "Bogotá: 10", "llama3.2:1b", "2") != base
+
+
+def test_aciertos_fallos_y_persistencia(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path)
+
+    assert cache.obtener("k") is None
+    cache.guardar("k", "respuesta")
+    assert cache.obtener("k") == "respuesta"
+    assert cache.metricas() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entradas": 1, "max_entradas": 1000}
+
+    # Otra instancia sobre el mismo archivo (p. ej. tras reiniciar) la encuentra
+    assert ResponseCache(path).obtener("k") == "respuesta"
+
+
+def test_desaloja_la_menos_usada(tmp_path, reloj):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.guardar("a", "A")
+    cache.guardar("b", "B")
+    assert cache.obtener("a") == "A"  # "b" pasa a ser la menos usada
+
+    cache.guardar("c", "C")
+
+    assert cache.obtener("b") is None
+    assert cache.obtener("a") == "A" and cache.obtener("c") == "C"
+    assert cache.metricas()["entradas"] == 2
+
+    cache.limpiar()
+    assert cache.metricas()["entradas"] == 0
+
+
+def test_una_cache_compartida_por_archivo(tmp_path):
+    path = str(tmp_path / "cache.db")
+    assert obtener_cache(path) is obtener_cache(path)
+    assert obtener_cache(str(tmp_path / "otra.db")) is not obtener_cache(path)
@@ -0,0 +1,99 @@
+# agent/test_concurrency.py
+"""
+Pruebas de la concurrencia del agente (agent/concurrency.py): agrupación de
+peticiones idénticas, límite de llamadas simultáneas e historial por sesión.
+
+    python -m pytest agent/test_concurrency.py
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from concurrency import LimitadorConcurrencia, SessionStore, SingleFlight
+
+
+def test_single_flight_ejecuta_una_vez_por_clave():
+    coalescedor = SingleFlight()
+    ejecuciones = []
+    empezar = threading.Barrier(8)
+
+    def trabajo():
+        ejecuciones.append(1)
+        time.sleep(0.1)
+        return "resultado"
+
+    def llamar(_):
+        empezar.wait()
+        return coalescedor.hacer("clave", trabajo)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        resultados = list(executor.map(llamar, range(8)))
+
+    assert resultados == ["resultado"] * 8
+    assert len(ejecuciones) == 1 and coalescedor.agrupadas == 7
+
+    # Terminada, la siguiente llamada vuelve a ejecutar; otra clave no espera a la primera
+    assert coalescedor.hacer("clave", trabajo) == "resultado"
+    assert coalescedor.hacer("otra", lambda: "otra") == "otra"
+    assert len(ejecuciones) == 2
+
+
+def test_single_flight_propaga_la_excepcion_a_todos():
+    coalescedor = SingleFlight()
+    empezar = threading.Barrier(4)
+
+    def trabajo():
+        time.sleep(0.05)
+        raise ValueError("fallo")
+
+    def llamar(_):
+        empezar.wait()
+        with pytest.raises(ValueError):
+            coalescedor.hacer("clave", trabajo)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(llamar, range(4)))
+
+    # Tras el fallo la clave queda libre
+    assert coalescedor.hacer("clave", lambda: "bien") == "bien"
+
+
+def test_limitador_no_supera_el_maximo():
+    limitador = LimitadorConcurrencia(2)
+    simultaneos, maximo = [0], [0]
+    lock = threading.Lock()
+
+    def llamada(_):
+        with limitador:
+            with lock:
+                simultaneos[0] += 1
+                maximo[0] = max(maximo[0], simultaneos[0])
+            time.sleep(0.02)
+            with lock:
+                simultaneos[0] -= 1
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(llamada, range(12)))
+
+    assert maximo[0] == 2
+    assert limitador.activos == 0 and limitador.en_espera == 0
+
+
+def test_sesiones_independientes_con_limite():
+    sesiones = SessionStore(max_sesiones=2, max_turnos=3)
+    sesiones.historial("a").extend({"consulta": str(i)} for i in range(5))
+    sesiones.historial("b").append({"consulta": "b"})
+
+    assert [turno["consulta"] for turno in sesiones.historial("a")] == ["2", "3", "4"]
+    assert len(sesiones.historial("b")) == 1
+
+    # La menos reciente ("a", consultada antes que "b") se desaloja al superar el máximo
+    sesiones.historial("c")
+    assert len(sesiones) == 2
+    assert len(sesiones.historial("a")) == 0
@@ -0,0 +1,86 @@
+# agent/test_gazetteer.py
+"""
+Pruebas del extractor de entidades e intenciones (agent/gazetteer.py).
+
+    python -m pytest agent/test_gazetteer.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from gazetteer import Gazetteer
+
+LICENCIAS = [
+    {"departamento": "Huila", "municipio": "Neiva", "total": 10},
+    {"departamento": "Antioquia", "municipio": "Medellín", "total": 30},
+    {"departamento": "Antioquia", "municipio": "La Unión", "total": 2},
+    {"departamento": "Nariño", "municipio": "La Unión", "total": 1},
+    {"departamento": "Córdoba", "municipio": "Montería", "total": 4},
+    {"departamento": "Quindío", "municipio": "Córdoba", "total": 1},
+    {"departamento": "Boyacá", "municipio": "Toca", "total": 3},
+    {"departamento": "Bogotá D.C.", "municipio": "Bogotá D.C.", "total": 20},
+]
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return Gazetteer(LICENCIAS, version="v1")
+
+
+def test_extrae_nombres_sin_importar_tildes_ni_mayusculas(gazetteer):
+    entidades = gazetteer.extraer("¿Cuántas licencias hay en MEDELLIN y en nariño?")
+
+    assert entidades["municipios"] == [("Medellín", "Antioquia")]
+    assert entidades["departamentos"] == ["Nariño"]
+    assert entidades["intenciones"] == ["estadisticas"]
+    assert entidades["aproximado"] is False
+
+
+def test_alias_y_palabras_completas(gazetteer):
+    assert gazetteer.extraer("licencias en bogota")["departamentos"] == ["Bogotá D.C."]
+    # "neivas" no es "neiva": solo cuentan palabras completas (la aproximada sí la encuentra)
+    assert gazetteer.extraer("neivas")["aproximado"] is True
+
+
+def test_nombre_ambiguo_requiere_contexto(gazetteer):
+    assert gazetteer.extraer("toca revisar las licencias")["municipios"] == []
+    assert gazetteer.extraer("licencias en toca")["municipios"] == [("Toca", "Boyacá")]
+
+
+def test_prefiere_el_departamento_al_municipio_homonimo(gazetteer):
+    entidades = gazetteer.extraer("licencias en Córdoba")
+
+    assert entidades["departamentos"] == ["Córdoba"]
+    assert entidades["municipios"] == []
+
+
+def test_coincidencia_aproximada(gazetteer):
+    entidades = gazetteer.extraer("licencias en Medelin")
+
+    assert entidades["municipios"] == [("Medellín", "Antioquia")]
+    assert entidades["aproximado"] is True
+
+
+def test_resolver_desambigua_con_el_departamento_mencionado(gazetteer):
+    entidades = gazetteer.extraer("licencias en La Unión, Nariño")
+
+    assert gazetteer.resolver_todos(entidades) == [{"municipio": "La Unión", "departamento": "Nariño"}]
+
+
+def test_resolver_municipio_homonimo_sin_departamento(gazetteer):
+    entidades = gazetteer.extraer("licencias en La Unión")
+
+    assert gazetteer.resolver_parametros(entidades) == {"municipio": "La Unión"}
+
+
+def test_resolver_todos_municipios_primero(gazetteer):
+    entidades = gazetteer.extraer("compara Huila con Neiva y Antioquia")
+
+    assert gazetteer.resolver_todos(entidades) == [
+        {"municipio": "Neiva", "departamento": "Huila"},
+        {"departamento": "Antioquia"},
+    ]
+    assert gazetteer.resolver_parametros({"departamentos": [], "municipios": []}) is None
@@ -0,0 +1,68 @@
+# agent/test_lote.py
+"""
+Pruebas del procesamiento por lotes (FastOllamaAgent.procesar_lote y /api/chat/batch).
+No requieren Ollama ni la API: la interpretación y los datos se sustituyen en el agente.
+
+    python -m pytest agent/test_lote.py
+"""
+import json
+import os
+import sys
+
+os.environ.setdefault("CACHE_ENABLED", "False")
+os.environ.setdefault("TRACE_ENABLED", "False")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from config import config
+from ollama import FastOllamaAgent
+import web_interface
+
+DIRECTA = {"texto": "Huila tiene 14 licencias", "intencion": "buscar", "valores": {}, "abierta": False}
+
+
+@pytest.fixture
+def agente(monkeypatch):
+    agente = FastOllamaAgent(check_connections=False)
+    agente.cache = None
+    agente.registro_trazas = None
+    monkeypatch.setattr(config, "RESPONSE_MODE", "directo")
+    agente.llamadas_datos = 0
+
+    def preparar(consulta, gazetteer=None):
+        def resolver():
+            agente.llamadas_datos += 1
+            return dict(DIRECTA)
+        return ("buscar", consulta.split()[-1]), resolver
+
+    agente._preparar_consulta = preparar
+    return agente
+
+
+def test_lote_grande_sin_historial(agente):
+    consultas = [f"licencias en lugar{i % 50}" for i in range(config.BATCH_MAX_SIZE)]
+
+    resultados = list(agente.procesar_lote(consultas))
+
+    assert len(resultados) == len(consultas) + 1
+    assert resultados[-1]["tipo"] == "resumen" and resultados[-1]["llamadas_datos"] == 50
+    assert agente.llamadas_datos == 50
+    assert agente.conversation_history == []
+
+
+def test_endpoint_batch_respeta_el_maximo(agente, monkeypatch):
+    monkeypatch.setattr(web_interface, "agente", agente)
+    monkeypatch.setattr(config, "BATCH_MAX_SIZE", 3)
+    cliente = web_interface.app.test_client()
+
+    assert cliente.post("/api/chat/batch", json={"messages": ["a"] * 4}).status_code == 400
+
+    respuesta = cliente.post("/api/chat/batch", json={"messages": ["licencias en Huila"] * 3})
+    lineas = [json.loads(linea) for linea in respuesta.get_data(as_text=True).splitlines()]
+    assert [linea["tipo"] for linea in lineas] == ["resultado"] * 3 + ["resumen"]
+    assert agente.conversation_history == []
+
+    # 0 = sin límite de tamaño
+    monkeypatch.setattr(config, "BATCH_MAX_SIZE", 0)
+    assert cliente.post("/api/chat/batch", json={"messages": ["licencias en Huila"] * 10}).status_code == 200
@@ -0,0 +1,82 @@
+# agent/test_planner.py
+"""
+Pruebas de las comparaciones entre lugares (planner.py + resolver_plan) sobre
+una base de datos temporal servida en proceso. No requieren Ollama ni la API.
+
+    python -m pytest agent/test_planner.py
+"""
+import os
+import sqlite3
+import sys
+
+os.environ.setdefault("CACHE_ENABLED", "False")
+os.environ.setdefault("TRACE_ENABLED", "False")
+os.environ.setdefault("DB_ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sin-artefacto"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from backends import InProcessBackend
+from gazetteer import Gazetteer
+from ollama import FastOllamaAgent
+from planner import planificar
+
+# Más municipios que cualquier página de /licencias/buscar/
+MUNICIPIOS_ANTIOQUIA = 150
+
+
+@pytest.fixture
+def agente(tmp_path):
+    db_path = str(tmp_path / "licencias.db")
+    filas = [("Antioquia", f"Municipio {i}", 1, 2, 0, 3) for i in range(MUNICIPIOS_ANTIOQUIA)]
+    filas += [("Huila", "Neiva", 5, 5, 0, 10), ("Huila", "Pitalito", 2, 1, 1, 4)]
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE licencias (id INTEGER PRIMARY KEY, departamento TEXT, municipio TEXT,
+                    no_psico INTEGER, psico INTEGER, semillas INTEGER, total INTEGER)""")
+    conn.executemany("INSERT INTO licencias (departamento, municipio, no_psico, psico, semillas, total) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", filas)
+    conn.commit()
+    conn.close()
+
+    agente = FastOllamaAgent(check_connections=False)
+    agente.cache = None
+    agente.registro_trazas = None
+    agente.indice_respuestas = None
+    agente.backend = InProcessBackend(db_path)
+    return agente
+
+
+def _gazetteer():
+    return Gazetteer([
+        {"departamento": "Antioquia", "municipio": "Municipio 0", "total": 3},
+        {"departamento": "Huila", "municipio": "Neiva", "total": 10},
+        {"departamento": "Huila", "municipio": "Pitalito", "total": 4},
+    ])
+
+
+def test_comparacion_suma_todos_los_municipios(agente):
+    plan = planificar("compara Antioquia y Huila", _gazetteer())
+    assert [paso["accion"] for paso in plan] == ["agregados", "agregados"]
+
+    filas = dict(agente.resolver_plan(plan)["valores"]["filas"])
+
+    assert filas["Antioquia"] == {"total": 3 * MUNICIPIOS_ANTIOQUIA, "no_psico": MUNICIPIOS_ANTIOQUIA,
+                                  "psico": 2 * MUNICIPIOS_ANTIOQUIA, "semillas": 0,
+                                  "municipios": MUNICIPIOS_ANTIOQUIA}
+    assert filas["Huila"] == {"total": 14, "no_psico": 7, "psico": 6, "semillas": 1, "municipios": 2}
+
+
+def test_comparacion_por_municipio_y_lugar_sin_licencias(agente):
+    plan = [
+        {"accion": "agregados", "parametros": {"municipio": "Neiva", "departamento": "Huila", "agrupar_por": "",
+                                               "campos": "no_psico,psico,semillas,total", "agregados": "sum"},
+         "etiqueta": "Neiva, Huila"},
+        {"accion": "agregados", "parametros": {"departamento": "Meta", "agrupar_por": "",
+                                               "campos": "no_psico,psico,semillas,total", "agregados": "sum"},
+         "etiqueta": "Meta"},
+    ]
+
+    filas = dict(agente.resolver_plan(plan)["valores"]["filas"])
+
+    assert filas["Neiva, Huila"]["total"] == 10 and filas["Neiva, Huila"]["municipios"] == 1
+    assert filas["Meta"]["total"] == 0 and filas["Meta"]["municipios"] == 0
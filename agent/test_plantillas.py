@@ -0,0 +1,110 @@
+# agent/test_plantillas.py
+"""
+Pruebas de la redacción con plantillas y de la validación de números de las
+respuestas del LLM (agent/plantillas.py).
+
+    python -m pytest agent/test_plantillas.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from plantillas import VARIANTES, _elegir, numeros_coinciden, redactar
+
+ESTADISTICAS = {"total_licencias": 1234, "total_municipios": 56, "total_no_psico": 700,
+                "total_psico": 500, "total_semillas": 34, "promedio_por_municipio": 22.04}
+MEDELLIN = {"municipio": "Medellín", "departamento": "Antioquia", "total": 1234,
+            "no_psico": 1000, "psico": 200, "semillas": 34}
+BOGOTA = {"municipio": "Bogotá D.C.", "departamento": "Bogotá D.C.", "total": 980,
+          "no_psico": 900, "psico": 80, "semillas": 0}
+DATOS_BRUTOS = "Medellín (Antioquia): 1234 licencias (1000 no psicoactivas, 200 psicoactivas, 34 semillas)"
+
+
+def _semillas_por_variante(intencion: str):
+    """Una consulta que elige cada variante de la intención"""
+    semillas = {}
+    for i in range(200):
+        semillas.setdefault(_elegir(intencion, f"consulta {i}"), f"consulta {i}")
+    assert len(semillas) == len(VARIANTES[intencion])
+    return list(semillas.values())
+
+
+@pytest.mark.parametrize("respuesta", [
+    "Medellín tiene 1234 licencias.",
+    "Medellín tiene 1,234 licencias: 1,000 no psicoactivas, 200 psicoactivas y 34 de semillas.",
+    "Medellín tiene 1.234 licencias: 1.000 no psicoactivas, 200 psicoactivas y 34 de semillas.",
+])
+def test_reformulaciones_aceptadas(respuesta):
+    assert numeros_coinciden(respuesta, DATOS_BRUTOS)
+
+
+@pytest.mark.parametrize("respuesta", [
+    "Medellín tiene 1.243 licencias.",  # Cifra alterada
+    "Medellín tiene 1,234 licencias y 12 viveros.",  # Número inventado
+    "Medellín tiene muchas licencias.",  # Sin ningún número
+])
+def test_reformulaciones_rechazadas(respuesta):
+    assert not numeros_coinciden(respuesta, DATOS_BRUTOS)
+
+
+def test_decimales_y_redondeo():
+    datos = "Promedio por municipio: 22.04"
+    assert numeros_coinciden("Unas 22 licencias por municipio", datos)
+    assert numeros_coinciden("22,0 licencias por municipio", datos)
+    assert numeros_coinciden("22.04 licencias por municipio", datos)
+    assert not numeros_coinciden("23 licencias por municipio", datos)
+    # Sin números en los datos, una respuesta sin números es válida
+    assert numeros_coinciden("No hay datos", "No se pudieron obtener datos de la API.")
+
+
+@pytest.mark.parametrize("semilla", _semillas_por_variante("estadisticas"))
+def test_variantes_estadisticas(semilla):
+    texto = redactar("estadisticas", ESTADISTICAS, semilla)
+
+    assert "1,234" in texto and "22.0" in texto
+    assert numeros_coinciden(texto, "1234 licencias, 56 municipios, 700, 500, 34, promedio 22.04")
+
+
+@pytest.mark.parametrize("semilla", _semillas_por_variante("buscar_uno"))
+def test_variantes_buscar_uno(semilla):
+    texto = redactar("buscar", {"resultados": [MEDELLIN], "total": 1}, semilla)
+
+    assert "Medellín" in texto and "Antioquia" in texto
+    assert numeros_coinciden(texto, DATOS_BRUTOS)
+
+
+def test_variante_estable_por_consulta():
+    valores = {"resultados": [MEDELLIN, BOGOTA], "total": 2}
+    assert redactar("buscar", valores, "Licencias en Antioquia") == redactar("buscar", valores, "licencias en antioquia")
+
+
+def test_buscar_varios_listar_y_vacio():
+    varios = redactar("buscar", {"resultados": [MEDELLIN, BOGOTA], "total": 2}, "x")
+    assert "Medellín (Antioquia) con 1,234" in varios
+    # Bogotá D.C. es municipio y departamento: no se repite entre paréntesis
+    assert "Bogotá D.C. con 980" in varios
+
+    listado = redactar("listar", {"resultados": [MEDELLIN, BOGOTA], "total": 56}, "x")
+    assert "56" in listado and "Medellín (Antioquia) con 1,234 y Bogotá D.C. con 980" in listado
+
+    assert redactar("buscar", {"resultados": [], "total": 0}, "x") in VARIANTES["buscar_vacio"]
+
+
+def test_comparacion_con_y_sin_datos():
+    filas = [("Antioquia", {"total": 1234, "municipios": 125}), ("Meta", None), ("Huila", {"total": 14, "municipios": 2})]
+    texto = redactar("comparacion", {"filas": filas}, "compara")
+    assert "Antioquia suma 1,234 licencias en 125 municipio(s)" in texto
+    assert "Meta no tiene datos disponibles" in texto
+    assert texto.endswith(("es Antioquia.", "Antioquia queda por delante."))
+
+    # Ningún lugar con datos: sin ganador, pero sin fallar
+    vacia = redactar("comparacion", {"filas": [("meta", None), ("Huila", None)]}, "compara")
+    assert vacia == "Meta no tiene datos disponibles y Huila no tiene datos disponibles."
+
+
+def test_intencion_desconocida():
+    with pytest.raises(ValueError):
+        redactar("desconocida", {})
@@ -0,0 +1,89 @@
+# agent/test_presupuesto.py
+"""
+Pruebas del presupuesto de latencia (LATENCY_BUDGET_MS): si Ollama no llegaría
+a tiempo la respuesta es la directa, solo con los datos. No requieren Ollama
+ni la API: las llamadas externas se sustituyen en el agente.
+
+    python -m pytest agent/test_presupuesto.py
+"""
+import os
+import sys
+import threading
+
+os.environ.setdefault("CACHE_ENABLED", "False")
+os.environ.setdefault("TRACE_ENABLED", "False")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from config import config
+from ollama import FastOllamaAgent
+
+DIRECTA = {"texto": "Huila: 14 licencias (7 no psicoactivas, 6 psicoactivas, 1 semillas)",
+           "intencion": "buscar", "valores": {}, "abierta": False}
+MEJORADA = "En Huila hay 14 licencias: 7 no psicoactivas, 6 psicoactivas y 1 de semillas."
+
+
+@pytest.fixture
+def agente(monkeypatch):
+    agente = FastOllamaAgent(check_connections=False)
+    agente.cache = None
+    agente.registro_trazas = None
+    monkeypatch.setattr(config, "RESPONSE_MODE", "llm")
+    monkeypatch.setattr(config, "VALIDATE_LLM_NUMBERS", False)
+    monkeypatch.setattr(config, "LATENCY_PROBE_INTERVAL", 3600)
+    agente.resolver_consulta = lambda consulta: dict(DIRECTA)
+    agente.liberar = threading.Event()
+    agente.llamadas = 0
+
+    def call_ollama_fast(prompt, system_message=None):
+        agente.llamadas += 1
+        agente.liberar.wait(5)
+        return MEJORADA
+
+    agente.call_ollama_fast = call_ollama_fast
+    yield agente
+    agente.liberar.set()
+
+
+def test_dentro_del_presupuesto_responde_ollama(agente, monkeypatch):
+    monkeypatch.setattr(config, "LATENCY_BUDGET_MS", 2000)
+    agente.liberar.set()
+
+    resultado = agente.procesar_consulta_detallada("licencias en Huila", [])
+
+    assert resultado["metodo"] == "Ollama" and resultado["respuesta"] == MEJORADA
+
+
+def test_presupuesto_agotado_responde_solo_con_los_datos(agente, monkeypatch):
+    monkeypatch.setattr(config, "LATENCY_BUDGET_MS", 50)
+
+    resultado = agente.procesar_consulta_detallada("licencias en Huila", [])
+
+    assert resultado["metodo"] == "Directo (presupuesto agotado)"
+    assert resultado["respuesta"] == DIRECTA["texto"]
+    assert resultado["tiempo_ms"] < 1000
+    assert agente.llamadas == 1  # La generación sigue en segundo plano
+
+
+def test_latencia_estimada_alta_omite_ollama(agente, monkeypatch):
+    monkeypatch.setattr(config, "LATENCY_BUDGET_MS", 500)
+    for _ in range(10):
+        agente.latencias_ollama.registrar(3.0)
+
+    resultado = agente.procesar_consulta_detallada("licencias en Huila", [])
+
+    assert resultado["metodo"] == "Directo (omitido por latencia)"
+    assert resultado["respuesta"] == DIRECTA["texto"]
+    assert agente.llamadas == 0
+
+
+def test_sin_presupuesto_espera_a_ollama(agente, monkeypatch):
+    monkeypatch.setattr(config, "LATENCY_BUDGET_MS", 0)
+    for _ in range(10):
+        agente.latencias_ollama.registrar(3.0)
+    agente.liberar.set()
+
+    resultado = agente.procesar_consulta_detallada("licencias en Huila", [])
+
+    assert resultado["metodo"] == "Ollama"
@@ -0,0 +1,54 @@
+# agent/test_trazas.py
+"""
+Pruebas de la exportación de trazas (agent/trazas.py).
+
+    python -m pytest agent/test_trazas.py
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import trazas
+
+
+def _consulta(registro, texto: str):
+    with trazas.traza("consulta", registro, consulta=texto) as traza:
+        with trazas.span("api"):
+            pass
+        traza.atributos["metodo"] = "Directo"
+
+
+def test_sin_archivo_solo_resumen_en_memoria():
+    registro = trazas.RegistroTrazas()
+    _consulta(registro, "licencias en Huila")
+
+    resumen = registro.resumen()
+    assert registro.escritor is None
+    assert resumen["trazas"] == 1
+    assert resumen["etapas_ms"]["api"]["muestras"] == 1
+
+
+def test_exporta_en_segundo_plano_sin_el_texto_de_la_consulta(tmp_path):
+    ruta = tmp_path / "trazas.jsonl"
+    registro = trazas.RegistroTrazas(str(ruta))
+    _consulta(registro, "licencias en Huila")
+    registro.escritor.vaciar()
+
+    datos = json.loads(ruta.read_text(encoding="utf-8"))
+    assert "consulta" not in datos["atributos"]
+    assert len(datos["atributos"]["consulta_sha256"]) == 16
+    assert datos["atributos"]["metodo"] == "Directo"
+
+
+def test_rota_al_superar_el_tamano(tmp_path):
+    ruta = tmp_path / "trazas.jsonl"
+    registro = trazas.RegistroTrazas(str(ruta), max_bytes=200, incluir_consulta=True)
+    for i in range(20):
+        _consulta(registro, f"consulta {i}")
+        registro.escritor.vaciar()
+
+    assert (tmp_path / "trazas.jsonl.1").exists()
+    assert ruta.stat().st_size < 200 + 1000
+    assert '"consulta": "consulta 19"' in ruta.read_text(encoding="utf-8")
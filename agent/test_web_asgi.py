@@ -0,0 +1,181 @@
+# agent/test_web_asgi.py
+"""
+Pruebas del camino asíncrono del agente, del cupo de mejoras en segundo plano y de la
+interfaz ASGI (agent/web_asgi.py). No requieren Ollama ni la API: las llamadas externas
+se sustituyen en el agente.
+
+    python -m pytest agent/test_web_asgi.py
+"""
+import asyncio
+import os
+import sys
+import threading
+
+os.environ.setdefault("CACHE_ENABLED", "False")
+os.environ.setdefault("TRACE_ENABLED", "False")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from concurrency import SingleFlightAsync
+from config import config
+from ollama import MEJORA_DESCARTADA, FastOllamaAgent
+import web_asgi
+
+DIRECTA = {"texto": "Huila tiene 14 licencias", "intencion": "buscar", "valores": {}, "abierta": False}
+
+
+def test_single_flight_async_agrupa_y_sobrevive_a_cancelaciones():
+    async def escenario():
+        coalescedor = SingleFlightAsync()
+        ejecuciones = []
+
+        async def trabajo():
+            ejecuciones.append(1)
+            await asyncio.sleep(0.05)
+            return "resultado"
+
+        primera = asyncio.create_task(coalescedor.hacer("clave", trabajo))
+        resto = [asyncio.create_task(coalescedor.hacer("clave", trabajo)) for _ in range(3)]
+        await asyncio.sleep(0)
+        # Si el primer cliente se desconecta, los demás reciben el resultado igualmente
+        primera.cancel()
+        assert await asyncio.gather(*resto) == ["resultado"] * 3
+        assert len(ejecuciones) == 1 and coalescedor.agrupadas == 3
+
+        # Terminada, la siguiente petición vuelve a ejecutar
+        assert await coalescedor.hacer("clave", trabajo) == "resultado"
+        assert len(ejecuciones) == 2
+
+    asyncio.run(escenario())
+
+
+@pytest.fixture
+def agente(monkeypatch):
+    agente = FastOllamaAgent(check_connections=False)
+    agente.cache = None
+    agente.registro_trazas = None
+    monkeypatch.setattr(config, "RESPONSE_MODE", "llm")
+    monkeypatch.setattr(config, "VALIDATE_LLM_NUMBERS", False)
+    agente.resolver_consulta = lambda consulta: dict(DIRECTA)
+    agente.llamadas_async = 0
+
+    async def call_ollama_async(prompt, system_message=None):
+        agente.llamadas_async += 1
+        await asyncio.sleep(0.05)
+        return "En Huila hay 14 licencias registradas."
+
+    def call_ollama_fast(prompt, system_message=None):
+        raise AssertionError("El camino asíncrono no debe usar el cliente síncrono")
+
+    agente.call_ollama_async = call_ollama_async
+    agente.call_ollama_fast = call_ollama_fast
+    return agente
+
+
+def test_procesar_consulta_async_agrupa_y_guarda_historial(agente):
+    historial = []
+
+    async def escenario():
+        return await asyncio.gather(*[agente.procesar_consulta_async("licencias en Huila", historial)
+                                      for _ in range(5)])
+
+    resultados = asyncio.run(escenario())
+
+    assert agente.llamadas_async == 1
+    assert {r["metodo"] for r in resultados} == {"Ollama"}
+    assert resultados[0]["respuesta"] == "En Huila hay 14 licencias registradas."
+    assert len(historial) == 5
+
+
+def test_sondeo_de_latencia_usa_el_cliente_asincrono(agente, monkeypatch):
+    monkeypatch.setattr(config, "LATENCY_BUDGET_MS", 1000)
+    agente._debe_omitir_llm = lambda restante, limitador=None: True
+
+    async def escenario():
+        resultado = await agente.procesar_consulta_async("licencias en Huila")
+        # El sondeo corre como tarea en el event loop
+        while agente._tareas_fondo or agente.llamadas_async == 0:
+            await asyncio.sleep(0.01)
+        return resultado
+
+    resultado = asyncio.run(escenario())
+
+    assert resultado["metodo"] == "Directo (omitido por latencia)"
+    assert resultado["respuesta"] == DIRECTA["texto"]
+    assert agente.llamadas_async == 1
+
+
+def test_mejoras_en_segundo_plano_acotadas_async(agente, monkeypatch):
+    monkeypatch.setattr(config, "LATENCY_BUDGET_MS", 10)
+    monkeypatch.setattr(config, "MAX_BACKGROUND_GENERATIONS", 2)
+
+    async def escenario():
+        resultados = await asyncio.gather(*[agente.procesar_consulta_async(f"licencias en lugar {i}")
+                                            for i in range(5)])
+        while agente._tareas_fondo:
+            await asyncio.sleep(0.01)
+        return resultados
+
+    resultados = asyncio.run(escenario())
+
+    assert {r["metodo"] for r in resultados} == {"Directo (presupuesto agotado)"}
+    assert agente.llamadas_async == 2
+    assert agente.metricas_rutas.resumen()[MEJORA_DESCARTADA] == 3
+
+
+def test_mejoras_en_segundo_plano_acotadas_en_el_pool(agente, monkeypatch):
+    monkeypatch.setattr(config, "LATENCY_BUDGET_MS", 10)
+    agente._cupo_fondo = threading.BoundedSemaphore(2)
+    liberar, llamadas = threading.Event(), []
+
+    def call_ollama_fast(prompt, system_message=None):
+        llamadas.append(prompt)
+        liberar.wait(5)
+        return "En Huila hay 14 licencias registradas."
+
+    agente.call_ollama_fast = call_ollama_fast
+
+    resultados = [agente.procesar_consulta_detallada(f"licencias en lugar {i}", []) for i in range(4)]
+
+    assert {r["metodo"] for r in resultados} == {"Directo (presupuesto agotado)"}
+    assert agente.metricas_rutas.resumen()[MEJORA_DESCARTADA] == 2
+    liberar.set()
+    agente._executor.shutdown(wait=True)
+    assert len(llamadas) == 2
+    # Terminadas las generaciones, el cupo vuelve a estar libre
+    assert agente._cupo_fondo.acquire(blocking=False) and agente._cupo_fondo.acquire(blocking=False)
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    # Sin lifespan: el agente no se crea y su inicialización falla
+    monkeypatch.setattr(web_asgi, "agente", None)
+    monkeypatch.setattr(web_asgi, "inicializar_agente", lambda: False)
+    return TestClient(web_asgi.app)
+
+
+def test_pagina_comprimida_con_etag_y_304(cliente):
+    respuesta = cliente.get("/", headers={"Accept-Encoding": "gzip"})
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert respuesta.headers["cache-control"] == "no-cache"
+    assert "<html" in respuesta.text.lower()
+
+    etag = respuesta.headers["etag"]
+    revalidada = cliente.get("/", headers={"If-None-Match": etag})
+    assert revalidada.status_code == 304 and revalidada.content == b""
+
+    sin_gzip = cliente.get("/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in sin_gzip.headers
+    assert sin_gzip.headers["etag"] == etag
+
+
+def test_chat_sin_agente_responde_503(cliente):
+    assert cliente.post("/api/chat", json={"message": ""}).status_code == 400
+    for ruta in ("/api/chat", "/api/chat/stream"):
+        respuesta = cliente.post(ruta, json={"message": "licencias en Huila"})
+        assert respuesta.status_code == 503
+        assert respuesta.json() == {"status": "error", "error": "El agente no está inicializado"}
+    assert cliente.get("/api/status").json()["agent_initialized"] is False
@@ -0,0 +1,63 @@
+# agent/test_web_interface.py
+"""
+Pruebas del perfilado por petición en la interfaz Flask (agent/web_interface.py).
+No requieren Ollama ni la API.
+
+    python -m pytest agent/test_web_interface.py
+"""
+import os
+import sys
+
+os.environ.setdefault("CACHE_ENABLED", "False")
+os.environ.setdefault("TRACE_ENABLED", "False")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from flask import Flask
+
+from config import config
+import web_interface
+from web_interface import Perfilador
+
+CLAVE = "clave-admin"
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    perfilador = Perfilador()
+    monkeypatch.setattr(config, "ADMIN_API_KEY", CLAVE)
+    monkeypatch.setattr(web_interface, "perfilador", perfilador)
+
+    app = Flask(__name__)
+    web_interface.registrar_perfilado(app)
+
+    @app.route("/trabajo")
+    def trabajo():
+        return {"total": sum(i * i for i in range(5000))}
+
+    @app.route("/falla")
+    def falla():
+        raise RuntimeError("fallo en la vista")
+
+    cliente = app.test_client()
+    cliente.perfilador = perfilador
+    return cliente
+
+
+def test_perfil_de_peticion_devuelve_su_id(cliente):
+    respuesta = cliente.get("/trabajo", headers={"X-Profile": CLAVE})
+
+    assert respuesta.status_code == 200
+    assert cliente.perfilador.obtener(respuesta.headers["X-Profile-Id"]) is not None
+    assert cliente.perfilador.peticion is None
+
+
+def test_vista_que_falla_no_deja_el_perfil_abierto(cliente):
+    respuesta = cliente.get("/falla", headers={"X-Profile": CLAVE})
+    assert respuesta.status_code == 500
+    assert cliente.perfilador.peticion is None
+    assert sys.getprofile() is None
+
+    # La siguiente petición perfilada no recibe un 409
+    siguiente = cliente.get("/trabajo", headers={"X-Profile": CLAVE})
+    assert siguiente.status_code == 200 and "X-Profile-Id" in siguiente.headers
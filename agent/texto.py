@@ -0,0 +1,11 @@
+# agent/texto.py
+import re
+import unicodedata
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza un texto: minúsculas, sin tildes, sin signos y espacios simples"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
@@ -0,0 +1,267 @@
+# agent/trazas.py
+"""
+Trazas estructuradas por consulta: cada etapa (interpretación, llamadas a la
+API, formato, cola y generación de Ollama...) es un span con su duración y
+atributos. Las trazas terminadas se resumen por etapa en memoria para
+/api/metrics y, si se configura un archivo, un hilo aparte las añade a un
+JSONL que rota por tamaño (sin E/S en el camino de la consulta).
+
+Sin una traza activa span() y registrar() no hacen nada.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from metricas import percentil
+
+logger = logging.getLogger(__name__)
+
+_actual: contextvars.ContextVar[Optional["Traza"]] = contextvars.ContextVar("traza_actual", default=None)
+
+
+class Traza:
+    """Spans de una consulta"""
+
+    def __init__(self, nombre: str, **atributos):
+        self.id = uuid.uuid4().hex[:16]
+        self.nombre = nombre
+        self.atributos = atributos
+        self.inicio = time.time()
+        self.duracion: Optional[float] = None
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def agregar(self, nombre: str, inicio: float, fin: float, atributos: Dict):
+        with self._lock:
+            if self.duracion is not None:
+                return  # Trabajo en segundo plano que terminó después de la consulta
+            self.spans.append({
+                "nombre": nombre,
+                "inicio_ms": round((inicio - self.inicio) * 1000, 2),
+                "duracion_ms": round((fin - inicio) * 1000, 2),
+                **({"atributos": atributos} if atributos else {}),
+            })
+
+    def terminar(self):
+        with self._lock:
+            self.duracion = time.time() - self.inicio
+
+    def a_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "inicio": self.inicio,
+            "duracion_ms": round(self.duracion * 1000, 2) if self.duracion is not None else None,
+            "atributos": self.atributos,
+            "spans": self.spans,
+        }
+
+
+class EscritorTrazas:
+    """
+    Añade las trazas a un archivo JSONL desde un hilo propio. La cola es acotada:
+    si el disco no da abasto se descartan trazas en lugar de frenar las consultas.
+    Al superar `max_bytes` el archivo pasa a `<path>.1` (se conserva uno anterior).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, max_pendientes: int = 1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.descartadas = 0
+        self._cola: queue.Queue = queue.Queue(maxsize=max_pendientes)
+        self._hilo = threading.Thread(target=self._bucle, name="trazas-jsonl", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, datos: Dict):
+        try:
+            self._cola.put_nowait(datos)
+        except queue.Full:
+            self.descartadas += 1
+
+    def vaciar(self):
+        """Espera a que se escriban las trazas pendientes"""
+        self._cola.join()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            while True:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._escribir(lote)
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudieron escribir {len(lote)} trazas: {e}")
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+    def _escribir(self, lote: List[Dict]):
+        try:
+            if os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+        except FileNotFoundError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as archivo:
+            archivo.writelines(json.dumps(datos, ensure_ascii=False) + "\n" for datos in lote)
+
+
+class RegistroTrazas:
+    """Mantiene un resumen por etapa de las trazas terminadas y, opcionalmente, las exporta a JSONL"""
+
+    def __init__(self, path: Optional[str] = None, tamano: int = 500, max_bytes: int = 10 * 1024 * 1024,
+                 incluir_consulta: bool = False):
+        self.path = path
+        # El texto de las consultas puede tener datos personales: por defecto solo se exporta su hash
+        self.incluir_consulta = incluir_consulta
+        self.escritor = EscritorTrazas(path, max_bytes) if path else None
+        self._lock = threading.Lock()
+        self._tamano = tamano
+        self._etapas: Dict[str, deque] = {}
+        self._ollama: Dict[str, deque] = {}
+        self._metodos = Counter()
+        self.total = 0
+
+    def registrar(self, traza: Traza):
+        datos = traza.a_dict()
+        with self._lock:
+            self.total += 1
+            self._metodos[traza.atributos.get("metodo")] += 1
+            self._ventana(self._etapas, "total").append(datos["duracion_ms"])
+            for span in datos["spans"]:
+                self._ventana(self._etapas, span["nombre"]).append(span["duracion_ms"])
+                if span["nombre"] == "ollama.generacion":
+                    for clave, valor in span.get("atributos", {}).items():
+                        if isinstance(valor, (int, float)):
+                            self._ventana(self._ollama, clave).append(valor)
+
+        if self.escritor is not None:
+            if not self.incluir_consulta and "consulta" in datos["atributos"]:
+                atributos = dict(datos["atributos"])
+                consulta = str(atributos.pop("consulta"))
+                atributos["consulta_sha256"] = hashlib.sha256(consulta.encode()).hexdigest()[:16]
+                datos["atributos"] = atributos
+            self.escritor.enviar(datos)
+
+    def _ventana(self, ventanas: Dict[str, deque], clave: str) -> deque:
+        if clave not in ventanas:
+            ventanas[clave] = deque(maxlen=self._tamano)
+        return ventanas[clave]
+
+    def resumen(self) -> Dict:
+        """p50/p95 por etapa (ms) y de las métricas de generación de Ollama"""
+        def resumir(valores):
+            valores = list(valores)
+            return {"muestras": len(valores), "p50": percentil(valores, 50), "p95": percentil(valores, 95)}
+
+        with self._lock:
+            return {
+                "trazas": self.total,
+                "descartadas": self.escritor.descartadas if self.escritor else 0,
+                "metodos": dict(self._metodos),
+                "etapas_ms": {nombre: resumir(v) for nombre, v in sorted(self._etapas.items())},
+                "ollama": {nombre: resumir(v) for nombre, v in sorted(self._ollama.items())},
+            }
+
+
+_registro: Optional[RegistroTrazas] = None
+_registro_lock = threading.Lock()
+
+
+def obtener_registro(path: Optional[str] = None, max_bytes: int = 10 * 1024 * 1024,
+                     incluir_consulta: bool = False) -> RegistroTrazas:
+    """Registro de trazas compartido por el proceso"""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroTrazas(path, max_bytes=max_bytes, incluir_consulta=incluir_consulta)
+        return _registro
+
+
+@contextmanager
+def traza(nombre: str, registro: Optional[RegistroTrazas], **atributos):
+    """Abre una traza para el bloque (sin registro no se traza nada)"""
+    if registro is None:
+        yield None
+        return
+
+    actual = Traza(nombre, **atributos)
+    token = _actual.set(actual)
+    try:
+        yield actual
+    finally:
+        _actual.reset(token)
+        actual.terminar()
+        registro.registrar(actual)
+
+
+@contextmanager
+def span(nombre: str, **atributos):
+    """Mide el bloque como una etapa de la traza activa; los atributos pueden completarse dentro"""
+    actual = _actual.get()
+    if actual is None:
+        yield atributos
+        return
+
+    inicio = time.time()
+    try:
+        yield atributos
+    finally:
+        actual.agregar(nombre, inicio, time.time(), atributos)
+
+
+@contextmanager
+def suspender():
+    """Deja sin traza el bloque (p. ej. reconstruir un índice: cientos de etapas que no son de la consulta)"""
+    token = _actual.set(None)
+    try:
+        yield
+    finally:
+        _actual.reset(token)
+
+
+def registrar(nombre: str, inicio: float, fin: float, **atributos):
+    """Añade a la traza activa una etapa ya medida"""
+    actual = _actual.get()
+    if actual is not None:
+        actual.agregar(nombre, inicio, fin, atributos)
+
+
+def propagar(funcion: Callable) -> Callable:
+    """Envuelve `funcion` para que, ejecutada en otro hilo, siga en la traza actual"""
+    actual = _actual.get()
+    if actual is None:
+        return funcion
+
+    def envoltura(*args, **kwargs):
+        token = _actual.set(actual)
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _actual.reset(token)
+    return envoltura
+
+
+def metricas_ollama(resultado: Dict) -> Dict:
+    """Métricas de generación de la respuesta final de Ollama (duraciones en ms)"""
+    metricas = {}
+    for clave in ("prompt_eval_count", "eval_count"):
+        if clave in resultado:
+            metricas[clave] = resultado[clave]
+    for clave in ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration"):
+        if clave in resultado:
+            metricas[f"{clave}_ms"] = round(resultado[clave] / 1e6, 2)
+    if resultado.get("eval_count") and resultado.get("eval_duration"):
+        metricas["tokens_por_segundo"] = round(resultado["eval_count"] / (resultado["eval_duration"] / 1e9), 1)
+    return metricas
@@ -0,0 +1,56 @@
+# agent/versionado.py
+import logging
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class RecursoVersionado(Generic[T]):
+    """
+    Recurso derivado de los datos (índices, gazetteer...) que se reconstruye
+    solo cuando cambia la versión de los datos. La versión se consulta como
+    mucho una vez cada `ttl` segundos.
+    """
+
+    def __init__(self, nombre: str, obtener_version: Callable[[], Optional[str]],
+                 construir: Callable[[str], T], ttl: float = 60):
+        self.nombre = nombre
+        self._obtener_version = obtener_version
+        self._construir = construir
+        self.ttl = ttl
+
+        self.version: Optional[str] = None
+        self._valor: Optional[T] = None
+        self._verificado = 0.0
+        self._lock = threading.Lock()
+
+    def obtener(self) -> Optional[T]:
+        """Devuelve el recurso, reconstruyéndolo si la versión de los datos cambió"""
+        if self._valor is not None and time.monotonic() - self._verificado < self.ttl:
+            return self._valor
+
+        with self._lock:
+            if self._valor is not None and time.monotonic() - self._verificado < self.ttl:
+                return self._valor
+
+            try:
+                version = self._obtener_version()
+                if version is not None and (self._valor is None or version != self.version):
+                    inicio = time.perf_counter()
+                    self._valor = self._construir(version)
+                    self.version = version
+                    logger.info(f"🔄 {self.nombre} reconstruido para versión {version} "
+                                f"en {(time.perf_counter() - inicio) * 1000:.1f}ms")
+            except Exception as e:
+                # Se conserva la versión anterior (si existe) hasta el próximo intento
+                logger.warning(f"⚠️ No se pudo actualizar {self.nombre}: {e}")
+            self._verificado = time.monotonic()
+            return self._valor
+
+    def invalidar(self):
+        """Fuerza la verificación de versión en el próximo acceso"""
+        self._verificado = 0.0
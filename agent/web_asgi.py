@@ -0,0 +1,289 @@
+# agent/web_asgi.py
+"""
+Interfaz web del agente sobre ASGI (FastAPI + uvicorn): las mismas rutas del
+chat que web_interface.py, pero cada conversación espera a Ollama en el event
+loop (cliente httpx asíncrono) en lugar de ocupar un hilo del sistema durante
+toda la generación. Un solo proceso atiende cientos de chats simultáneos.
+
+    python agent/web_asgi.py     # http://localhost:5000
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from config import config
+from concurrency import SessionStore
+from manager import AgentManager
+from ollama import FastOllamaAgent
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PLANTILLA_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "index.html")
+COOKIE_SESION = "sid"
+
+# Instancia única del agente; las conexiones se verifican en segundo plano
+agente = None
+gestor = AgentManager(
+    lambda: FastOllamaAgent(check_connections=False),
+    intervalo=config.HEALTH_CHECK_INTERVAL,
+    backoff_max=config.HEALTH_CHECK_BACKOFF_MAX
+)
+
+# Historial de conversación por usuario (cookie 'sid')
+sesiones = SessionStore(max_sesiones=config.MAX_SESSIONS, ttl=config.SESSION_TTL)
+
+
+class PaginaEstatica:
+    """Página servida desde memoria: comprimida una sola vez, con ETag y revalidación"""
+
+    def __init__(self, ruta: str):
+        with open(ruta, "rb") as archivo:
+            self.cuerpo = archivo.read()
+        self.comprimido = gzip.compress(self.cuerpo, compresslevel=9)
+        self.etag = f'"{hashlib.sha256(self.cuerpo).hexdigest()[:16]}"'
+
+    def respuesta(self, request: Request) -> Response:
+        cabeceras = {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",  # El navegador la guarda pero revalida (304) en cada visita
+            "Vary": "Accept-Encoding",
+        }
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=cabeceras)
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            cabeceras["Content-Encoding"] = "gzip"
+            return Response(self.comprimido, media_type="text/html; charset=utf-8", headers=cabeceras)
+        return Response(self.cuerpo, media_type="text/html; charset=utf-8", headers=cabeceras)
+
+
+index_html = PaginaEstatica(PLANTILLA_INDEX)
+
+
+def inicializar_agente():
+    """Inicializa el agente de manera segura"""
+    global agente
+    try:
+        agente = gestor.iniciar()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Error inicializando agente: {e}")
+        return False
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    await asyncio.to_thread(inicializar_agente)
+    yield
+    await asyncio.to_thread(gestor.detener)
+    if agente is not None and agente._async_client is not None:
+        await agente.async_client.aclose()
+
+
+app = FastAPI(title="Agente de licencias de cannabis", lifespan=ciclo_de_vida,
+              docs_url=None, redoc_url=None, openapi_url=None)
+
+
+def _error(mensaje: str, status_code: int) -> JSONResponse:
+    return JSONResponse({"status": "error", "error": mensaje}, status_code=status_code)
+
+
+def _sesion(request: Request):
+    """(id de sesión, True si es nueva y hay que enviar la cookie)"""
+    sid = request.cookies.get(COOKIE_SESION)
+    if sid:
+        return sid, False
+    return uuid.uuid4().hex, True
+
+
+def _con_cookie(response: Response, sid: str, nueva: bool) -> Response:
+    if nueva:
+        response.set_cookie(COOKIE_SESION, sid, httponly=True, samesite="lax")
+    return response
+
+
+async def _consulta(request: Request):
+    """Mensaje del cuerpo JSON (cadena vacía si falta o el cuerpo no es válido)"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return ""
+    return str(data.get("message", "")).strip() if isinstance(data, dict) else ""
+
+
+async def _agente_listo() -> bool:
+    """Inicializa el agente si el arranque falló (como la versión Flask)"""
+    if agente is None:
+        await asyncio.to_thread(inicializar_agente)
+    return agente is not None
+
+
+def _evento_sse(evento: dict) -> str:
+    """Serializa un evento del agente en formato Server-Sent Events"""
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+CABECERAS_SSE = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Evita que un proxy acumule el stream
+}
+
+
+@app.get("/")
+async def index(request: Request):
+    """Página principal con el chat interface"""
+    return index_html.respuesta(request)
+
+
+@app.post("/api/chat")
+async def chat_endpoint(request: Request):
+    """Endpoint para procesar mensajes del chat"""
+    consulta = await _consulta(request)
+    if not consulta:
+        return _error("La consulta no puede estar vacía", 400)
+
+    logger.info(f"📨 Consulta recibida: {consulta}")
+    if not await _agente_listo():
+        return _error("El agente no está inicializado", 503)
+    sid, nueva = _sesion(request)
+    try:
+        resultado = await agente.procesar_consulta_async(consulta, sesiones.historial(sid))
+    except Exception as e:
+        logger.error(f"❌ Error en chat endpoint: {e}")
+        return _error(f"Error procesando la consulta: {str(e)}", 500)
+
+    respuesta = resultado["respuesta"]
+    logger.info(f"✅ Respuesta generada: {len(respuesta)} caracteres ({resultado['metodo']})")
+    return _con_cookie(JSONResponse({
+        "status": "success",
+        "response": respuesta,
+        "metodo": resultado["metodo"],
+        "tiempo_ms": resultado["tiempo_ms"],
+        "llm_ms": resultado["llm_ms"],
+        "timestamp": os.times().elapsed,
+    }), sid, nueva)
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: Request):
+    """Endpoint de chat en streaming (SSE): respuesta directa primero y luego los tokens de Ollama"""
+    consulta = await _consulta(request)
+    if not consulta:
+        return _error("La consulta no puede estar vacía", 400)
+
+    logger.info(f"📨 Consulta (stream) recibida: {consulta}")
+    if not await _agente_listo():
+        return _error("El agente no está inicializado", 503)
+    sid, nueva = _sesion(request)
+    historial = sesiones.historial(sid)
+
+    async def generar():
+        try:
+            async for evento in agente.procesar_consulta_stream_async(consulta, historial):
+                yield _evento_sse(evento)
+        except Exception as e:
+            logger.error(f"❌ Error en chat stream: {e}")
+            yield _evento_sse({"tipo": "error", "texto": f"Error procesando la consulta: {str(e)}"})
+
+    return _con_cookie(StreamingResponse(generar(), media_type="text/event-stream", headers=CABECERAS_SSE),
+                       sid, nueva)
+
+
+def estado_servicio() -> dict:
+    """Estado del servicio a partir de la última verificación del monitor (sin peticiones)"""
+    estado = gestor.estado
+    return {
+        "status": "running",
+        "agent_initialized": agente is not None,
+        "ollama_available": estado["ollama_available"],
+        "api_available": estado["api_available"],
+        "ultima_verificacion": estado["ultima_verificacion"],
+    }
+
+
+@app.get("/api/status")
+async def status_endpoint():
+    """Endpoint para verificar el estado del servicio"""
+    status_info = estado_servicio()
+    status_info["sesiones"] = len(sesiones)
+    status_info["cache"] = agente.cache.metricas() if getattr(agente, "cache", None) else None
+
+    if agente is not None:
+        status_info["rutas"] = agente.metricas_rutas.resumen()
+        status_info["latencia_ollama"] = agente.latencias_ollama.resumen()
+        status_info["cola_ollama"] = agente.limitador_ollama_async.en_espera
+        status_info["modelos_ollama"] = agente.modelos.resumen()
+    return status_info
+
+
+@app.get("/api/status/stream")
+async def status_stream_endpoint():
+    """Estado del servicio por SSE: se envía al conectar y cada vez que cambia"""
+
+    async def generar():
+        cambio = gestor.cambios
+        yield _evento_sse({"tipo": "status", **estado_servicio()})
+        inactivo = 0.0
+        # Sondeo del contador de cambios: esperar_cambio() bloquearía un hilo por cliente.
+        # Al desconectarse el cliente, Starlette cancela el generador.
+        while True:
+            await asyncio.sleep(1)
+            if gestor.cambios != cambio:
+                cambio = gestor.cambios
+                inactivo = 0.0
+                yield _evento_sse({"tipo": "status", **estado_servicio()})
+                continue
+            inactivo += 1
+            if inactivo >= config.STATUS_STREAM_KEEPALIVE:
+                inactivo = 0.0
+                yield ": keep-alive\n\n"  # Mantiene viva la conexión a través de proxies
+
+    return StreamingResponse(generar(), media_type="text/event-stream", headers=CABECERAS_SSE)
+
+
+@app.get("/api/metrics")
+async def metrics_endpoint():
+    """Resumen de las trazas por etapa (p50/p95) y de la generación de Ollama"""
+    registro = getattr(agente, "registro_trazas", None)
+    if registro is None:
+        return _error("Las trazas están desactivadas", 404)
+
+    return {
+        "status": "success",
+        "trazas": registro.resumen(),
+        "rutas": agente.metricas_rutas.resumen(),
+        "archivo": registro.path or None,
+    }
+
+
+@app.post("/api/reset")
+async def reset_chat(request: Request):
+    """Endpoint para reiniciar el historial de conversación"""
+    sid = request.cookies.get(COOKIE_SESION)
+    if sid:
+        sesiones.reiniciar(sid)
+        logger.info("🔄 Historial de chat reiniciado")
+    return {"status": "success", "message": "Historial reiniciado correctamente"}
+
+
+@app.get("/api/models")
+async def list_models():
+    """Endpoint para listar modelos disponibles de Ollama (según la última verificación)"""
+    estado = gestor.estado
+    if not estado["ollama_available"]:
+        return _error("No se pudieron obtener los modelos", 500)
+    return {"status": "success", "models": estado["modelos"]}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=5000)
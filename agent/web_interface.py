@@ -1,8 +1,20 @@
 # agent/web_app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, session, stream_with_context
+import json
 import logging
 import sys
 import os
+import uuid
+
+from config import config
+from concurrency import SessionStore
+from manager import AgentManager
+
+# El perfilador es compartido con la API (api/perfilado.py, solo biblioteca estándar)
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ_PROYECTO not in sys.path:
+    sys.path.append(RAIZ_PROYECTO)
+from api.perfilado import FORMATOS, MODOS_PETICION, Perfilador, clave_valida
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -14,29 +26,96 @@ try:
 except ImportError:
     # Si hay error de importación, crear una versión mínima
     class FastOllamaAgent:
-        def __init__(self):
+        def __init__(self, *args, **kwargs):
             self.conversation_history = []
         
-        def procesar_consulta_hibrida(self, consulta: str) -> str:
+        def verificar_conexiones(self):
+            return {'ollama_available': False, 'api_available': False, 'modelos': []}
+        
+        def procesar_consulta_hibrida(self, consulta: str, historial=None) -> str:
             return f"Agente temporal: Recibí tu consulta '{consulta}'. El agente principal está siendo cargado."
+        
+        def procesar_consulta_detallada(self, consulta: str, historial=None):
+            return {'respuesta': self.procesar_consulta_hibrida(consulta), 'metodo': 'Temporal',
+                    'tiempo_ms': 0, 'llm_ms': None}
+        
+        def procesar_consulta_stream(self, consulta: str, historial=None):
+            yield {"tipo": "directo", "texto": self.procesar_consulta_hibrida(consulta)}
+            yield {"tipo": "fin", "metodo": "Temporal", "tiempo": 0}
 
 app = Flask(__name__)
 app.secret_key = 'cannabis_agent_secret_2024'
 
-# Instancia global del agente
+# Instancia global del agente: se crea una sola vez y las conexiones se
+# verifican en segundo plano (con reintentos y backoff) fuera del camino del chat
 agente = None
+gestor = AgentManager(
+    lambda: FastOllamaAgent(check_connections=False),
+    intervalo=config.HEALTH_CHECK_INTERVAL,
+    backoff_max=config.HEALTH_CHECK_BACKOFF_MAX
+)
+
+# Historial de conversación por usuario (el agente es compartido y sin estado de sesión)
+sesiones = SessionStore(max_sesiones=config.MAX_SESSIONS, ttl=config.SESSION_TTL)
+
+def historial_sesion():
+    """Historial de la sesión del navegador actual"""
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return sesiones.historial(session['sid'])
+
+perfilador = Perfilador()
+
+def _perfilar_peticion():
+    """Perfil de la petición con X-Profile, o de la sesión de perfilado en curso"""
+    if clave_valida(request.headers.get('X-Profile'), config.ADMIN_API_KEY):
+        modo = request.headers.get('X-Profile-Mode', 'pilas')
+        try:
+            g.perfil = perfilador.comenzar_peticion(modo if modo in MODOS_PETICION else 'pilas',
+                                                    request.headers.get('X-Profile-Memory') == '1')
+        except RuntimeError as e:
+            # Solo un perfil de petición a la vez
+            return jsonify({'status': 'error', 'error': str(e)}), 409
+    else:
+        g.sesion_perfilado = perfilador.antes_peticion()
+
+def _id_perfil(response):
+    perfil = g.get('perfil')
+    if perfil is not None:
+        response.headers['X-Profile-Id'] = perfil.id
+    return response
+
+def _terminar_perfil(error=None):
+    # En teardown_request: se ejecuta también si la vista lanzó una excepción (after_request no),
+    # así el perfil de petición no queda abierto ni su hook instalado en el hilo.
+    # En las respuestas en streaming solo se perfila hasta que empieza el cuerpo
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        perfilador.terminar_peticion(perfil)
+    elif 'sesion_perfilado' in g:
+        perfilador.despues_peticion(g.pop('sesion_perfilado'))
+
+def registrar_perfilado(aplicacion):
+    """Perfilado por petición (X-Profile) y de la sesión en curso en `aplicacion`"""
+    aplicacion.before_request(_perfilar_peticion)
+    aplicacion.after_request(_id_perfil)
+    aplicacion.teardown_request(_terminar_perfil)
+
+if config.ADMIN_API_KEY:
+    # Sin clave no se registra nada: el perfilado desactivado no cuesta nada por petición
+    registrar_perfilado(app)
+
+def _admin_autorizado():
+    return clave_valida(request.headers.get('X-Admin-Key'), config.ADMIN_API_KEY)
 
 def inicializar_agente():
     """Inicializa el agente de manera segura"""
     global agente
     try:
-        agente = FastOllamaAgent()
-        logger.info("✅ Agente inicializado correctamente")
+        agente = gestor.iniciar()
         return True
     except Exception as e:
         logger.error(f"❌ Error inicializando agente: {e}")
-        # Crear agente de respaldo
-        agente = FastOllamaAgent()  # Usará la clase de respaldo si hay error
         return False
 
 @app.route('/')
@@ -64,13 +143,17 @@ def chat_endpoint():
             inicializar_agente()
         
         # Procesar la consulta
-        respuesta = agente.procesar_consulta_hibrida(consulta)
+        resultado = agente.procesar_consulta_detallada(consulta, historial_sesion())
+        respuesta = resultado['respuesta']
         
-        logger.info(f"✅ Respuesta generada: {len(respuesta)} caracteres")
+        logger.info(f"✅ Respuesta generada: {len(respuesta)} caracteres ({resultado['metodo']})")
         
         return jsonify({
             'status': 'success',
             'response': respuesta,
+            'metodo': resultado['metodo'],
+            'tiempo_ms': resultado['tiempo_ms'],
+            'llm_ms': resultado['llm_ms'],
             'timestamp': os.times().elapsed  # Tiempo de procesamiento aproximado
         })
         
@@ -81,32 +164,107 @@ def chat_endpoint():
             'error': f'Error procesando la consulta: {str(e)}'
         }), 500
 
+def _evento_sse(evento: dict) -> str:
+    """Serializa un evento del agente en formato Server-Sent Events"""
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    """Endpoint de chat en streaming (SSE): respuesta directa primero y luego los tokens de Ollama"""
+    data = request.get_json(silent=True) or {}
+    consulta = data.get('message', '').strip()
+    
+    if not consulta:
+        return jsonify({
+            'status': 'error',
+            'error': 'La consulta no puede estar vacía'
+        }), 400
+    
+    logger.info(f"📨 Consulta (stream) recibida: {consulta}")
+    
+    if agente is None:
+        inicializar_agente()
+    
+    historial = historial_sesion()
+    
+    def generar():
+        try:
+            for evento in agente.procesar_consulta_stream(consulta, historial):
+                yield _evento_sse(evento)
+        except Exception as e:
+            logger.error(f"❌ Error en chat stream: {e}")
+            yield _evento_sse({'tipo': 'error', 'texto': f'Error procesando la consulta: {str(e)}'})
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Evita que un proxy acumule el stream
+        }
+    )
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch_endpoint():
+    """Lote de consultas independientes: un resultado NDJSON por línea a medida que terminan"""
+    data = request.get_json(silent=True) or {}
+    consultas = [str(c).strip() for c in data.get('messages', []) if str(c).strip()]
+    
+    if not consultas:
+        return jsonify({
+            'status': 'error',
+            'error': 'El lote debe incluir al menos una consulta en "messages"'
+        }), 400
+    
+    if config.BATCH_MAX_SIZE and len(consultas) > config.BATCH_MAX_SIZE:
+        return jsonify({
+            'status': 'error',
+            'error': f'El lote admite como máximo {config.BATCH_MAX_SIZE} consultas'
+        }), 400
+    
+    logger.info(f"📨 Lote recibido: {len(consultas)} consultas")
+    
+    if agente is None:
+        inicializar_agente()
+    
+    def generar():
+        try:
+            for resultado in agente.procesar_lote(consultas):
+                yield json.dumps(resultado, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"❌ Error en lote: {e}")
+            yield json.dumps({'tipo': 'error', 'error': str(e)}, ensure_ascii=False) + "\n"
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
+def estado_servicio() -> dict:
+    """Estado del servicio a partir de la última verificación del monitor (sin peticiones)"""
+    estado = gestor.estado
+    return {
+        'status': 'running',
+        'agent_initialized': agente is not None,
+        'ollama_available': estado['ollama_available'],
+        'api_available': estado['api_available'],
+        'ultima_verificacion': estado['ultima_verificacion'],
+    }
+
 @app.route('/api/status', methods=['GET'])
 def status_endpoint():
     """Endpoint para verificar el estado del servicio"""
     try:
-        status_info = {
-            'status': 'running',
-            'agent_initialized': agente is not None,
-            'ollama_available': False,
-            'api_available': False
-        }
+        status_info = estado_servicio()
+        status_info['sesiones'] = len(sesiones)
+        status_info['cache'] = agente.cache.metricas() if getattr(agente, 'cache', None) else None
         
-        # Verificar Ollama
-        try:
-            import requests
-            response = requests.get('http://localhost:11434/api/tags', timeout=3)
-            status_info['ollama_available'] = response.status_code == 200
-        except:
-            status_info['ollama_available'] = False
-        
-        # Verificar API
-        try:
-            import requests
-            response = requests.get('http://localhost:8000/', timeout=3)
-            status_info['api_available'] = response.status_code == 200
-        except:
-            status_info['api_available'] = False
+        if hasattr(agente, 'metricas_rutas'):
+            status_info['rutas'] = agente.metricas_rutas.resumen()
+            status_info['latencia_ollama'] = agente.latencias_ollama.resumen()
+            status_info['cola_ollama'] = agente.limitador_ollama.en_espera
+            status_info['modelos_ollama'] = agente.modelos.resumen()
         
         return jsonify(status_info)
         
@@ -116,12 +274,55 @@ def status_endpoint():
             'error': str(e)
         }), 500
 
+@app.route('/api/status/stream', methods=['GET'])
+def status_stream_endpoint():
+    """Estado del servicio por SSE: se envía al conectar y cada vez que cambia"""
+    if agente is None:
+        inicializar_agente()
+    
+    def generar():
+        cambio, _ = gestor.esperar_cambio(-1, timeout=0)
+        yield _evento_sse({'tipo': 'status', **estado_servicio()})
+        while True:
+            nuevo, _ = gestor.esperar_cambio(cambio, timeout=config.STATUS_STREAM_KEEPALIVE)
+            if nuevo == cambio:
+                yield ": keep-alive\n\n"  # Mantiene viva la conexión a través de proxies
+                continue
+            cambio = nuevo
+            yield _evento_sse({'tipo': 'status', **estado_servicio()})
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Resumen de las trazas por etapa (p50/p95) y de la generación de Ollama"""
+    registro = getattr(agente, 'registro_trazas', None)
+    if registro is None:
+        return jsonify({
+            'status': 'error',
+            'error': 'Las trazas están desactivadas'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'trazas': registro.resumen(),
+        'rutas': agente.metricas_rutas.resumen(),
+        'archivo': registro.path or None
+    })
+
 @app.route('/api/reset', methods=['POST'])
 def reset_chat():
     """Endpoint para reiniciar el historial de conversación"""
     try:
-        if agente and hasattr(agente, 'conversation_history'):
-            agente.conversation_history = []
+        if 'sid' in session:
+            sesiones.reiniciar(session['sid'])
             logger.info("🔄 Historial de chat reiniciado")
         
         return jsonify({
@@ -138,32 +339,65 @@ def reset_chat():
 
 @app.route('/api/models', methods=['GET'])
 def list_models():
-    """Endpoint para listar modelos disponibles de Ollama"""
-    try:
-        import requests
-        response = requests.get('http://localhost:11434/api/tags', timeout=5)
-        if response.status_code == 200:
-            models = response.json().get('models', [])
-            return jsonify({
-                'status': 'success',
-                'models': [model['name'] for model in models]
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'error': 'No se pudieron obtener los modelos'
-            }), 500
-            
-    except Exception as e:
+    """Endpoint para listar modelos disponibles de Ollama (según la última verificación)"""
+    estado = gestor.estado
+    if not estado['ollama_available']:
         return jsonify({
             'status': 'error',
-            'error': str(e)
+            'error': 'No se pudieron obtener los modelos'
         }), 500
+    
+    return jsonify({
+        'status': 'success',
+        'models': estado['modelos']
+    })
 
-# Inicializar el agente al cargar la aplicación
-@app.before_request
-def initialize():
-    inicializar_agente()
+@app.route('/api/admin/perfilado', methods=['GET', 'POST', 'DELETE'])
+def perfilado_endpoint():
+    """Sesión de perfilado: GET estado, POST inicia (modo, segundos, peticiones, memoria), DELETE termina"""
+    if not config.ADMIN_API_KEY:
+        return jsonify({'status': 'error', 'error': 'Perfilado desactivado'}), 404
+    if not _admin_autorizado():
+        return jsonify({'status': 'error', 'error': 'Clave de administración inválida'}), 403
+    
+    if request.method == 'GET':
+        return jsonify({'status': 'success', **perfilador.resumen()})
+    
+    if request.method == 'DELETE':
+        perfil = perfilador.detener()
+        if perfil is None:
+            return jsonify({'status': 'error', 'error': 'No hay una sesión de perfilado en curso'}), 404
+        return jsonify({'status': 'success', 'perfil': perfil.resumen()})
+    
+    try:
+        perfil = perfilador.iniciar(
+            request.args.get('modo', 'muestreo'),
+            segundos=request.args.get('segundos', type=float),
+            peticiones=request.args.get('peticiones', type=int),
+            memoria=request.args.get('memoria', 'false').lower() == 'true'
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 409
+    return jsonify({'status': 'success', 'perfil': perfil.resumen()})
+
+@app.route('/api/admin/perfilado/<perfil_id>', methods=['GET'])
+def perfil_endpoint(perfil_id):
+    """Resultado de un perfil como texto: folded (flamegraph.pl, speedscope), texto (pstats) o memoria"""
+    if not config.ADMIN_API_KEY:
+        return jsonify({'status': 'error', 'error': 'Perfilado desactivado'}), 404
+    if not _admin_autorizado():
+        return jsonify({'status': 'error', 'error': 'Clave de administración inválida'}), 403
+    
+    perfil = perfilador.obtener(perfil_id)
+    if perfil is None:
+        return jsonify({'status': 'error', 'error': f'Perfil {perfil_id} no encontrado'}), 404
+    formato = request.args.get('formato', 'folded')
+    try:
+        return Response(perfil.salida(formato), mimetype='text/plain')
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': f"{e} (formatos: {', '.join(FORMATOS)})"}), 400
 
 if __name__ == '__main__':
     # Inicializar el agente antes de ejecutar el servidor
@@ -0,0 +1,133 @@
+# api/benchmark_busqueda.py
+"""
+Compara la búsqueda fuzzy por trigramas (api/indices.py) con el LIKE de SQLite
+y con un recorrido completo calculando la similitud de cada nombre, a medida
+que crece el número de filas (nombres sintéticos).
+
+    python api/benchmark_busqueda.py --filas 1000,10000,100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import consultas
+from api.indices import IndiceTrigramas, normalizar, similitud, trigramas
+
+SILABAS = ["ca", "ta", "gen", "bo", "ya", "me", "de", "llin", "san", "to", "ri", "mar", "que", "la", "pa", "lo",
+           "sil", "va", "nia", "hu", "ila", "cun", "di", "na", "ma", "ar", "me", "ni", "a", "te"]
+DEPARTAMENTOS = ["Antioquia", "Cundinamarca", "Valle del Cauca", "Santander", "Boyacá", "Huila", "Tolima",
+                 "Cauca", "Nariño", "Caldas", "Risaralda", "Quindío", "Meta", "Bolívar", "Magdalena"]
+
+# (q, filtros): consultas con errores de escritura
+CONSULTAS = [
+    ("Medelin", {}),
+    ("Cundinamrca", {"min_total": 5}),
+    ("santader", {}),
+    ("bogta", {}),
+    ("tolima", {"max_total": 20}),
+    ("san marino", {"departamento": "Antioquia"}),
+]
+
+
+def generar_filas(n: int, semilla: int = 7):
+    """n licencias sintéticas (más algunas reales conocidas) con nombres de 1 a 3 palabras"""
+    aleatorio = random.Random(semilla)
+    filas = [
+        {"departamento": "Antioquia", "municipio": "Medellín"},
+        {"departamento": "Bogotá D.C.", "municipio": "Bogotá D.C."},
+        {"departamento": "Santander", "municipio": "Bucaramanga"},
+    ]
+    while len(filas) < n:
+        palabras = ["".join(aleatorio.choice(SILABAS) for _ in range(aleatorio.randint(2, 4)))
+                    for _ in range(aleatorio.choice((1, 1, 2, 3)))]
+        filas.append({"departamento": aleatorio.choice(DEPARTAMENTOS),
+                      "municipio": " ".join(p.capitalize() for p in palabras)})
+
+    licencias = []
+    for i, fila in enumerate(filas, 1):
+        no_psico, psico, semillas = aleatorio.randint(0, 20), aleatorio.randint(0, 20), aleatorio.randint(0, 10)
+        licencias.append({"id": i, **fila, "no_psico": no_psico, "psico": psico, "semillas": semillas,
+                          "total": no_psico + psico + semillas})
+    licencias.sort(key=lambda l: -l["total"])
+    return licencias
+
+
+def base_en_memoria(licencias):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("""CREATE TABLE licencias (id INTEGER PRIMARY KEY, departamento TEXT, municipio TEXT,
+                    no_psico INTEGER, psico INTEGER, semillas INTEGER, total INTEGER)""")
+    conn.executemany(
+        "INSERT INTO licencias VALUES (:id, :departamento, :municipio, :no_psico, :psico, :semillas, :total)",
+        licencias
+    )
+    return conn
+
+
+def recorrido_completo(licencias, q: str, departamento=None, min_total=None, max_total=None, minimo=0.4):
+    """Sin índice: similitud de cada fila con la consulta"""
+    tri_consulta = trigramas(normalizar(q))
+    resultados = []
+    for licencia in licencias:
+        if departamento and licencia["departamento"] != departamento:
+            continue
+        if min_total is not None and licencia["total"] < min_total:
+            continue
+        if max_total is not None and licencia["total"] > max_total:
+            continue
+        puntuacion = max(similitud(tri_consulta, trigramas(normalizar(licencia[campo])))
+                         for campo in ("municipio", "departamento"))
+        if puntuacion >= minimo:
+            resultados.append((puntuacion, licencia))
+    return resultados
+
+
+def medir(funcion, repeticiones: int):
+    """p50 y p95 (ms) de todas las consultas repetidas"""
+    latencias = []
+    for _ in range(repeticiones):
+        for q, filtros in CONSULTAS:
+            inicio = time.perf_counter()
+            funcion(q, filtros)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+    latencias.sort()
+    return statistics.median(latencias), latencias[int(len(latencias) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda fuzzy por trigramas")
+    parser.add_argument("--filas", default="1000,10000,100000")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"⏱️ {len(CONSULTAS)} consultas x {args.repeticiones} repeticiones (p50 / p95 en ms)\n")
+    print(f"{'filas':>7} {'índice':>9} {'fuzzy':>17} {'like':>17} {'recorrido':>17}")
+
+    for n in (int(valor) for valor in args.filas.split(",")):
+        licencias = generar_filas(n)
+
+        inicio = time.perf_counter()
+        indice = IndiceTrigramas(licencias)
+        construccion = (time.perf_counter() - inicio) * 1000
+
+        conn = base_en_memoria(licencias)
+        fuzzy = medir(lambda q, f: indice.buscar(q, **f), args.repeticiones)
+        like = medir(lambda q, f: consultas.buscar_licencias(conn, q=q, **f), args.repeticiones)
+        # El recorrido completo es lento: menos repeticiones
+        recorrido = medir(lambda q, f: recorrido_completo(licencias, q, **f), max(1, args.repeticiones // 10))
+        conn.close()
+
+        columnas = " ".join(f"{p50:>7.3f} / {p95:>7.3f}" for p50, p95 in (fuzzy, like, recorrido))
+        print(f"{n:>7} {construccion:>7.0f}ms {columnas}")
+
+    print("\nlike no tolera errores de escritura: se incluye solo como referencia de latencia")
+
+
+if __name__ == "__main__":
+    main()
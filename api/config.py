@@ -10,4 +10,29 @@ class Settings:
     PORT: int = int(os.getenv("PORT", 8000))
     RELOAD: bool = os.getenv("RELOAD", "True").lower() == "true"
 
-settings = Settings()
\ No newline at end of file
+    # Límite de peticiones (token bucket): tokens por segundo y ráfaga máxima
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+    RATE_LIMIT_IP_RATE: float = float(os.getenv("RATE_LIMIT_IP_RATE", 20))
+    RATE_LIMIT_IP_BURST: float = float(os.getenv("RATE_LIMIT_IP_BURST", 40))
+    RATE_LIMIT_KEY_RATE: float = float(os.getenv("RATE_LIMIT_KEY_RATE", 50))
+    RATE_LIMIT_KEY_BURST: float = float(os.getenv("RATE_LIMIT_KEY_BURST", 100))
+    # Clientes con la API_KEY del servicio (el agente): bucket propio, sin el límite por IP
+    RATE_LIMIT_SERVICE_RATE: float = float(os.getenv("RATE_LIMIT_SERVICE_RATE", 500))
+    RATE_LIMIT_SERVICE_BURST: float = float(os.getenv("RATE_LIMIT_SERVICE_BURST", 1000))
+    # POST /actualizar-datos: peticiones por minuto por cliente
+    RATE_LIMIT_ETL_PER_MIN: float = float(os.getenv("RATE_LIMIT_ETL_PER_MIN", 1))
+    # Cada RATE_LIMIT_OFFSET_COST filas de `skip` cuestan un token más (paginación profunda)
+    RATE_LIMIT_OFFSET_COST: int = int(os.getenv("RATE_LIMIT_OFFSET_COST", 500))
+    # Almacén compartido entre workers (redis://...); vacío = memoria del proceso
+    RATE_LIMIT_REDIS_URL: str = os.getenv("RATE_LIMIT_REDIS_URL", "")
+
+    # Control de admisión: peticiones en curso, en cola y espera máxima en cola (s)
+    MAX_CONCURRENT_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", 32))
+    MAX_QUEUED_REQUESTS: int = int(os.getenv("MAX_QUEUED_REQUESTS", 64))
+    QUEUE_TIMEOUT: float = float(os.getenv("QUEUE_TIMEOUT", 0.5))
+
+    # Clave de administración para el perfilado bajo demanda (/admin/perfilado y la
+    # cabecera X-Profile); vacía = perfilado desactivado y sin coste
+    ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY", "")
+
+settings = Settings()
@@ -0,0 +1,278 @@
+# api/consultas.py
+"""
+Capa de consultas sobre la base de datos de licencias. No depende de FastAPI:
+la usan los endpoints de api/main.py y el agente cuando accede a los datos
+en el mismo proceso.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "cannabis_licencias.db")
+
+# Artefacto inmutable publicado por el ETL (etl/publicacion.py); si no hay manifest
+# se usa DATABASE_URL
+ARTIFACT_DIR = os.getenv(
+    "DB_ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artefactos")
+)
+MANIFEST = "manifest.json"
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 256 * 1024 * 1024))
+
+TIPOS_ORDEN = ['no_psico', 'psico', 'semillas', 'total']
+
+COLUMNAS = ['id', 'departamento', 'municipio', 'no_psico', 'psico', 'semillas', 'total']
+
+
+# Manifest vigente: (stat del manifest, manifest con la ruta del artefacto)
+_artefacto: Optional[Tuple[Tuple[int, int, int], Optional[Dict]]] = None
+_artefacto_lock = threading.Lock()
+
+
+def _cargar_artefacto(ruta_manifest: str) -> Optional[Dict]:
+    """Lee el manifest y verifica el checksum del artefacto (None si algo no cuadra)"""
+    try:
+        with open(ruta_manifest, encoding="utf-8") as archivo:
+            manifest = json.load(archivo)
+        ruta = os.path.join(os.path.dirname(ruta_manifest), manifest["archivo"])
+        h = hashlib.sha256()
+        with open(ruta, "rb") as archivo:
+            for bloque in iter(lambda: archivo.read(1 << 20), b""):
+                h.update(bloque)
+        if h.hexdigest() != manifest["sha256"]:
+            raise ValueError(f"checksum distinto en {manifest['archivo']}")
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Artefacto de datos no válido, se mantiene el anterior: {e}")
+        return None
+    return {**manifest, "ruta": ruta}
+
+
+def artefacto_actual() -> Optional[Dict]:
+    """Manifest del artefacto publicado (None si no hay); se relee cuando el manifest cambia"""
+    global _artefacto
+    ruta_manifest = os.path.join(ARTIFACT_DIR, MANIFEST)
+    try:
+        stat = os.stat(ruta_manifest)
+    except FileNotFoundError:
+        return None
+    clave = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    actual = _artefacto
+    if actual is not None and actual[0] == clave:
+        return actual[1]
+
+    with _artefacto_lock:
+        if _artefacto is None or _artefacto[0] != clave:
+            manifest = _cargar_artefacto(ruta_manifest)
+            anterior = _artefacto[1] if _artefacto else None
+            if manifest is not None and (anterior is None or anterior["version"] != manifest["version"]):
+                logger.info(f"Datos en el artefacto {manifest['archivo']} (versión {manifest['version']})")
+            # Un manifest no válido no se reintenta hasta que vuelva a cambiar
+            _artefacto = (clave, manifest or anterior)
+        return _artefacto[1]
+
+
+# Conexion a la base de datos
+def get_db_connection(db_path: str = None):
+    artefacto = artefacto_actual() if db_path is None else None
+    if artefacto is not None:
+        # Inmutable: sin bloqueos ni comprobaciones de cambios; mmap comparte las páginas entre procesos
+        conn = sqlite3.connect(f"file:{artefacto['ruta']}?mode=ro&immutable=1", uri=True)
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    else:
+        conn = sqlite3.connect(db_path or DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def obtener_version_datos(db_path: str = None) -> str:
+    """Versión de los datos: la del artefacto publicado o, sin él, una por cada escritura de la base de datos"""
+    artefacto = artefacto_actual() if db_path is None else None
+    if artefacto is not None:
+        return artefacto["version"]
+    stat = os.stat(db_path or DATABASE_URL)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def fuente_datos(db_path: str = None) -> Dict:
+    """Origen de los datos que se sirven: el artefacto publicado o la base de datos del ETL"""
+    artefacto = artefacto_actual() if db_path is None else None
+    if artefacto is not None:
+        return {"version": artefacto["version"], "fuente": "artefacto", "archivo": artefacto["archivo"],
+                "publicado": artefacto.get("publicado")}
+    return {"version": obtener_version_datos(db_path), "fuente": "base_de_datos",
+            "archivo": os.path.basename(db_path or DATABASE_URL)}
+
+
+def validar_campos(campos: Optional[List[str]]) -> Optional[List[str]]:
+    """Campos pedidos sin repetir (None = todos). Lanza ValueError si alguno no es una columna"""
+    if not campos:
+        return None
+    invalidos = [campo for campo in campos if campo not in COLUMNAS]
+    if invalidos:
+        raise ValueError(f"Campos no válidos: {', '.join(invalidos)} (válidos: {', '.join(COLUMNAS)})")
+    return list(dict.fromkeys(campos))
+
+
+def _proyeccion(campos: Optional[List[str]]) -> str:
+    # Solo nombres de COLUMNAS, así que pueden ir en el SQL
+    campos = validar_campos(campos)
+    return ", ".join(campos) if campos else "*"
+
+
+def listar_licencias(conn, skip: int = 0, limit: int = 10, campos: Optional[List[str]] = None) -> Dict:
+    """Lista las licencias paginadas, ordenadas por total (solo `campos` si se indican)"""
+    cursor = conn.cursor()
+    proyeccion = _proyeccion(campos)
+
+    # Obtener total de registros
+    cursor.execute("SELECT COUNT(*) FROM licencias")
+    total = cursor.fetchone()[0]
+
+    # Obtener registros paginados
+    cursor.execute(f"SELECT {proyeccion} FROM licencias ORDER BY total DESC LIMIT ? OFFSET ?", (limit, skip))
+    resultados = [dict(row) for row in cursor.fetchall()]
+
+    return {
+        "resultados": resultados,
+        "total": total,
+        "pagina": skip // limit + 1,
+        "por_pagina": limit
+    }
+
+
+def todas_las_licencias(conn) -> List[Dict]:
+    """Todas las licencias, ordenadas por total (para los índices en memoria)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM licencias ORDER BY total DESC")
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def obtener_licencia(conn, licencia_id: int) -> Optional[Dict]:
+    """Obtiene una licencia por ID (None si no existe)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM licencias WHERE id = ?", (licencia_id,))
+    licencia = cursor.fetchone()
+    return dict(licencia) if licencia else None
+
+
+def buscar_licencias(
+    conn,
+    q: Optional[str] = None,
+    departamento: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo: Optional[str] = None,
+    min_total: Optional[int] = None,
+    max_total: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 10,
+    campos: Optional[List[str]] = None
+) -> Dict:
+    """Busca licencias por termino y aplica filtros (solo `campos` si se indican)"""
+    cursor = conn.cursor()
+
+    # Construir query dinamica
+    query = f"SELECT {_proyeccion(campos)} FROM licencias WHERE 1=1"
+    params = []
+
+    # Busqueda por término
+    if q:
+        query += " AND (departamento LIKE ? OR municipio LIKE ?)"
+        params.extend([f"%{q}%", f"%{q}%"])
+
+    # Filtros adicionales
+    if departamento:
+        query += " AND departamento = ?"
+        params.append(departamento)
+
+    if municipio:
+        query += " AND municipio = ?"
+        params.append(municipio)
+
+    if min_total is not None:
+        query += " AND total >= ?"
+        params.append(min_total)
+
+    if max_total is not None:
+        query += " AND total <= ?"
+        params.append(max_total)
+
+    # Ordernar por el tipo especificado o por total por defecto
+    if tipo and tipo in TIPOS_ORDEN:
+        query += f" ORDER BY {tipo} DESC"
+    else:
+        query += f" ORDER BY total DESC"
+
+    # Contar total de resultados
+    count_query = f"SELECT COUNT(*) FROM ({query})"
+    cursor.execute(count_query, params)
+    total = cursor.fetchone()[0]
+
+    # Aplicar paginacion
+    query += " LIMIT ? OFFSET ?"
+    params.extend([limit, skip])
+
+    cursor.execute(query, params)
+    resultados = [dict(row) for row in cursor.fetchall()]
+
+    return {
+        "resultados": resultados,
+        "total": total,
+        "pagina": skip // limit + 1,
+        "por_pagina": limit
+    }
+
+
+def obtener_estadisticas(conn) -> Dict:
+    """Obtiene estadisticas generales de las licencias"""
+    cursor = conn.cursor()
+
+    estadisticas = {}
+
+    # Totales generales
+    cursor.execute("""
+        SELECT
+            COUNT(*) as total_municipios,
+            SUM(total) as total_licencias,
+            SUM(no_psico) as total_no_psico,
+            SUM(psico) as total_psico,
+            SUM(semillas) as total_semillas,
+            AVG(total) as promedio_por_municipio
+        FROM licencias
+    """)
+
+    stats = cursor.fetchone()
+    estadisticas["totales"] = dict(stats)
+
+    # Top 5 departamentos con más licencias
+    cursor.execute("""
+        SELECT departamento, SUM(total) as total_licencias
+        FROM licencias
+        GROUP BY departamento
+        ORDER BY total_licencias DESC
+        LIMIT 5
+    """)
+    estadisticas["top_departamentos"] = [dict(row) for row in cursor.fetchall()]
+
+    # Distribución por rangos
+    cursor.execute("""
+        SELECT
+            CASE
+                WHEN total = 0 THEN 'Sin licencias'
+                WHEN total BETWEEN 1 AND 5 THEN '1-5'
+                WHEN total BETWEEN 6 AND 20 THEN '6-20'
+                WHEN total > 20 THEN 'Más de 20'
+            END as rango,
+            COUNT(*) as cantidad_municipios
+        FROM licencias
+        GROUP BY rango
+        ORDER BY cantidad_municipios DESC
+    """)
+    estadisticas["distribucion_rangos"] = [dict(row) for row in cursor.fetchall()]
+
+    return estadisticas
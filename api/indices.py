@@ -0,0 +1,332 @@
+# api/indices.py
+"""
+Índices en memoria sobre las licencias, construidos una vez por versión de
+los datos (se reconstruyen cuando el ETL reescribe la base de datos).
+"""
+import bisect
+import math
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set
+
+from api import consultas
+
+# Palabras que no inician una sugerencia ("de" en "Santiago De Cali")
+CONECTORES = {"de", "del", "la", "las", "el", "los", "y"}
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes, para comparar lo que escribe el usuario con los nombres"""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return " ".join("".join(c for c in descompuesto if not unicodedata.combining(c)).split())
+
+
+class IndicePrefijos:
+    """
+    Sugerencias de municipios y departamentos por prefijo. Las claves (el nombre
+    normalizado y cada palabra del nombre en adelante) están ordenadas, así que un
+    prefijo es un rango encontrado con bisect; las entradas están ordenadas por
+    total, así que las k mejores del rango son las k de menor posición.
+    """
+
+    def __init__(self, licencias: List[Dict]):
+        departamentos: Dict[str, int] = {}
+        for licencia in licencias:
+            departamentos[licencia["departamento"]] = departamentos.get(licencia["departamento"], 0) + licencia["total"]
+
+        entradas = [
+            {"tipo": "municipio", "nombre": l["municipio"], "departamento": l["departamento"], "total": l["total"]}
+            for l in licencias
+        ] + [
+            {"tipo": "departamento", "nombre": nombre, "departamento": None, "total": total}
+            for nombre, total in departamentos.items()
+        ]
+        entradas.sort(key=lambda e: (-e["total"], e["nombre"], e["departamento"] or ""))
+        self.entradas = entradas
+
+        pares = []
+        for posicion, entrada in enumerate(entradas):
+            palabras = normalizar(entrada["nombre"]).split()
+            for i, palabra in enumerate(palabras):
+                if i == 0 or palabra not in CONECTORES:
+                    pares.append((" ".join(palabras[i:]), posicion))
+        pares.sort()
+        self._claves = [clave for clave, _ in pares]
+        self._posiciones = [posicion for _, posicion in pares]
+
+    def sugerir(self, prefijo: str, limite: int = 10) -> List[Dict]:
+        prefijo = normalizar(prefijo)
+        if not prefijo:
+            return []
+        inicio = bisect.bisect_left(self._claves, prefijo)
+        fin = bisect.bisect_left(self._claves, prefijo + "￿", inicio)
+        posiciones = sorted(set(self._posiciones[inicio:fin]))[:limite]
+        return [self.entradas[p] for p in posiciones]
+
+
+def trigramas(texto: str) -> FrozenSet[str]:
+    """Trigramas de cada palabra con relleno ('  me', ' me', ...), como pg_trgm"""
+    resultado: Set[str] = set()
+    for palabra in texto.split():
+        relleno = f"  {palabra} "
+        resultado.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return frozenset(resultado)
+
+
+def similitud(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Trigramas compartidos sobre trigramas totales (0 a 1)"""
+    if not a or not b:
+        return 0.0
+    comunes = len(a & b)
+    return comunes / (len(a) + len(b) - comunes)
+
+
+class IndiceTrigramas:
+    """
+    Búsqueda tolerante a errores de escritura ("Medelin", "Cundinamrca") sobre los
+    nombres normalizados de municipios y departamentos. La lista invertida
+    trigrama -> nombres cuenta, sin recorrer todos los nombres, cuántos trigramas
+    comparte cada candidato con la consulta; ese conteo acota su similitud y
+    descarta la mayoría antes de puntuarlos.
+    """
+
+    def __init__(self, licencias: List[Dict]):
+        self.licencias = licencias
+        ids: Dict[str, int] = {}
+        self._trigramas: List[FrozenSet[str]] = []
+        self._palabras: List[List[FrozenSet[str]]] = []  # Trigramas de cada palabra significativa
+        self._minimo: List[int] = []  # Menor número de trigramas de una de sus palabras
+        self._filas: List[List[int]] = []
+
+        for fila, licencia in enumerate(licencias):
+            for campo in ("municipio", "departamento"):
+                nombre = normalizar(licencia[campo])
+                if nombre not in ids:
+                    ids[nombre] = len(self._trigramas)
+                    palabras = [trigramas(p) for p in nombre.split() if p not in CONECTORES] or [trigramas(nombre)]
+                    self._trigramas.append(trigramas(nombre))
+                    self._palabras.append(palabras)
+                    self._minimo.append(min(len(p) for p in palabras))
+                    self._filas.append([])
+                filas = self._filas[ids[nombre]]
+                if not filas or filas[-1] != fila:
+                    filas.append(fila)
+
+        self._invertido: Dict[str, List[int]] = {}
+        for id_nombre, tri in enumerate(self._trigramas):
+            for t in tri:
+                self._invertido.setdefault(t, []).append(id_nombre)
+
+    def _puntuar(self, id_nombre: int, comunes: int, tri_consulta: FrozenSet[str],
+                 tri_palabras: List[FrozenSet[str]]) -> float:
+        """Similitud del nombre con la consulta completa o de alguna de sus palabras con una de la consulta"""
+        tri_nombre = self._trigramas[id_nombre]
+        mejor = comunes / (len(tri_consulta) + len(tri_nombre) - comunes)
+        for palabra in self._palabras[id_nombre]:
+            for tri in tri_palabras:
+                mejor = max(mejor, similitud(tri, palabra))
+        return mejor
+
+    def buscar(self, q: str, departamento: Optional[str] = None, min_total: Optional[int] = None,
+               max_total: Optional[int] = None, similitud_minima: float = 0.4) -> List[Dict]:
+        """Licencias cuyo municipio o departamento se parece a `q`, de mayor a menor similitud y total"""
+        consulta = normalizar(q)
+        tri_consulta = trigramas(consulta)
+        if not tri_consulta:
+            return []
+        tri_palabras = [trigramas(p) for p in consulta.split() if p not in CONECTORES]
+
+        # Candidatos: nombres que comparten trigramas con la consulta
+        conteo = Counter()
+        for t in tri_consulta:
+            conteo.update(self._invertido.get(t, ()))
+
+        puntuaciones: Dict[int, float] = {}
+        for id_nombre, comunes in conteo.items():
+            # Ninguna parte del nombre puede superar comunes / trigramas de su palabra más corta
+            if comunes < similitud_minima * self._minimo[id_nombre]:
+                continue
+            puntuacion = self._puntuar(id_nombre, comunes, tri_consulta, tri_palabras)
+            if puntuacion < similitud_minima:
+                continue
+            for fila in self._filas[id_nombre]:
+                if puntuacion > puntuaciones.get(fila, 0):
+                    puntuaciones[fila] = puntuacion
+
+        resultados = []
+        for fila, puntuacion in puntuaciones.items():
+            licencia = self.licencias[fila]
+            if departamento and licencia["departamento"] != departamento:
+                continue
+            if min_total is not None and licencia["total"] < min_total:
+                continue
+            if max_total is not None and licencia["total"] > max_total:
+                continue
+            resultados.append({**licencia, "similitud": round(puntuacion, 3)})
+
+        resultados.sort(key=lambda r: (-r["similitud"], -r["total"]))
+        return resultados
+
+
+def buscar_fuzzy(indices: "Indices", q: str, departamento: Optional[str] = None, municipio: Optional[str] = None,
+                 min_total: Optional[int] = None, max_total: Optional[int] = None, skip: int = 0,
+                 limit: int = 10, similitud_minima: float = 0.4, campos: Optional[List[str]] = None) -> Dict:
+    """Búsqueda por similitud con los mismos filtros y forma de respuesta que consultas.buscar_licencias"""
+    campos = consultas.validar_campos(campos)
+    resultados = indices.trigramas.buscar(q, departamento, min_total, max_total, similitud_minima)
+    if municipio:
+        resultados = [r for r in resultados if r["municipio"] == municipio]
+    pagina = resultados[skip:skip + limit]
+    if campos:
+        pagina = [{**{campo: r[campo] for campo in campos}, "similitud": r["similitud"]} for r in pagina]
+    return {
+        "resultados": pagina,
+        "total": len(resultados),
+        "pagina": skip // limit + 1,
+        "por_pagina": limit
+    }
+
+
+# Agregados disponibles en /licencias/agregados (además de percentiles pNN)
+FUNCIONES_AGREGADO = {
+    "sum": sum,
+    "avg": lambda valores: round(sum(valores) / len(valores), 2),
+    "min": min,
+    "max": max,
+}
+AGRUPACIONES = ("departamento",)
+
+
+def percentil_interpolado(ordenados: Sequence[int], p: float) -> float:
+    """Percentil con interpolación lineal entre posiciones (el mismo criterio que numpy)"""
+    posicion = (len(ordenados) - 1) * p / 100
+    abajo, arriba = math.floor(posicion), math.ceil(posicion)
+    valor = ordenados[abajo] + (ordenados[arriba] - ordenados[abajo]) * (posicion - abajo)
+    return round(valor, 2)
+
+
+def _percentil_de(funcion: str) -> Optional[float]:
+    """'p90' -> 90.0 (None si no es un percentil)"""
+    if not funcion.startswith("p"):
+        return None
+    try:
+        p = float(funcion[1:])
+    except ValueError:
+        return None
+    return p if 0 <= p <= 100 else None
+
+
+class Columnas:
+    """
+    Las licencias por columnas (una lista por campo) para agregar sin consultar
+    la base de datos. Los resultados se guardan por parámetros: el objeto vive
+    lo que dura una versión de los datos, así que la caché no necesita invalidarse.
+    """
+
+    def __init__(self, licencias: List[Dict], tamano_cache: int = 256):
+        self.departamento = [l["departamento"] for l in licencias]
+        self.municipio = [l["municipio"] for l in licencias]
+        self.numericas = {campo: [l[campo] for l in licencias] for campo in consultas.TIPOS_ORDEN}
+        self._cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._tamano_cache = tamano_cache
+        self._lock = threading.Lock()
+
+    def _filas(self, departamento: Optional[str], municipio: Optional[str],
+               min_total: Optional[int], max_total: Optional[int]) -> List[int]:
+        filas = range(len(self.departamento))
+        if departamento:
+            filas = [i for i in filas if self.departamento[i] == departamento]
+        if municipio:
+            filas = [i for i in filas if self.municipio[i] == municipio]
+        total = self.numericas["total"]
+        if min_total is not None:
+            filas = [i for i in filas if total[i] >= min_total]
+        if max_total is not None:
+            filas = [i for i in filas if total[i] <= max_total]
+        return list(filas)
+
+    def agregar(self, agrupar_por: Optional[str], campos: Sequence[str], funciones: Sequence[str],
+                departamento: Optional[str] = None, min_total: Optional[int] = None,
+                max_total: Optional[int] = None, municipio: Optional[str] = None) -> List[Dict]:
+        """
+        Agregados de `campos` por grupo (o de todas las filas si agrupar_por es None).
+        `funciones` admite sum, avg, min, max y percentiles como p50 o p95.
+        Lanza ValueError si un campo, función o agrupación no es válida.
+        """
+        if agrupar_por is not None and agrupar_por not in AGRUPACIONES:
+            raise ValueError(f"agrupar_por debe ser uno de: {', '.join(AGRUPACIONES)}")
+        for campo in campos:
+            if campo not in self.numericas:
+                raise ValueError(f"Campo no válido: {campo} (válidos: {', '.join(self.numericas)})")
+        for funcion in funciones:
+            if funcion not in FUNCIONES_AGREGADO and _percentil_de(funcion) is None:
+                raise ValueError(f"Agregado no válido: {funcion} (válidos: {', '.join(FUNCIONES_AGREGADO)}, p0..p100)")
+
+        clave = (agrupar_por, tuple(campos), tuple(funciones), departamento, municipio, min_total, max_total)
+        with self._lock:
+            if clave in self._cache:
+                self._cache.move_to_end(clave)
+                return self._cache[clave]
+
+        grupos: Dict[str, List[int]] = {}
+        for fila in self._filas(departamento, municipio, min_total, max_total):
+            grupo = self.departamento[fila] if agrupar_por else "todas"
+            grupos.setdefault(grupo, []).append(fila)
+
+        resultado = []
+        for grupo, filas in sorted(grupos.items()):
+            fila_resultado = {agrupar_por: grupo} if agrupar_por else {}
+            fila_resultado["municipios"] = len(filas)
+            for campo in campos:
+                columna = self.numericas[campo]
+                valores = [columna[i] for i in filas]
+                ordenados = None
+                agregados = {}
+                for funcion in funciones:
+                    if funcion in FUNCIONES_AGREGADO:
+                        agregados[funcion] = FUNCIONES_AGREGADO[funcion](valores)
+                    else:
+                        ordenados = ordenados or sorted(valores)
+                        agregados[funcion] = percentil_interpolado(ordenados, _percentil_de(funcion))
+                fila_resultado[campo] = agregados
+            resultado.append(fila_resultado)
+
+        with self._lock:
+            self._cache[clave] = resultado
+            if len(self._cache) > self._tamano_cache:
+                self._cache.popitem(last=False)
+        return resultado
+
+
+class Indices:
+    """Índices de una versión de los datos"""
+
+    def __init__(self, version: str, licencias: List[Dict]):
+        self.version = version
+        self.prefijos = IndicePrefijos(licencias)
+        self.trigramas = IndiceTrigramas(licencias)
+        self.columnas = Columnas(licencias)
+
+
+_indices: Optional[Indices] = None
+_lock = threading.Lock()
+
+
+def obtener_indices(db_path: str = None) -> Indices:
+    """Índices de la versión actual de los datos (se reconstruyen si cambió)"""
+    global _indices
+    version = consultas.obtener_version_datos(db_path)
+    indices = _indices
+    if indices is not None and indices.version == version:
+        return indices
+
+    with _lock:
+        if _indices is None or _indices.version != version:
+            conn = consultas.get_db_connection(db_path)
+            try:
+                licencias = consultas.todas_las_licencias(conn)
+            finally:
+                conn.close()
+            _indices = Indices(version, licencias)
+        return _indices
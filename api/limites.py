@@ -0,0 +1,162 @@
+# api/limites.py
+"""
+Protección de la latencia de cola: límite de peticiones por API key y por IP
+(token bucket) y control de admisión con un máximo de peticiones en curso.
+Lo que no cabe se rechaza enseguida (429 o 503) en lugar de hacer esperar a
+todos los clientes.
+
+Los buckets viven en memoria del proceso; con varios workers se pueden
+compartir en un servidor compatible con Redis (RATE_LIMIT_REDIS_URL).
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AlmacenMemoria:
+    """
+    Buckets en un diccionario del proceso: clave -> (tokens, instante, recarga).
+    Cada bucket guarda su propio tiempo de recarga (capacidad/tasa): varios
+    limitadores con tasas distintas comparten el almacén
+    """
+
+    def __init__(self, max_claves: int = 10000):
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._max_claves = max_claves
+
+    async def consumir(self, clave: str, tasa: float, capacidad: float, costo: float) -> Tuple[bool, float]:
+        # Sin await entre leer y escribir: atómico dentro del event loop
+        ahora = time.monotonic()
+        tokens, instante, _ = self._buckets.get(clave, (capacidad, ahora, 0.0))
+        tokens = min(capacidad, tokens + (ahora - instante) * tasa)
+        permitido = tokens >= costo
+        if permitido:
+            tokens -= costo
+        self._buckets[clave] = (tokens, ahora, capacidad / tasa)
+        if len(self._buckets) > self._max_claves:
+            self._purgar(ahora)
+        return permitido, tokens
+
+    def _purgar(self, ahora: float):
+        """Descarta los buckets que ya se habrían llenado (equivalen a uno nuevo)"""
+        for clave in [c for c, (_, instante, recarga) in self._buckets.items() if ahora - instante > recarga]:
+            del self._buckets[clave]
+
+
+# Token bucket atómico en el servidor: KEYS[1] bucket; ARGV tasa, capacidad, costo, ahora
+_SCRIPT_BUCKET = """
+local datos = redis.call('HMGET', KEYS[1], 'tokens', 'instante')
+local tasa, capacidad, costo, ahora = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(datos[1]) or capacidad
+local instante = tonumber(datos[2]) or ahora
+tokens = math.min(capacidad, tokens + math.max(0, ahora - instante) * tasa)
+local permitido = 0
+if tokens >= costo then
+    tokens = tokens - costo
+    permitido = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'instante', ahora)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidad / tasa) + 1)
+return {permitido, tostring(tokens)}
+"""
+
+
+class AlmacenRedis:
+    """Buckets compartidos entre workers en un servidor compatible con Redis"""
+
+    def __init__(self, url: str, prefijo: str = "limite:"):
+        import redis.asyncio as redis  # Dependencia opcional
+
+        self._cliente = redis.from_url(url)
+        self._script = self._cliente.register_script(_SCRIPT_BUCKET)
+        self._prefijo = prefijo
+
+    async def consumir(self, clave: str, tasa: float, capacidad: float, costo: float) -> Tuple[bool, float]:
+        # Reloj de pared: los workers comparten el bucket, no el reloj monótono
+        permitido, tokens = await self._script(keys=[self._prefijo + clave],
+                                               args=[tasa, capacidad, costo, time.time()])
+        return bool(permitido), float(tokens)
+
+
+def crear_almacen(redis_url: str = ""):
+    """Almacén de buckets: Redis si hay URL y el paquete está instalado, si no memoria"""
+    if redis_url:
+        try:
+            return AlmacenRedis(redis_url)
+        except ImportError:
+            logger.warning("⚠️ RATE_LIMIT_REDIS_URL configurada pero falta el paquete redis: límites en memoria")
+    return AlmacenMemoria()
+
+
+class LimitadorTokens:
+    """Token bucket por clave: `tasa` tokens por segundo hasta `capacidad`"""
+
+    def __init__(self, almacen, tasa: float, capacidad: float):
+        self.almacen = almacen
+        self.tasa = tasa
+        self.capacidad = capacidad
+
+    async def permitir(self, clave: str, costo: float = 1) -> Tuple[bool, float]:
+        """(permitido, segundos hasta poder reintentar)"""
+        costo = min(costo, self.capacidad)
+        permitido, tokens = await self.almacen.consumir(clave, self.tasa, self.capacidad, costo)
+        if permitido:
+            return True, 0.0
+        return False, (costo - tokens) / self.tasa
+
+
+class Saturado(Exception):
+    """No hay capacidad para admitir la petición"""
+
+
+class ControlAdmision:
+    """
+    Máximo de peticiones en curso. Las que llegan con todo ocupado esperan en
+    una cola corta (hasta `espera` segundos); si la cola está llena o la espera
+    vence se rechazan con Saturado.
+    """
+
+    def __init__(self, max_concurrentes: int, max_cola: int, espera: float):
+        self.max_concurrentes = max_concurrentes
+        self.max_cola = max_cola
+        self.espera = espera
+        self._semaforo: Optional[asyncio.Semaphore] = None  # Se crea dentro del event loop
+        self.en_curso = 0
+        self.en_cola = 0
+        self.rechazadas = 0
+
+    async def __aenter__(self):
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concurrentes)
+
+        if self._semaforo.locked():
+            if self.en_cola >= self.max_cola:
+                self.rechazadas += 1
+                raise Saturado("Cola de peticiones llena")
+            self.en_cola += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), self.espera)
+            except asyncio.TimeoutError:
+                self.rechazadas += 1
+                raise Saturado("Tiempo de espera en cola agotado")
+            finally:
+                self.en_cola -= 1
+        else:
+            await self._semaforo.acquire()
+
+        self.en_curso += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.en_curso -= 1
+        self._semaforo.release()
+        return False
+
+
+def segundos_reintento(segundos: float) -> str:
+    """Valor de la cabecera Retry-After (entero, al menos 1)"""
+    return str(max(1, math.ceil(segundos)))
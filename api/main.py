@@ -1,19 +1,30 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
 from typing import List, Optional
-import uvicorn
 
-import sqlite3
+import asyncio
+import hashlib
 import os
 import sys
 import logging
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
-from etl.main import run_etl_pipeline
+# El ETL (pandas, requests...) no se importa aquí: se ejecuta en un proceso aparte
+# solo cuando se piden datos nuevos, así el arranque de cada réplica no lo paga
+ETL_SCRIPT = os.path.join(parent_dir, "etl", "main.py")
+
+from api import consultas
+from api.config import settings
+from api.indices import buscar_fuzzy, obtener_indices
+from api.limites import ControlAdmision, LimitadorTokens, Saturado, crear_almacen, segundos_reintento
+from api.perfilado import FORMATOS, MiddlewarePerfilado, Perfilador, clave_valida
+from api.consultas import fuente_datos, get_db_connection, obtener_version_datos
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -25,10 +36,67 @@ app = FastAPI(
 )
 
 # Configuración
-DATABASE_URL = os.getenv("DATABASE_URL", "cannabis_licencias.db")
-API_KEY = os.getenv("API_KEY", "cannabis-key-2025")
+API_KEY = settings.API_KEY
 api_key_header = APIKeyHeader(name="X-API-Key")
 
+# Límites de carga (ver api/limites.py)
+_almacen_limites = crear_almacen(settings.RATE_LIMIT_REDIS_URL)
+limite_ip = LimitadorTokens(_almacen_limites, settings.RATE_LIMIT_IP_RATE, settings.RATE_LIMIT_IP_BURST)
+limite_api_key = LimitadorTokens(_almacen_limites, settings.RATE_LIMIT_KEY_RATE, settings.RATE_LIMIT_KEY_BURST)
+limite_servicio = LimitadorTokens(_almacen_limites, settings.RATE_LIMIT_SERVICE_RATE,
+                                  settings.RATE_LIMIT_SERVICE_BURST)
+limite_etl = LimitadorTokens(_almacen_limites, settings.RATE_LIMIT_ETL_PER_MIN / 60,
+                             max(1.0, settings.RATE_LIMIT_ETL_PER_MIN))
+admision = ControlAdmision(settings.MAX_CONCURRENT_REQUESTS, settings.MAX_QUEUED_REQUESTS, settings.QUEUE_TIMEOUT)
+# Salud y versión: los clientes las sondean periódicamente y no tocan la base de datos
+RUTAS_SIN_LIMITE = {"/", "/version", "/docs", "/redoc", "/openapi.json"}
+
+def _costo_peticion(request: Request) -> float:
+    """Un token por petición y uno más por cada RATE_LIMIT_OFFSET_COST filas saltadas"""
+    try:
+        skip = max(0, int(request.query_params.get("skip", 0)))
+    except ValueError:
+        skip = 0
+    return 1 + skip // settings.RATE_LIMIT_OFFSET_COST
+
+@app.middleware("http")
+async def limitar_carga(request: Request, call_next):
+    """Token bucket por IP y por API key; luego control de admisión (429 / 503 inmediatos)"""
+    if request.url.path in RUTAS_SIN_LIMITE:
+        return await call_next(request)
+    
+    if settings.RATE_LIMIT_ENABLED:
+        ip = request.client.host if request.client else "desconocida"
+        api_key = request.headers.get("X-API-Key")
+        # La API key no se guarda en claro en el almacén de límites
+        cliente = f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}" if api_key else f"ip:{ip}"
+        if clave_valida(api_key, API_KEY):
+            # Clave del servicio (el agente): todas sus consultas salen de la misma IP
+            limites = [(limite_servicio, cliente)]
+        else:
+            limites = [(limite_ip, f"ip:{ip}")]
+            if api_key:
+                limites.append((limite_api_key, cliente))
+        if request.url.path == "/actualizar-datos":
+            limites.append((limite_etl, f"etl:{cliente}"))
+        
+        costo = _costo_peticion(request)
+        for limitador, clave in limites:
+            permitido, espera = await limitador.permitir(clave, costo)
+            if not permitido:
+                return JSONResponse(status_code=429, content={"detail": "Demasiadas peticiones"},
+                                    headers={"Retry-After": segundos_reintento(espera)})
+    
+    if settings.MAX_CONCURRENT_REQUESTS <= 0:
+        return await call_next(request)
+    try:
+        async with admision:
+            return await call_next(request)
+    except Saturado as e:
+        logger.warning(f"Petición rechazada por saturación ({e}): {request.url.path}")
+        return JSONResponse(status_code=503, content={"detail": "Servidor saturado, reintenta en unos segundos"},
+                            headers={"Retry-After": "1"})
+
 # Dependencia para verificar API Key
 def get_api_key(api_key: str = Depends(api_key_header)):
     if api_key != API_KEY:
@@ -38,11 +106,20 @@ def get_api_key(api_key: str = Depends(api_key_header)):
         )
     return api_key
 
-# Conexion a la base de datos
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_URL)
-    conn.row_factory = sqlite3.Row
-    return conn
+admin_key_header = APIKeyHeader(name="X-Admin-Key", auto_error=False)
+
+# Dependencia para los endpoints de administración (solo si hay ADMIN_API_KEY)
+def get_admin_key(admin_key: Optional[str] = Depends(admin_key_header)):
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Perfilado desactivado")
+    if not clave_valida(admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Clave de administración inválida")
+    return admin_key
+
+perfilador = Perfilador()
+if settings.ADMIN_API_KEY:
+    # Sin clave no se instala: el perfilado desactivado no cuesta nada por petición
+    app.add_middleware(MiddlewarePerfilado, perfilador=perfilador, clave_admin=settings.ADMIN_API_KEY)
 
 # Modelos de datos
 class LicenciaBase(BaseModel):
@@ -55,6 +132,8 @@ class LicenciaBase(BaseModel):
     total: int
 
 class LicenciaResponse(LicenciaBase):
+    similitud: Optional[float] = None  # Solo en búsquedas fuzzy
+    
     class Config:
         from_attributes = True
 
@@ -64,6 +143,28 @@ class BusquedaResponse(BaseModel):
     pagina: int
     por_pagina: int
 
+class Sugerencia(BaseModel):
+    tipo: str
+    nombre: str
+    departamento: Optional[str] = None
+    total: int
+
+class SugerenciasResponse(BaseModel):
+    prefix: str
+    sugerencias: List[Sugerencia]
+
+def _lista_param(valor: Optional[str]) -> List[str]:
+    """'a, b,,c' -> ['a', 'b', 'c']"""
+    return [parte.strip() for parte in (valor or "").split(",") if parte.strip()]
+
+def _respuesta_busqueda(resultado: dict, campos: List[str]):
+    """Con `fields` las filas son parciales: se envían tal cual, sin pasar por LicenciaResponse"""
+    if campos:
+        return JSONResponse(content=resultado)
+    return BusquedaResponse(**resultado)
+
+FIELDS_DESCRIPCION = "Campos a devolver separados por comas (p. ej. municipio,departamento,total); por defecto todos"
+
 # Endpoints principales
 @app.get("/")
 async def root():
@@ -73,128 +174,143 @@ async def root():
         "endpoints": {
             "licencias": "/licencias",
             "licencia_por_id": "/licencias/{id}",
+            "sugerir": "/licencias/sugerir",
+            "agregados": "/licencias/agregados",
             "buscar": "/licencias/buscar/",
             "estadisticas": "/estadisticas",
+            "version": "/version",
             "actualizar-datos": "/actualizar-datos"
         }
     }
 
-@app.get("/licencias", response_model=BusquedaResponse)
+@app.get("/version")
+async def version_datos():
+    """Versión actual de los datos (para que los clientes invaliden sus índices) y su origen"""
+    try:
+        return fuente_datos()
+    except OSError as e:
+        logger.error(f"Error obteniendo versión de datos: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+@app.get("/licencias", response_model=BusquedaResponse, response_model_exclude_none=True)
 async def listar_licencias(
     skip: int = Query(0, ge=0, description="Numero de registros a saltar"),
-    limit: int = Query(10, ge=1, le=100, description="Numero de registros a retornar")
+    limit: int = Query(10, ge=1, le=100, description="Numero de registros a retornar"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPCION)
 ):
     """Lista todas las licencias con paginación"""
     try:
+        campos = _lista_param(fields)
         conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Obtener total de registros
-        cursor.execute("SELECT COUNT(*) FROM licencias")
-        total = cursor.fetchone()[0]
+        try:
+            resultado = consultas.listar_licencias(conn, skip, limit, campos=campos)
+        finally:
+            conn.close()
 
-        # Obtener registros paginados
-        cursor.execute("SELECT * FROM licencias ORDER BY total DESC LIMIT ? OFFSET ?", (limit, skip))
+        return _respuesta_busqueda(resultado, campos)
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error listando licencias: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-        resultados = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+# Declarados antes de /licencias/{licencia_id} para que "sugerir" y "agregados" no se tomen como un ID
+@app.get("/licencias/sugerir", response_model=SugerenciasResponse)
+async def sugerir_licencias(
+    prefix: str = Query(..., min_length=1, max_length=50, description="Inicio del nombre (sin importar tildes)"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Autocompletado de municipios y departamentos, ordenados por total de licencias"""
+    try:
+        sugerencias = obtener_indices().prefijos.sugerir(prefix, limit)
+        return SugerenciasResponse(prefix=prefix, sugerencias=sugerencias)
+    
+    except Exception as e:
+        logger.error(f"Error sugiriendo licencias: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-        return BusquedaResponse(
-            resultados=resultados,
-            total=total,
-            pagina=skip // limit + 1,
-            por_pagina=limit
+@app.get("/licencias/agregados")
+async def agregados_licencias(
+    agrupar_por: Optional[str] = Query("departamento", description="Agrupación (departamento); vacío para no agrupar"),
+    campos: str = Query("no_psico,psico,semillas,total", description="Campos a agregar, separados por comas"),
+    agregados: str = Query("sum,avg,min,max", description="sum, avg, min, max y percentiles (p50, p90...)"),
+    departamento: Optional[str] = Query(None, description="Filtrar por departamento"),
+    municipio: Optional[str] = Query(None, description="Filtrar por municipio"),
+    min_total: Optional[int] = Query(None, ge=0, description="Minimo total de licencias"),
+    max_total: Optional[int] = Query(None, ge=0, description="Máximo total de licencias")
+):
+    """Agregados por grupo sobre las licencias filtradas (calculados en memoria y cacheados por versión)"""
+    try:
+        indices = obtener_indices()
+        grupos = indices.columnas.agregar(
+            agrupar_por or None, _lista_param(campos), _lista_param(agregados),
+            departamento=departamento, municipio=municipio, min_total=min_total, max_total=max_total
         )
+        return {"version": indices.version, "agrupar_por": agrupar_por or None, "grupos": grupos}
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error listando licencias: {e}")
+        logger.error(f"Error calculando agregados: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.get("/licencias/{licencia_id}", response_model=LicenciaResponse)
 async def obtener_licencia(licencia_id: int):
     """Obtiene una licencia especifica por ID"""
     try:
-        conn= get_db_connection()
-        cursor=conn.cursor()
-
-        cursor.execute("SELECT * FROM licencias WHERE id = ?", (licencia_id,))
-
-        licencia = cursor.fetchone()
+        conn = get_db_connection()
+        licencia = consultas.obtener_licencia(conn, licencia_id)
         conn.close()
     
         if not licencia:
             raise HTTPException(status_code=404, detail=f"Licencia con ID {licencia_id} no encontrada")
         
-        return dict(licencia)
+        return licencia
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error obteniendo licencia {licencia_id}: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-@app.get("/licencias/buscar/", response_model=BusquedaResponse)
+@app.get("/licencias/buscar/", response_model=BusquedaResponse, response_model_exclude_none=True)
 async def buscar_licencias(
-    q: str = Query(..., description="Término de búsqueda"),
+    q: Optional[str] = Query(None, description="Término de búsqueda"),
     departamento: Optional[str] = Query(None, description="Filtrar por departamento"),
+    municipio: Optional[str] = Query(None, description="Filtrar por municipio (nombre exacto)"),
     tipo: Optional[str] = Query(None, description="Tipo de licencia: no psico, psico, semillas, total"),
     min_total: Optional[int] = Query(None, ge=0, description="Minimo total de licencias"),
     max_total: Optional[int] = Query(None, ge=0, description="Máximo total de licencias"),
+    fuzzy: bool = Query(False, description="Tolerar errores de escritura en q (similitud por trigramas)"),
+    similitud_minima: float = Query(0.4, ge=0.1, le=1.0, description="Similitud mínima en modo fuzzy"),
     skip: int = Query(0, ge=0),
-    limit: int = Query(10, ge=1, le=100)
+    limit: int = Query(10, ge=1, le=100),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPCION)
 ):
     """Busca licencias por termino y aplica filtros"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Construir query dinamica
-        query = "SELECT * FROM licencias WHERE 1=1"
-        params = []
-
-        # Busqueda por término
-        if q:
-            query += " AND (departamento LIKE ? OR municipio LIKE ?)"
-            params.extend([f"%{q}%", f"%{q}%"])
+        campos = _lista_param(fields)
+        if fuzzy and q:
+            # Ordenado por similitud (y total); `tipo` no aplica
+            resultado = buscar_fuzzy(
+                obtener_indices(), q, departamento=departamento, municipio=municipio, min_total=min_total,
+                max_total=max_total, skip=skip, limit=limit, similitud_minima=similitud_minima, campos=campos
+            )
+            return _respuesta_busqueda(resultado, campos)
         
-        # Filtros adicionales
-        if departamento:
-            query += " AND departamento = ?"
-            params.append(departamento)
-        
-        if min_total is not None:
-            query += " AND total >= ?"
-            params.append(min_total)
-        
-        if max_total is not None:
-            query += " AND total <= ?"
-            params.append(max_total)
-        
-        # Ordernar por el tipo especificado o por total por defecto
-        if tipo and tipo in ['no_psico', 'psico', 'semillas', 'total']:
-            query += f" ORDER BY {tipo} DESC"
-        else:
-            query += f" ORDER BY total DESC"
-        
-        # Contar total de resultados
-        count_query = f"SELECT COUNT(*) FROM ({query})"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
-
-        # Aplicar paginacion
-        query += " LIMIT ? OFFSET ?"
-        params.extend([limit, skip])
-
-        cursor.execute(query, params)
-        resultados = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-
-        return BusquedaResponse(
-            resultados=resultados,
-            total=total,
-            pagina=skip // limit + 1,
-            por_pagina = limit
-        )
+        conn = get_db_connection()
+        try:
+            resultado = consultas.buscar_licencias(
+                conn, q=q, departamento=departamento, municipio=municipio, tipo=tipo,
+                min_total=min_total, max_total=max_total, skip=skip, limit=limit, campos=campos
+            )
+        finally:
+            conn.close()
+
+        return _respuesta_busqueda(resultado, campos)
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error buscando licencias: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -204,51 +320,7 @@ async def obtener_estadisticas():
     """Obtiene estadisticas generales de las licencias"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-
-        estadisticas = {}
-
-        # Totales generales
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_municipios,
-                SUM(total) as total_licencias,
-                SUM(no_psico) as total_no_psico,
-                SUM(psico) as total_psico,
-                SUM(semillas) as total_semillas,
-                AVG(total) as promedio_por_municipio
-            FROM licencias
-        """)
-        
-        stats = cursor.fetchone()
-        estadisticas["totales"] = dict(stats)
-        
-        # Top 5 departamentos con más licencias
-        cursor.execute("""
-            SELECT departamento, SUM(total) as total_licencias
-            FROM licencias 
-            GROUP BY departamento 
-            ORDER BY total_licencias DESC 
-            LIMIT 5
-        """)
-        estadisticas["top_departamentos"] = [dict(row) for row in cursor.fetchall()]
-        
-        # Distribución por rangos
-        cursor.execute("""
-            SELECT 
-                CASE 
-                    WHEN total = 0 THEN 'Sin licencias'
-                    WHEN total BETWEEN 1 AND 5 THEN '1-5'
-                    WHEN total BETWEEN 6 AND 20 THEN '6-20'
-                    WHEN total > 20 THEN 'Más de 20'
-                END as rango,
-                COUNT(*) as cantidad_municipios
-            FROM licencias
-            GROUP BY rango
-            ORDER BY cantidad_municipios DESC
-        """)
-        estadisticas["distribucion_rangos"] = [dict(row) for row in cursor.fetchall()]
-        
+        estadisticas = consultas.obtener_estadisticas(conn)
         conn.close()
         return estadisticas
         
@@ -256,21 +328,40 @@ async def obtener_estadisticas():
         logger.error(f"Error obteniendo estadísticas: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+# Una sola ejecución del ETL a la vez
+_etl_lock = asyncio.Lock()
+# Código de salida de etl/main.py (SIN_PUBLICAR) cuando carga los datos pero no publica el artefacto
+ETL_SIN_PUBLICAR = 2
+
+async def run_etl_worker() -> int:
+    """Ejecuta el pipeline ETL en un proceso aparte (mismo directorio que la API); devuelve su código de salida"""
+    proceso = await asyncio.create_subprocess_exec(sys.executable, ETL_SCRIPT, cwd=os.getcwd())
+    return await proceso.wait()
+
 @app.post("/actualizar-datos")
 async def actualizar_datos(api_key: str = Depends(get_api_key)):
     """Endpoint protegido para actualizar los datos desde el ETL"""
+    if _etl_lock.locked():
+        raise HTTPException(status_code=409, detail="Ya hay una actualización de datos en curso")
+    
     try:
-        # Importar y ejecutar el ETL
+        # Ejecutar el ETL en un proceso aparte sin bloquear el servidor
         logger.info("Solicitada actualización de datos via API")
-        success = run_etl_pipeline()
+        async with _etl_lock:
+            codigo = await run_etl_worker()
 
-        if success:
+        if codigo == 0:
             return {
                 "message": "Datos actualizados exitosamente", 
                 "status": "success"
             }
-        else:
-            raise HTTPException(status_code=500, detail="Error al actualizar los datos")
+        if codigo == ETL_SIN_PUBLICAR:
+            # El manifest sigue apuntando al artefacto anterior: no es un éxito para el cliente
+            return JSONResponse(status_code=503, content={
+                "message": "Datos cargados pero no publicados: se sigue sirviendo la versión anterior",
+                "status": "partial"
+            })
+        raise HTTPException(status_code=500, detail="Error al actualizar los datos")
     
     except HTTPException:
         raise
@@ -278,7 +369,48 @@ async def actualizar_datos(api_key: str = Depends(get_api_key)):
         logger.error(f"Error actualizando datos: {e}")
         raise HTTPException(status_code=500, detail="Error interno al actualizar datos")
 
+@app.post("/admin/perfilado", dependencies=[Depends(get_admin_key)])
+async def iniciar_perfilado(
+    modo: str = Query("muestreo", pattern="^(muestreo|cprofile)$"),
+    segundos: Optional[float] = Query(None, gt=0, le=300, description="Duración de la sesión"),
+    peticiones: Optional[int] = Query(None, ge=1, description="Peticiones a perfilar"),
+    memoria: bool = Query(False, description="Añadir una instantánea de tracemalloc")
+):
+    """Inicia una sesión de perfilado de N segundos o N peticiones (10 s por defecto)"""
+    try:
+        return perfilador.iniciar(modo, segundos, peticiones, memoria).resumen()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/admin/perfilado", dependencies=[Depends(get_admin_key)])
+async def estado_perfilado():
+    """Sesión en curso y últimos perfiles"""
+    return perfilador.resumen()
+
+@app.delete("/admin/perfilado", dependencies=[Depends(get_admin_key)])
+async def detener_perfilado():
+    """Termina la sesión de perfilado en curso"""
+    perfil = perfilador.detener()
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="No hay una sesión de perfilado en curso")
+    return perfil.resumen()
+
+@app.get("/admin/perfilado/{perfil_id}", response_class=PlainTextResponse, dependencies=[Depends(get_admin_key)])
+async def resultado_perfilado(
+    perfil_id: str,
+    formato: str = Query("folded", description=f"Uno de: {', '.join(FORMATOS)}")
+):
+    """Resultado de un perfil: pilas "folded" (flamegraph.pl, speedscope), texto de pstats o memoria"""
+    perfil = perfilador.obtener(perfil_id)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail=f"Perfil {perfil_id} no encontrado")
+    try:
+        return perfil.salida(formato)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
 
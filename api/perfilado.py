@@ -0,0 +1,490 @@
+# api/perfilado.py
+"""
+Perfilado bajo demanda de la API y del agente, protegido por la clave de
+administración:
+
+- sesión de muestreo: un hilo toma las pilas de todos los hilos cada pocos
+  milisegundos durante N segundos o N peticiones (salida "folded")
+- sesión de cProfile: cProfile en cada petición de la sesión (salida de pstats)
+- una petición: con la cabecera X-Profile se registran las pilas exactas de
+  esa petición (salida "folded" en microsegundos). Solo una a la vez (otra
+  recibe 409): sys.setprofile y cProfile son únicos por hilo. En un event
+  loop las pilas incluyen lo que otras tareas ejecuten mientras la petición
+  espera; para pilas limpias, perfilar sin otras peticiones en curso.
+
+La salida "folded" (una pila por línea: "a;b;c valor") es la entrada de
+flamegraph.pl y de speedscope. Con memoria=True se toma además una
+instantánea de tracemalloc, también en formato "folded" (bytes por pila).
+
+Solo usa la biblioteca estándar: la API y el agente lo comparten. Sin sesión
+activa el coste por petición es comprobar un atributo; sin clave de
+administración no se instala nada.
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+MODOS_SESION = ("muestreo", "cprofile")
+MODOS_PETICION = ("pilas", "cprofile")
+FORMATOS = ("folded", "texto", "memoria")
+
+# Profundidad de las pilas de tracemalloc
+FRAMES_MEMORIA = 25
+
+# Funciones en las que un hilo está esperando (no trabajando) al muestrearlo
+ESPERAS = {"select", "poll", "epoll", "wait", "_wait_for_tstate_lock", "accept", "get", "sleep", "readinto"}
+
+
+def _nombre(codigo) -> str:
+    modulo = os.path.splitext(os.path.basename(codigo.co_filename))[0]
+    return f"{modulo}:{getattr(codigo, 'co_qualname', codigo.co_name)}"
+
+
+def _pila(frame) -> List[str]:
+    """Nombres de la pila desde la raíz hasta `frame`"""
+    pila = []
+    while frame is not None:
+        pila.append(_nombre(frame.f_code))
+        frame = frame.f_back
+    pila.reverse()
+    return pila
+
+
+def _folded(pilas: Counter) -> str:
+    return "".join(f"{pila} {int(valor)}\n" for pila, valor in sorted(pilas.items()) if valor >= 1)
+
+
+class Perfil:
+    """Un perfil (de una sesión o de una petición) y sus resultados"""
+
+    modo = ""
+
+    def __init__(self, memoria: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.memoria = memoria
+        self.inicio: Optional[float] = None
+        self.duracion: Optional[float] = None
+        self.peticiones = 0
+        self.instantanea: Optional[tracemalloc.Snapshot] = None
+        self._memoria_propia = False
+
+    def iniciar(self):
+        self.inicio = time.time()
+        if self.memoria and not tracemalloc.is_tracing():
+            tracemalloc.start(FRAMES_MEMORIA)
+            self._memoria_propia = True
+        self._iniciar()
+
+    def terminar(self):
+        self._terminar()
+        if self.memoria and tracemalloc.is_tracing():
+            self.instantanea = tracemalloc.take_snapshot()
+            if self._memoria_propia:
+                tracemalloc.stop()
+        self.duracion = time.time() - self.inicio
+
+    # Alrededor de cada petición perfilada (en el hilo que la atiende)
+    def entrar(self):
+        pass
+
+    def salir(self):
+        pass
+
+    def _iniciar(self):
+        pass
+
+    def _terminar(self):
+        pass
+
+    def resumen(self) -> Dict:
+        return {
+            "id": self.id,
+            "modo": self.modo,
+            "memoria": self.memoria,
+            "inicio": self.inicio,
+            "duracion_s": round(self.duracion, 3) if self.duracion is not None else None,
+            "peticiones": self.peticiones,
+            "en_curso": self.duracion is None,
+        }
+
+    def salida(self, formato: str) -> str:
+        """Resultado en `formato` ('folded', 'texto' o 'memoria'); ValueError si no aplica"""
+        if self.duracion is None:
+            raise ValueError("El perfil aún está en curso")
+        if formato == "memoria":
+            return self._salida_memoria()
+        return self._salida(formato)
+
+    def _salida(self, formato: str) -> str:
+        raise ValueError(f"Formato no disponible para el modo {self.modo}: {formato}")
+
+    def _salida_memoria(self) -> str:
+        if self.instantanea is None:
+            raise ValueError("El perfil no tiene instantánea de memoria (memoria=true)")
+        instantanea = self.instantanea.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        pilas = Counter()
+        for estadistica in instantanea.statistics("traceback"):
+            # Las tramas van de la más antigua a la más reciente, como en "folded"
+            pila = ";".join(f"{os.path.splitext(os.path.basename(f.filename))[0]}:{f.lineno}"
+                            for f in estadistica.traceback)
+            pilas[pila] += estadistica.size
+        return _folded(pilas)
+
+
+class PerfilMuestreo(Perfil):
+    """Muestreo estadístico de las pilas de todos los hilos"""
+
+    modo = "muestreo"
+
+    def __init__(self, memoria: bool = False, intervalo: float = 0.005, incluir_esperas: bool = False):
+        super().__init__(memoria)
+        self.intervalo = intervalo
+        self.incluir_esperas = incluir_esperas
+        self.pilas = Counter()
+        self.muestras = 0
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def _iniciar(self):
+        self._hilo = threading.Thread(target=self._muestrear, name="perfilado-muestreo", daemon=True)
+        self._hilo.start()
+
+    def _terminar(self):
+        self._parar.set()
+        if self._hilo is not threading.current_thread():
+            self._hilo.join()
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                if not self.incluir_esperas and frame.f_code.co_name in ESPERAS:
+                    continue
+                pila = [nombres.get(ident, str(ident))] + _pila(frame)
+                self.pilas[";".join(pila)] += 1
+            self.muestras += 1
+
+    def resumen(self) -> Dict:
+        return {**super().resumen(), "muestras": self.muestras, "intervalo_ms": self.intervalo * 1000}
+
+    def _salida(self, formato: str) -> str:
+        if formato != "folded":
+            return super()._salida(formato)
+        return _folded(self.pilas)
+
+
+class PerfilCProfile(Perfil):
+    """cProfile en los hilos que atienden las peticiones perfiladas (uno por hilo, unidos al final)"""
+
+    modo = "cprofile"
+
+    def __init__(self, memoria: bool = False):
+        super().__init__(memoria)
+        self._local = threading.local()
+        self._perfiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self.estadisticas: Optional[pstats.Stats] = None
+
+    def entrar(self):
+        local = self._local
+        if getattr(local, "perfil", None) is None:
+            local.perfil, local.profundidad = cProfile.Profile(), 0
+            with self._lock:
+                self._perfiles.append(local.perfil)
+        # Peticiones solapadas en el mismo hilo (event loop): se activa con la primera
+        local.profundidad += 1
+        if local.profundidad == 1:
+            local.perfil.enable()
+
+    def salir(self):
+        local = self._local
+        local.profundidad -= 1
+        if local.profundidad == 0:
+            local.perfil.disable()
+
+    def _terminar(self):
+        with self._lock:
+            perfiles = list(self._perfiles)
+        salida = io.StringIO()
+        for perfil in perfiles:
+            perfil.create_stats()
+            if self.estadisticas is None:
+                self.estadisticas = pstats.Stats(perfil, stream=salida)
+            else:
+                self.estadisticas.add(perfil)
+
+    def _salida(self, formato: str) -> str:
+        if formato != "texto":
+            return super()._salida(formato)
+        if self.estadisticas is None:
+            return "Sin peticiones perfiladas\n"
+        salida = io.StringIO()
+        self.estadisticas.stream = salida
+        self.estadisticas.sort_stats("cumulative").print_stats(60)
+        return salida.getvalue()
+
+
+class PerfilPilas(Perfil):
+    """
+    Pilas exactas de una petición con sys.setprofile: tiempo propio (µs) de
+    cada pila. Solo el hilo que atiende la petición (en un event loop incluye lo
+    que otras tareas ejecuten mientras tanto).
+    """
+
+    modo = "pilas"
+
+    def __init__(self, memoria: bool = False):
+        super().__init__(memoria)
+        self.pilas = Counter()
+        self._pila: List[str] = []
+        self._ultimo = 0.0
+
+    def entrar(self):
+        # Incluye esta función: su retorno es el primer evento que se registra
+        self._pila = _pila(sys._getframe(0))
+        self._ultimo = time.perf_counter()
+        sys.setprofile(self._evento)
+
+    def salir(self):
+        sys.setprofile(None)
+        self._acumular(time.perf_counter())
+
+    def _acumular(self, ahora: float):
+        self.pilas[";".join(self._pila)] += (ahora - self._ultimo) * 1e6
+        self._ultimo = ahora
+
+    def _evento(self, frame, evento, arg):
+        ahora = time.perf_counter()
+        self._acumular(ahora)
+        if evento == "call":
+            self._pila.append(_nombre(frame.f_code))
+        elif evento == "c_call":
+            self._pila.append(f"{getattr(arg, '__module__', None) or 'builtins'}:{arg.__qualname__}")
+        elif self._pila and evento in ("return", "c_return", "c_exception"):
+            self._pila.pop()
+        # El tiempo del propio registro no se atribuye a la pila
+        self._ultimo = time.perf_counter()
+
+    def _salida(self, formato: str) -> str:
+        if formato != "folded":
+            return super()._salida(formato)
+        return _folded(self.pilas)
+
+
+def crear_perfil(modo: str, memoria: bool = False) -> Perfil:
+    if modo == "muestreo":
+        return PerfilMuestreo(memoria)
+    if modo == "cprofile":
+        return PerfilCProfile(memoria)
+    if modo == "pilas":
+        return PerfilPilas(memoria)
+    raise ValueError(f"Modo de perfilado desconocido: {modo}")
+
+
+class Perfilador:
+    """
+    Sesión de perfilado activa (como mucho una), perfil de petición en curso
+    (como mucho uno) y últimos perfiles terminados
+    """
+
+    def __init__(self, max_resultados: int = 20, duracion_maxima: float = 300):
+        self.sesion: Optional[Perfil] = None
+        self.peticion: Optional[Perfil] = None
+        self.duracion_maxima = duracion_maxima
+        self._max_resultados = max_resultados
+        self._resultados: "OrderedDict[str, Perfil]" = OrderedDict()
+        self._limite_peticiones: Optional[int] = None
+        self._temporizador: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def _guardar(self, perfil: Perfil):
+        with self._lock:
+            self._resultados[perfil.id] = perfil
+            while len(self._resultados) > self._max_resultados:
+                self._resultados.popitem(last=False)
+
+    def iniciar(self, modo: str = "muestreo", segundos: Optional[float] = None,
+                peticiones: Optional[int] = None, memoria: bool = False) -> Perfil:
+        """Inicia una sesión de `segundos` o de `peticiones` (lo que llegue antes; 10 s por defecto)"""
+        if modo not in MODOS_SESION:
+            raise ValueError(f"Modo de sesión no válido: {modo} (válidos: {', '.join(MODOS_SESION)})")
+        if segundos is None and peticiones is None:
+            segundos = 10
+
+        with self._lock:
+            if self.sesion is not None:
+                raise RuntimeError("Ya hay una sesión de perfilado en curso")
+            if modo == "cprofile" and self.peticion is not None:
+                # cProfile y las pilas de la petición usarían el mismo hook del hilo
+                raise RuntimeError("Hay un perfil de petición en curso")
+            perfil = crear_perfil(modo, memoria)
+            perfil.iniciar()
+            self._limite_peticiones = peticiones
+            self.sesion = perfil
+            # Armado bajo el mismo lock que publica la sesión y ligado a ella: si la sesión
+            # termina antes (por peticiones), el temporizador no detiene otra posterior
+            self._temporizador = threading.Timer(min(segundos or self.duracion_maxima, self.duracion_maxima),
+                                                 lambda: self._detener_si(perfil))
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+        self._guardar(perfil)
+        return perfil
+
+    def detener(self) -> Optional[Perfil]:
+        """Termina la sesión en curso (None si no había)"""
+        return self._detener_si(None)
+
+    def _detener_si(self, esperada: Optional[Perfil]) -> Optional[Perfil]:
+        """Termina la sesión en curso si es `esperada` (cualquiera si es None)"""
+        with self._lock:
+            perfil = self.sesion
+            if perfil is None or (esperada is not None and perfil is not esperada):
+                return None
+            self.sesion = None
+            temporizador, self._temporizador = self._temporizador, None
+        if temporizador is not None and temporizador is not threading.current_thread():
+            temporizador.cancel()
+        perfil.terminar()
+        return perfil
+
+    def antes_peticion(self) -> Optional[Perfil]:
+        sesion = self.sesion
+        if sesion is not None:
+            sesion.entrar()
+        return sesion
+
+    def despues_peticion(self, sesion: Optional[Perfil]):
+        if sesion is None:
+            return
+        sesion.salir()
+        with self._lock:
+            sesion.peticiones += 1
+            completa = (sesion is self.sesion and self._limite_peticiones is not None
+                        and sesion.peticiones >= self._limite_peticiones)
+        if completa:
+            self._detener_si(sesion)
+
+    def comenzar_peticion(self, modo: str = "pilas", memoria: bool = False) -> Perfil:
+        """
+        Perfil de una sola petición (cabecera X-Profile). RuntimeError si ya hay otro
+        perfil de petición o una sesión de cProfile: se pisarían el hook del hilo
+        """
+        if modo not in MODOS_PETICION:
+            raise ValueError(f"Modo de petición no válido: {modo} (válidos: {', '.join(MODOS_PETICION)})")
+        with self._lock:
+            if self.peticion is not None:
+                raise RuntimeError("Ya hay un perfil de petición en curso")
+            if self.sesion is not None and self.sesion.modo == "cprofile":
+                raise RuntimeError("Hay una sesión de cProfile en curso")
+            perfil = crear_perfil(modo, memoria)
+            self.peticion = perfil
+        perfil.iniciar()
+        perfil.entrar()
+        return perfil
+
+    def terminar_peticion(self, perfil: Perfil):
+        perfil.salir()
+        perfil.peticiones = 1
+        perfil.terminar()
+        with self._lock:
+            if self.peticion is perfil:
+                self.peticion = None
+        self._guardar(perfil)
+
+    @contextmanager
+    def perfilar(self, modo: str = "pilas", memoria: bool = False):
+        perfil = self.comenzar_peticion(modo, memoria)
+        try:
+            yield perfil
+        finally:
+            self.terminar_peticion(perfil)
+
+    def obtener(self, perfil_id: str) -> Optional[Perfil]:
+        with self._lock:
+            return self._resultados.get(perfil_id)
+
+    def resumen(self) -> Dict:
+        with self._lock:
+            perfiles = list(self._resultados.values())
+        return {
+            "sesion": self.sesion.resumen() if self.sesion is not None else None,
+            "perfiles": [perfil.resumen() for perfil in reversed(perfiles)],
+        }
+
+
+def clave_valida(recibida: Optional[str], esperada: str) -> bool:
+    """Compara la clave de administración en tiempo constante (sin clave configurada, nada es válido)"""
+    return bool(esperada) and recibida is not None and hmac.compare_digest(recibida.encode(), esperada.encode())
+
+
+async def _responder_json(send, status: int, contenido: Dict):
+    cuerpo = json.dumps(contenido, ensure_ascii=False).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(cuerpo)).encode())]})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+class MiddlewarePerfilado:
+    """
+    Middleware ASGI: perfila las peticiones de la sesión activa y las que traen
+    X-Profile con la clave de administración (X-Profile-Mode: pilas | cprofile,
+    X-Profile-Memory: 1). El id del perfil vuelve en la cabecera X-Profile-Id;
+    con otro perfil de petición en curso se responde 409 sin atender la petición.
+    """
+
+    def __init__(self, app, perfilador: Perfilador, clave_admin: str):
+        self.app = app
+        self.perfilador = perfilador
+        self.clave_admin = clave_admin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        cabeceras = {k: v for k, v in scope["headers"] if k.startswith(b"x-profile")}
+        if cabeceras and clave_valida(cabeceras.get(b"x-profile", b"").decode("latin-1"), self.clave_admin):
+            modo = cabeceras.get(b"x-profile-mode", b"pilas").decode("latin-1")
+            memoria = cabeceras.get(b"x-profile-memory") == b"1"
+            if modo not in MODOS_PETICION:
+                modo = "pilas"
+            try:
+                perfil = self.perfilador.comenzar_peticion(modo, memoria)
+            except RuntimeError as e:
+                return await _responder_json(send, 409, {"detail": str(e)})
+            try:
+                async def enviar(mensaje):
+                    if mensaje["type"] == "http.response.start":
+                        mensaje = {**mensaje, "headers": [*mensaje.get("headers", []),
+                                                          (b"x-profile-id", perfil.id.encode())]}
+                    await send(mensaje)
+                await self.app(scope, receive, enviar)
+            finally:
+                self.perfilador.terminar_peticion(perfil)
+            return
+
+        sesion = self.perfilador.antes_peticion()
+        if sesion is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.perfilador.despues_peticion(sesion)
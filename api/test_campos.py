@@ -0,0 +1,90 @@
+# api/test_campos.py
+"""
+Pruebas de la selección de campos (`fields`) en /licencias y /licencias/buscar/:
+solo se leen y envían las columnas pedidas, y sin `fields` la respuesta no cambia.
+
+    python -m pytest api/test_campos.py
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import consultas, main
+from api.config import settings
+
+COMPLETA = {"id", "departamento", "municipio", "no_psico", "psico", "semillas", "total"}
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "licencias.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE licencias (id INTEGER PRIMARY KEY, departamento TEXT, municipio TEXT,
+                    no_psico INTEGER, psico INTEGER, semillas INTEGER, total INTEGER)""")
+    conn.executemany("INSERT INTO licencias (departamento, municipio, no_psico, psico, semillas, total) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     [("Huila", "Neiva", 5, 5, 0, 10), ("Huila", "Pitalito", 2, 1, 1, 4),
+                      ("Antioquia", "Medellín", 20, 5, 5, 30)])
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(consultas, "DATABASE_URL", db_path)
+    monkeypatch.setattr(consultas, "ARTIFACT_DIR", str(tmp_path / "sin-artefacto"))
+    monkeypatch.setattr(consultas, "_artefacto", None)
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_REQUESTS", 0)
+    return TestClient(main.app)
+
+
+def test_validar_campos():
+    assert consultas.validar_campos(None) is None
+    assert consultas.validar_campos([]) is None
+    assert consultas.validar_campos(["total", "municipio", "total"]) == ["total", "municipio"]
+    with pytest.raises(ValueError, match="precio"):
+        consultas.validar_campos(["municipio", "precio"])
+
+
+def test_listar_solo_los_campos_pedidos(cliente):
+    respuesta = cliente.get("/licencias", params={"limit": 2, "fields": "municipio, total"})
+
+    assert respuesta.status_code == 200
+    assert respuesta.json() == {
+        "resultados": [{"municipio": "Medellín", "total": 30}, {"municipio": "Neiva", "total": 10}],
+        "total": 3, "pagina": 1, "por_pagina": 2,
+    }
+
+
+def test_sin_campos_la_respuesta_es_completa(cliente):
+    resultados = cliente.get("/licencias").json()["resultados"]
+
+    assert len(resultados) == 3
+    assert all(set(fila) == COMPLETA for fila in resultados)
+
+
+def test_buscar_con_campos(cliente):
+    datos = cliente.get("/licencias/buscar/", params={"departamento": "Huila", "fields": "municipio"}).json()
+
+    assert datos["total"] == 2
+    assert sorted(fila["municipio"] for fila in datos["resultados"]) == ["Neiva", "Pitalito"]
+    assert all(set(fila) == {"municipio"} for fila in datos["resultados"])
+
+
+def test_buscar_fuzzy_con_campos_conserva_la_similitud(cliente):
+    datos = cliente.get("/licencias/buscar/", params={"q": "Medelin", "fuzzy": True,
+                                                      "fields": "municipio,total"}).json()
+
+    assert datos["resultados"][0]["municipio"] == "Medellín"
+    assert set(datos["resultados"][0]) == {"municipio", "total", "similitud"}
+
+
+@pytest.mark.parametrize("ruta", ["/licencias", "/licencias/buscar/"])
+def test_campo_invalido_es_400(cliente, ruta):
+    respuesta = cliente.get(ruta, params={"fields": "municipio,precio"})
+
+    assert respuesta.status_code == 400
+    assert "precio" in respuesta.json()["detail"]
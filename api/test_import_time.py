@@ -0,0 +1,65 @@
+# api/test_import_time.py
+"""
+Presupuesto de tiempo de importación de la API (arranque en frío de cada réplica).
+Importa api/main.py en un proceso nuevo con `python -X importtime` y comprueba
+que no carga el stack del ETL y que no supera el presupuesto.
+
+    python api/test_import_time.py
+"""
+import os
+import subprocess
+import sys
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Presupuesto en ms (configurable porque depende de la máquina)
+PRESUPUESTO_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", 1000))
+
+# Módulos que solo necesita el ETL y que la API no debe importar al arrancar
+PROHIBIDOS = {"pandas", "numpy", "etl", "extractor", "transformacion", "carga"}
+
+
+def medir_importacion(modulo: str = "main"):
+    """Devuelve (ms acumulados de la importación, módulos importados)"""
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=API_DIR, capture_output=True, text=True, check=True
+    )
+
+    total_us, modulos = None, set()
+    for linea in resultado.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, acumulado, nombre = linea.split("|")
+        if not acumulado.strip().isdigit():
+            continue  # cabecera
+        paquete = nombre.strip()
+        modulos.add(paquete)
+        if nombre == f" {modulo}":
+            total_us = int(acumulado)
+    return total_us / 1000, modulos
+
+
+def verificar_importacion() -> float:
+    """Comprueba que la API arranca sin el ETL y dentro del presupuesto; devuelve los ms"""
+    total_ms, modulos = medir_importacion()
+
+    cargados = {m for m in modulos if m.split(".")[0] in PROHIBIDOS}
+    assert not cargados, f"La API importa módulos del ETL al arrancar: {sorted(cargados)}"
+    assert total_ms <= PRESUPUESTO_MS, f"Importar la API tarda {total_ms:.0f}ms (presupuesto {PRESUPUESTO_MS:.0f}ms)"
+    return total_ms
+
+
+def test_import_time():
+    verificar_importacion()
+
+
+if __name__ == "__main__":
+    print("⏱️ Midiendo el tiempo de importación de la API...\n")
+    try:
+        total_ms = verificar_importacion()
+        print(f"✅ api/main.py se importa en {total_ms:.0f}ms (presupuesto {PRESUPUESTO_MS:.0f}ms), sin el ETL")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
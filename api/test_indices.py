@@ -0,0 +1,110 @@
+# api/test_indices.py
+"""
+Pruebas de la búsqueda fuzzy por trigramas (api/indices.py): tolerancia a errores
+de escritura, filtros combinados con la similitud y orden de los resultados.
+
+    python -m pytest api/test_indices.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.benchmark_busqueda import CONSULTAS, generar_filas, recorrido_completo
+from api.indices import IndiceTrigramas, Indices, buscar_fuzzy
+
+LICENCIAS = [
+    {"id": 1, "departamento": "Antioquia", "municipio": "Medellín", "no_psico": 90, "psico": 20, "semillas": 10, "total": 120},
+    {"id": 2, "departamento": "Bogotá D.C.", "municipio": "Bogotá D.C.", "no_psico": 80, "psico": 15, "semillas": 5, "total": 100},
+    {"id": 3, "departamento": "Cundinamarca", "municipio": "Girardot", "no_psico": 30, "psico": 5, "semillas": 5, "total": 40},
+    {"id": 4, "departamento": "Cundinamarca", "municipio": "Fusagasugá", "no_psico": 20, "psico": 5, "semillas": 0, "total": 25},
+    {"id": 5, "departamento": "Antioquia", "municipio": "San Jerónimo", "no_psico": 10, "psico": 4, "semillas": 1, "total": 15},
+    {"id": 6, "departamento": "Santander", "municipio": "San Gil", "no_psico": 8, "psico": 3, "semillas": 1, "total": 12},
+    {"id": 7, "departamento": "Antioquia", "municipio": "Santa Fe de Antioquia", "no_psico": 5, "psico": 2, "semillas": 1, "total": 8},
+    {"id": 8, "departamento": "Huila", "municipio": "Pitalito", "no_psico": 3, "psico": 1, "semillas": 0, "total": 4},
+]
+
+
+@pytest.fixture(scope="module")
+def indice():
+    return IndiceTrigramas(LICENCIAS)
+
+
+@pytest.mark.parametrize("q, municipio", [
+    ("Medelin", "Medellín"),
+    ("medellin", "Medellín"),
+    ("bogta", "Bogotá D.C."),
+    ("Girardto", "Girardot"),
+    ("fusagasuga", "Fusagasugá"),
+])
+def test_tolera_errores_de_escritura_y_tildes(indice, q, municipio):
+    resultados = indice.buscar(q)
+
+    assert resultados and resultados[0]["municipio"] == municipio
+
+
+def test_departamento_con_error_devuelve_todos_sus_municipios(indice):
+    resultados = indice.buscar("Cundinamrca")
+
+    assert {r["municipio"] for r in resultados} == {"Girardot", "Fusagasugá"}
+
+
+def test_coincidencia_exacta_primero_y_orden_por_similitud(indice):
+    resultados = indice.buscar("Medellín")
+    assert resultados[0]["municipio"] == "Medellín" and resultados[0]["similitud"] == 1.0
+
+    # De mayor a menor similitud; a igual similitud, de mayor a menor total
+    resultados = indice.buscar("san", similitud_minima=0.1)
+    assert len(resultados) > 2
+    claves = [(-r["similitud"], -r["total"]) for r in resultados]
+    assert claves == sorted(claves)
+
+
+def test_filtros_combinados_con_la_similitud(indice):
+    todos = indice.buscar("san", similitud_minima=0.1)
+    assert {"Antioquia", "Santander"} <= {r["departamento"] for r in todos}
+
+    antioquia = indice.buscar("san", departamento="Antioquia", similitud_minima=0.1)
+    assert antioquia and all(r["departamento"] == "Antioquia" for r in antioquia)
+    assert [r["id"] for r in antioquia] == [r["id"] for r in todos if r["departamento"] == "Antioquia"]
+
+    acotados = indice.buscar("san", min_total=10, max_total=14, similitud_minima=0.1)
+    assert [r["municipio"] for r in acotados] == ["San Gil"]
+
+    assert indice.buscar("Medelin", departamento="Huila") == []
+
+
+def test_sin_parecido_o_consulta_vacia(indice):
+    assert indice.buscar("zzzz") == []
+    assert indice.buscar("   ") == []
+
+
+def test_buscar_fuzzy_pagina_filtra_por_municipio_y_proyecta():
+    indices = Indices("prueba", LICENCIAS)
+
+    pagina = buscar_fuzzy(indices, "san", similitud_minima=0.1, skip=1, limit=2)
+    completa = indices.trigramas.buscar("san", similitud_minima=0.1)
+    assert pagina["total"] == len(completa) and pagina["pagina"] == 1 and pagina["por_pagina"] == 2
+    assert [r["id"] for r in pagina["resultados"]] == [r["id"] for r in completa[1:3]]
+
+    municipio = buscar_fuzzy(indices, "San Gil", municipio="San Gil", campos=["municipio", "total"])
+    assert municipio["total"] == 1
+    assert municipio["resultados"] == [{"municipio": "San Gil", "total": 12, "similitud": 1.0}]
+
+    with pytest.raises(ValueError):
+        buscar_fuzzy(indices, "san", campos=["no_existe"])
+
+
+@pytest.mark.parametrize("q, filtros", CONSULTAS)
+def test_no_pierde_resultados_del_recorrido_completo(q, filtros):
+    # La poda por trigramas compartidos no descarta filas que el recorrido completo acepta
+    licencias = generar_filas(3000)
+    indice = IndiceTrigramas(licencias)
+
+    encontrados = {r["id"]: r["similitud"] for r in indice.buscar(q, similitud_minima=0.3, **filtros)}
+    esperados = recorrido_completo(licencias, q, minimo=0.3, **filtros)
+
+    for puntuacion, licencia in esperados:
+        assert encontrados.get(licencia["id"], 0) >= round(puntuacion, 3)
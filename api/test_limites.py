@@ -0,0 +1,161 @@
+# api/test_limites.py
+"""
+Pruebas de los límites de carga (api/limites.py) y de su uso en el middleware.
+
+    python -m pytest api/test_limites.py
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import main
+from api.config import settings
+from api.limites import AlmacenMemoria, ControlAdmision, LimitadorTokens, Saturado, segundos_reintento
+
+
+def _peticion(query: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/licencias", "headers": [],
+                    "query_string": query.encode()})
+
+
+def test_rafaga_agotada_y_espera():
+    limitador = LimitadorTokens(AlmacenMemoria(), tasa=1, capacidad=3)
+
+    resultados = [asyncio.run(limitador.permitir("ip:1")) for _ in range(4)]
+
+    assert [permitido for permitido, _ in resultados] == [True, True, True, False]
+    espera = resultados[-1][1]
+    assert 0 < espera <= 1
+    assert segundos_reintento(espera) == "1"
+
+
+def test_buckets_independientes_por_clave():
+    limitador = LimitadorTokens(AlmacenMemoria(), tasa=1, capacidad=1)
+
+    assert asyncio.run(limitador.permitir("ip:1"))[0]
+    assert not asyncio.run(limitador.permitir("ip:1"))[0]
+    assert asyncio.run(limitador.permitir("ip:2"))[0]
+
+
+def test_purga_respeta_la_recarga_de_cada_bucket():
+    # IPs que se recargan en 20 ms y un bucket del ETL (1 por minuto) en el mismo almacén
+    almacen = AlmacenMemoria(max_claves=10)
+    limite_ip = LimitadorTokens(almacen, tasa=100, capacidad=2)
+    limite_etl = LimitadorTokens(almacen, tasa=1 / 60, capacidad=1)
+
+    async def escenario():
+        assert (await limite_etl.permitir("etl:clave"))[0]
+        await asyncio.sleep(0.05)
+        # Muchas IPs distintas llenan el almacén y fuerzan purgas
+        for i in range(50):
+            await limite_ip.permitir(f"ip:{i}")
+        # El bucket del ETL sigue gastado: la purga no lo reinició
+        return await limite_etl.permitir("etl:clave")
+
+    permitido, espera = asyncio.run(escenario())
+    assert not permitido and espera > 50
+
+
+def test_costo_de_paginacion_profunda():
+    assert main._costo_peticion(_peticion("")) == 1
+    assert main._costo_peticion(_peticion("skip=abc")) == 1
+    assert main._costo_peticion(_peticion(f"skip={settings.RATE_LIMIT_OFFSET_COST * 3}")) == 4
+
+    # Una página profunda consume la ráfaga entera (el costo se acota a la capacidad)
+    limitador = LimitadorTokens(AlmacenMemoria(), tasa=1, capacidad=4)
+    assert asyncio.run(limitador.permitir("ip:1", costo=10))[0]
+    assert not asyncio.run(limitador.permitir("ip:1", costo=1))[0]
+
+
+def test_control_admision_rechaza_cola_llena_y_espera_vencida():
+    async def escenario():
+        admision = ControlAdmision(max_concurrentes=1, max_cola=1, espera=0.05)
+        liberar = asyncio.Event()
+
+        async def ocupar():
+            async with admision:
+                await liberar.wait()
+
+        ocupante = asyncio.create_task(ocupar())
+        await asyncio.sleep(0)
+
+        async def entrar():
+            async with admision:
+                return "admitida"
+
+        en_cola = asyncio.create_task(entrar())
+        await asyncio.sleep(0)
+        assert admision.en_cola == 1
+
+        # Cola llena: rechazo inmediato
+        with pytest.raises(Saturado):
+            await entrar()
+        # La que esperaba en cola vence su plazo
+        with pytest.raises(Saturado):
+            await en_cola
+        assert admision.rechazadas == 2
+
+        liberar.set()
+        await ocupante
+        assert await entrar() == "admitida"
+        assert admision.en_curso == 0 and admision.en_cola == 0
+
+    asyncio.run(escenario())
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    # Buckets pequeños y sin control de admisión para que las pruebas sean rápidas
+    almacen = AlmacenMemoria()
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_REQUESTS", 0)
+    monkeypatch.setattr(main, "limite_ip", LimitadorTokens(almacen, 0.001, 2))
+    monkeypatch.setattr(main, "limite_api_key", LimitadorTokens(almacen, 0.001, 2))
+    monkeypatch.setattr(main, "limite_servicio", LimitadorTokens(almacen, 0.001, 20))
+    return TestClient(main.app)
+
+
+def test_middleware_responde_429_con_retry_after(cliente):
+    codigos = [cliente.get("/no-existe").status_code for _ in range(3)]
+
+    assert codigos == [404, 404, 429]
+    assert int(cliente.get("/no-existe").headers["Retry-After"]) >= 1
+
+
+def test_rutas_de_salud_sin_limite(cliente):
+    assert all(cliente.get("/").status_code == 200 for _ in range(10))
+
+
+def test_clave_del_servicio_usa_su_propio_bucket(cliente):
+    # La IP ya agotó su ráfaga: la clave del servicio no depende de ella
+    for _ in range(3):
+        cliente.get("/no-existe")
+    servicio = {"X-API-Key": settings.API_KEY}
+    assert all(cliente.get("/no-existe", headers=servicio).status_code == 404 for _ in range(10))
+
+    # Una clave desconocida sigue sujeta al límite por IP
+    assert cliente.get("/no-existe", headers={"X-API-Key": "otra"}).status_code == 429
+
+
+@pytest.mark.parametrize("max_cola", [0, 1])
+def test_middleware_responde_503_con_la_admision_llena(monkeypatch, max_cola):
+    # Sin plazas libres: con la cola llena se rechaza al llegar; en la cola, al vencer la espera
+    admision = ControlAdmision(max_concurrentes=0, max_cola=max_cola, espera=0.05)
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_REQUESTS", 1)
+    monkeypatch.setattr(main, "admision", admision)
+    cliente = TestClient(main.app)
+
+    respuesta = cliente.get("/no-existe")
+
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "1"
+    assert admision.rechazadas == 1 and admision.en_cola == 0
+    # Las rutas de salud no pasan por el control de admisión
+    assert cliente.get("/").status_code == 200
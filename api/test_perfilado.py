@@ -0,0 +1,112 @@
+# api/test_perfilado.py
+"""
+Pruebas del perfilado bajo demanda (api/perfilado.py).
+
+    python -m pytest api/test_perfilado.py
+"""
+import os
+import re
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.perfilado import MiddlewarePerfilado, Perfilador, clave_valida
+
+CLAVE = "clave-admin"
+
+
+def trabajo_perfilado():
+    return sum(i * i for i in range(20000))
+
+
+def test_salida_folded_de_una_peticion():
+    perfilador = Perfilador()
+    with perfilador.perfilar("pilas") as perfil:
+        trabajo_perfilado()
+
+    salida = perfil.salida("folded")
+    lineas = salida.splitlines()
+    assert lineas and all(re.fullmatch(r"\S.* \d+", linea) for linea in lineas)
+    # Las pilas van de la raíz a la hoja y contienen la función perfilada
+    assert any("test_perfilado:trabajo_perfilado" in linea.rsplit(" ", 1)[0].split(";") for linea in lineas)
+    assert perfilador.obtener(perfil.id) is perfil
+    with pytest.raises(ValueError):
+        perfil.salida("texto")
+
+
+def test_clave_valida():
+    assert clave_valida(CLAVE, CLAVE)
+    assert not clave_valida("otra", CLAVE)
+    assert not clave_valida(None, CLAVE)
+    # Sin clave configurada nada es válido, ni siquiera la cadena vacía
+    assert not clave_valida("", "")
+
+
+def test_sesion_termina_al_alcanzar_las_peticiones():
+    perfilador = Perfilador()
+    perfil = perfilador.iniciar("cprofile", peticiones=2)
+
+    for _ in range(2):
+        sesion = perfilador.antes_peticion()
+        trabajo_perfilado()
+        perfilador.despues_peticion(sesion)
+
+    assert perfilador.sesion is None
+    assert perfil.peticiones == 2
+    assert "trabajo_perfilado" in perfil.salida("texto")
+
+
+def test_temporizador_solo_detiene_su_sesion():
+    perfilador = Perfilador()
+    primera = perfilador.iniciar("muestreo", peticiones=1)
+    temporizador = perfilador._temporizador
+    perfilador.despues_peticion(perfilador.antes_peticion())
+    assert perfilador.sesion is None and primera.peticiones == 1
+
+    # Aunque el temporizador de la primera sesión se dispare tarde, no termina la segunda
+    segunda = perfilador.iniciar("muestreo", segundos=60)
+    temporizador.function()
+    assert perfilador.sesion is segunda
+
+    assert perfilador.detener() is segunda
+    assert perfilador._temporizador is None
+
+
+def test_solo_un_perfil_de_peticion_a_la_vez():
+    perfilador = Perfilador()
+    with perfilador.perfilar("pilas"):
+        with pytest.raises(RuntimeError):
+            perfilador.comenzar_peticion("pilas")
+        with pytest.raises(RuntimeError):
+            perfilador.iniciar("cprofile")
+    # Al terminar se admite otro
+    with perfilador.perfilar("pilas"):
+        pass
+
+
+def test_middleware_x_profile():
+    perfilador = Perfilador()
+    app = FastAPI()
+    app.add_middleware(MiddlewarePerfilado, perfilador=perfilador, clave_admin=CLAVE)
+
+    @app.get("/trabajo")
+    def trabajo():
+        return {"total": trabajo_perfilado()}
+
+    cliente = TestClient(app)
+    assert "x-profile-id" not in cliente.get("/trabajo", headers={"X-Profile": "incorrecta"}).headers
+
+    respuesta = cliente.get("/trabajo", headers={"X-Profile": CLAVE})
+    assert respuesta.status_code == 200
+    assert perfilador.obtener(respuesta.headers["x-profile-id"]) is not None
+
+    # Con otro perfil de petición en curso: 409 sin atender la petición
+    en_curso = perfilador.comenzar_peticion("pilas")
+    try:
+        assert cliente.get("/trabajo", headers={"X-Profile": CLAVE}).status_code == 409
+    finally:
+        perfilador.terminar_peticion(en_curso)
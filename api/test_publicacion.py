@@ -0,0 +1,162 @@
+# api/test_publicacion.py
+"""
+Pruebas de la publicación de datos: artefacto inmutable con manifest
+(etl/publicacion.py) y su lectura en la API (consultas.artefacto_actual),
+código de salida del ETL y respuesta de /actualizar-datos.
+
+    python -m pytest api/test_publicacion.py
+"""
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import consultas, main
+from api.config import settings
+from etl import main as etl_main
+from etl.publicacion import MANIFEST, CannabisDataPublisher
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    """Base de datos del ETL y directorio de artefactos temporales, sin manifest leído"""
+    db_path = str(tmp_path / "licencias.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE licencias (id INTEGER PRIMARY KEY, departamento TEXT, municipio TEXT,
+                    no_psico INTEGER, psico INTEGER, semillas INTEGER, total INTEGER)""")
+    conn.execute("INSERT INTO licencias (departamento, municipio, no_psico, psico, semillas, total) "
+                 "VALUES ('Huila', 'Neiva', 5, 5, 0, 10)")
+    conn.commit()
+    conn.close()
+
+    artefactos = tmp_path / "artefactos"
+    monkeypatch.setattr(consultas, "DATABASE_URL", db_path)
+    monkeypatch.setattr(consultas, "ARTIFACT_DIR", str(artefactos))
+    monkeypatch.setattr(consultas, "_artefacto", None)
+    return db_path, CannabisDataPublisher(str(artefactos))
+
+
+def _contar(conn) -> int:
+    try:
+        return conn.execute("SELECT COUNT(*) FROM licencias").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_publicar_cambia_la_version_servida(base):
+    db_path, publicador = base
+    assert consultas.fuente_datos()["fuente"] == "base_de_datos"
+
+    manifest = publicador.publish(db_path)
+    assert consultas.obtener_version_datos() == manifest["version"]
+    assert consultas.fuente_datos()["fuente"] == "artefacto"
+    assert manifest["registros"] == _contar(consultas.get_db_connection()) == 1
+
+    # Nuevos datos: otra publicación cambia el manifest y con él la versión
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO licencias (departamento, municipio, no_psico, psico, semillas, total) "
+                 "VALUES ('Huila', 'Pitalito', 2, 1, 1, 4)")
+    conn.commit()
+    conn.close()
+    nuevo = publicador.publish(db_path)
+
+    assert nuevo["version"] != manifest["version"]
+    assert consultas.obtener_version_datos() == nuevo["version"]
+    assert _contar(consultas.get_db_connection()) == 2
+
+    # El mismo contenido da la misma versión
+    assert publicador.publish(db_path)["version"] == nuevo["version"]
+
+
+def test_checksum_corrupto_se_rechaza(base):
+    db_path, publicador = base
+    manifest = publicador.publish(db_path)
+    assert consultas.obtener_version_datos() == manifest["version"]
+
+    # Manifest con un checksum que no corresponde al archivo: se sigue con el anterior
+    ruta_manifest = os.path.join(publicador.artifact_dir, MANIFEST)
+    with open(ruta_manifest, "w", encoding="utf-8") as archivo:
+        json.dump({**manifest, "version": "corrupta", "sha256": "0" * 64}, archivo)
+
+    assert consultas._cargar_artefacto(ruta_manifest) is None
+    assert consultas.obtener_version_datos() == manifest["version"]
+
+
+def test_sin_artefacto_valido_no_se_sirve_ninguno(base):
+    _, publicador = base
+    os.makedirs(publicador.artifact_dir, exist_ok=True)
+    with open(os.path.join(publicador.artifact_dir, MANIFEST), "w", encoding="utf-8") as archivo:
+        json.dump({"version": "x", "archivo": "no-existe.db", "sha256": "0" * 64}, archivo)
+
+    assert consultas.artefacto_actual() is None
+    assert consultas.fuente_datos()["fuente"] == "base_de_datos"
+
+
+class _Paso:
+    """Extractor, transformador y cargador del ETL sin red ni base de datos"""
+    db_path = "sin-base.db"
+
+    def extract_data(self):
+        return []
+
+    def transform_data(self, datos):
+        return datos
+
+    def create_database(self):
+        pass
+
+    def load_data(self, datos):
+        pass
+
+    def verify_data(self):
+        return True
+
+
+@pytest.fixture
+def etl_sin_red(monkeypatch):
+    for clase in ("CannabisDataExtractor", "CannabisDataTransformer", "CannabisDataLoader"):
+        monkeypatch.setattr(etl_main, clase, _Paso)
+
+
+def test_etl_sin_publicar_tiene_su_codigo_de_salida(etl_sin_red, monkeypatch):
+    monkeypatch.setattr(etl_main, "publicar", lambda db_path: False)
+    assert etl_main.run_etl_pipeline() == etl_main.SIN_PUBLICAR == main.ETL_SIN_PUBLICAR
+
+    monkeypatch.setattr(etl_main, "publicar", lambda db_path: True)
+    assert etl_main.run_etl_pipeline() == etl_main.EXITO
+
+
+@pytest.mark.parametrize("codigo, status_code, estado", [
+    (0, 200, "success"),
+    (main.ETL_SIN_PUBLICAR, 503, "partial"),
+])
+def test_actualizar_datos_segun_el_codigo_del_etl(monkeypatch, codigo, status_code, estado):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_REQUESTS", 0)
+
+    async def run_etl_worker():
+        return codigo
+
+    monkeypatch.setattr(main, "run_etl_worker", run_etl_worker)
+    respuesta = TestClient(main.app).post("/actualizar-datos", headers={"X-API-Key": settings.API_KEY})
+
+    assert respuesta.status_code == status_code
+    assert respuesta.json()["status"] == estado
+
+
+def test_actualizar_datos_con_error_del_etl(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_REQUESTS", 0)
+
+    async def run_etl_worker():
+        return etl_main.ERROR
+
+    monkeypatch.setattr(main, "run_etl_worker", run_etl_worker)
+    respuesta = TestClient(main.app).post("/actualizar-datos", headers={"X-API-Key": settings.API_KEY})
+
+    assert respuesta.status_code == 500
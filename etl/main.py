@@ -8,6 +8,7 @@ sys.path.append(os.path.dirname(__file__))
 from extractor import CannabisDataExtractor
 from transformacion import CannabisDataTransformer
 from carga import CannabisDataLoader
+from publicacion import CannabisDataPublisher
 
 # Configurar logging
 logging.basicConfig(
@@ -17,9 +18,24 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def run_etl_pipeline():
+# Códigos de salida (los interpreta /actualizar-datos en api/main.py)
+EXITO = 0
+ERROR = 1
+SIN_PUBLICAR = 2  # Datos cargados, pero la API sigue sirviendo el artefacto anterior
+
+def publicar(db_path: str, intentos: int = 2) -> bool:
+    """Publica el artefacto reintentando si falla; False si no se pudo publicar"""
+    for intento in range(1, intentos + 1):
+        try:
+            CannabisDataPublisher().publish(db_path)
+            return True
+        except Exception as e:
+            logger.error(f"Error publicando el artefacto (intento {intento}/{intentos}): {e}")
+    return False
+
+def run_etl_pipeline() -> int:
     """
-    Ejecuta el pipeline completo ETL
+    Ejecuta el pipeline completo ETL; devuelve EXITO, ERROR o SIN_PUBLICAR
     """
     try:
         logger.info("Iniciando pipeline ETL...")
@@ -40,16 +56,24 @@ def run_etl_pipeline():
         # Verificación
         success = loader.verify_data()
         
-        if success:
-            logger.info("Pipeline ETL completado exitosamente!")
-            return True
-        else:
+        if not success:
             logger.error("Pipeline ETL completado con errores")
-            return False
+            return ERROR
+        
+        # Publicación del artefacto inmutable que leen las réplicas de la API. Los datos ya
+        # están cargados: si no se puede publicar se indica con su propio código de salida
+        if not publicar(loader.db_path):
+            logger.warning("Pipeline ETL completado parcialmente: datos cargados pero no publicados; "
+                           "la API sigue sirviendo el artefacto anterior hasta ejecutar etl/publicacion.py")
+            return SIN_PUBLICAR
+        
+        logger.info("Pipeline ETL completado exitosamente!")
+        return EXITO
             
     except Exception as e:
         logger.error(f"Error en el pipeline ETL: {e}")
-        return False
+        return ERROR
 
 if __name__ == "__main__":
-    run_etl_pipeline()
\ No newline at end of file
+    # El código de salida indica el resultado a quien lo ejecuta (p. ej. la API)
+    sys.exit(run_etl_pipeline())
\ No newline at end of file
@@ -0,0 +1,115 @@
+# etl/publicacion.py
+"""
+Publica la base de datos cargada por el ETL como un artefacto inmutable:
+una copia compactada (VACUUM) y con estadísticas del planificador (ANALYZE),
+nombrada por su checksum, más un manifest.json con la versión. Las réplicas
+de la API la abren en solo lectura (immutable=1) y cambian de versión cuando
+cambia el manifest, sin ejecutar el ETL.
+
+    python etl/publicacion.py            # publica cannabis_licencias.db
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACT_DIR = os.getenv("DB_ARTIFACT_DIR", os.path.join(RAIZ_PROYECTO, "artefactos"))
+MANIFEST = "manifest.json"
+
+
+def sha256_archivo(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class CannabisDataPublisher:
+    def __init__(self, artifact_dir: str = ARTIFACT_DIR, conservar: int = 3):
+        self.artifact_dir = os.path.abspath(artifact_dir)
+        # Artefactos anteriores que se conservan (réplicas que aún no cambiaron de versión)
+        self.conservar = conservar
+        os.makedirs(self.artifact_dir, exist_ok=True)
+
+    def publish(self, db_path: str) -> Dict[str, Any]:
+        """Publica `db_path` como artefacto y actualiza el manifest; devuelve el manifest"""
+        temporal = os.path.join(self.artifact_dir, f".publicando-{os.getpid()}.db")
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+        try:
+            # VACUUM INTO escribe una copia compacta y consistente sin tocar el original
+            with sqlite3.connect(db_path) as origen:
+                origen.execute("VACUUM INTO ?", (temporal,))
+
+            conn = sqlite3.connect(temporal)
+            try:
+                conn.execute("ANALYZE")
+                conn.execute("PRAGMA journal_mode = DELETE")
+                if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                    raise sqlite3.DatabaseError("El artefacto no supera integrity_check")
+                registros = conn.execute("SELECT COUNT(*) FROM licencias").fetchone()[0]
+                conn.commit()
+            finally:
+                conn.close()
+
+            checksum = sha256_archivo(temporal)
+            archivo = f"licencias-{checksum[:16]}.db"
+            destino = os.path.join(self.artifact_dir, archivo)
+            if os.path.exists(destino):
+                os.remove(temporal)  # Mismo contenido ya publicado
+            else:
+                os.chmod(temporal, 0o444)
+                os.replace(temporal, destino)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+        manifest = {
+            "version": checksum[:16],
+            "archivo": archivo,
+            "sha256": checksum,
+            "bytes": os.path.getsize(destino),
+            "registros": registros,
+            "sqlite_version": sqlite3.sqlite_version,
+            "publicado": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        self._escribir_manifest(manifest)
+        self._limpiar(archivo)
+        logger.info(f"Artefacto publicado: {archivo} ({registros} registros, {manifest['bytes']} bytes)")
+        return manifest
+
+    def _escribir_manifest(self, manifest: Dict[str, Any]):
+        # Escritura atómica: las réplicas nunca leen un manifest a medias
+        ruta = os.path.join(self.artifact_dir, MANIFEST)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(manifest, archivo, indent=2)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(temporal, ruta)
+
+    def _limpiar(self, actual: str):
+        """Borra los artefactos más antiguos, conservando el actual y los `conservar` anteriores"""
+        anteriores = sorted(
+            (nombre for nombre in os.listdir(self.artifact_dir)
+             if nombre.startswith("licencias-") and nombre.endswith(".db") and nombre != actual),
+            key=lambda nombre: os.path.getmtime(os.path.join(self.artifact_dir, nombre)),
+            reverse=True,
+        )
+        for nombre in anteriores[self.conservar:]:
+            os.remove(os.path.join(self.artifact_dir, nombre))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "cannabis_licencias.db"
+    print(json.dumps(CannabisDataPublisher().publish(db_path), indent=2))